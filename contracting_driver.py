@@ -0,0 +1,18 @@
+import functools
+import os
+
+from contracting.db.driver import ContractDriver, Driver
+
+# pytest-xdist runs every worker in its own process, but all of them would share the default
+# ContractingClient() Mongo collection (lamden.state), and client.flush() drops it for everyone.
+# Test suites build their clients with ContractingClient(driver=worker_driver()), so each worker gets a
+# collection of its own, state_<worker>: python -m pytest -n auto. Serial runs keep using lamden.state.
+def worker_collection():
+    worker = os.environ.get('PYTEST_XDIST_WORKER')
+    return 'state' if worker is None else 'state_{}'.format(worker)
+
+
+# One driver per process, shared by every client - like ContractingClient's default driver
+@functools.lru_cache(maxsize=None)
+def worker_driver():
+    return ContractDriver(driver=Driver(collection=worker_collection()))
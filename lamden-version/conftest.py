@@ -0,0 +1,5 @@
+import os
+import sys
+
+# contracting_driver.py is shared with uniswap-implementation/tests, it lives in the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
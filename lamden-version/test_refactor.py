@@ -1,6 +1,8 @@
 from unittest import TestCase
 from contracting.client import ContractingClient
 
+from contracting_driver import worker_driver
+
 
 def bad_token():
     @export
@@ -24,7 +26,6 @@ def dex():
     ]
 
     pairs = Hash()
-    prices = Hash(default_value=0)
 
     lp_points = Hash(default_value=0)
     reserves = Hash(default_value=[0, 0])
@@ -43,8 +44,6 @@ def dex():
         currency.transfer_from(amount=currency_amount, to=ctx.this, main_account=ctx.caller)
         token.transfer_from(amount=token_amount, to=ctx.this, main_account=ctx.caller)
 
-        prices[contract] = currency_amount / token_amount
-
         pairs[contract] = True
 
         # Mint 100 liquidity points
@@ -57,6 +56,18 @@ def dex():
     def liquidity_balance_of(contract: str, account: str):
         return lp_points[contract, account]
 
+    # Price of one token in currency, derived from the reserves instead of stored on every trade.
+    # Converted like a Hash write would, reserve values inside the list can come back as plain Decimals
+    def current_price(contract):
+        currency_reserve, token_reserve = reserves[contract]
+        return decimal(str(currency_reserve / token_reserve))
+
+    # Markets created while prices[] was still written need no migration, reserves were always kept up to date
+    @export
+    def price_of(contract: str):
+        assert pairs[contract] is not None, 'Market does not exist!'
+        return current_price(contract)
+
     @export
     def add_liquidity(contract: str, currency_amount: float=0):
         assert pairs[contract] is True, 'Market does not exist!'
@@ -68,7 +79,7 @@ def dex():
         assert I.enforce_interface(token, token_interface), 'Invalid token interface!'
 
         # Determine the number of tokens required
-        token_amount = currency_amount / prices[contract]
+        token_amount = currency_amount / current_price(contract)
 
         # Transfer both tokens
         currency.transfer_from(amount=currency_amount, to=ctx.this, main_account=ctx.caller)
@@ -177,7 +188,6 @@ def dex():
         token.transfer(amount=tokens_purchased, to=ctx.caller)
 
         reserves[contract] = [new_currency_reserve, new_token_reserve]
-        prices[contract] = new_currency_reserve / new_token_reserve
 
     # Sell takes fee from crypto being transferred out
     @export
@@ -209,12 +219,11 @@ def dex():
         currency.transfer(amount=currency_purchased, to=ctx.caller)
 
         reserves[contract] = [new_currency_reserve, new_token_reserve]
-        prices[contract] = new_currency_reserve / new_token_reserve
 
 
 class MyTestCase(TestCase):
     def setUp(self):
-        self.client = ContractingClient()
+        self.client = ContractingClient(driver=worker_driver())
         self.client.flush()
 
         with open('currency.c.py') as f:
@@ -521,7 +530,7 @@ class MyTestCase(TestCase):
 
         self.dex.create_market(contract='con_token1', currency_amount=100, token_amount=1000, signer='stu')
 
-        self.assertEquals(self.dex.prices['con_token1'], 0.1)
+        self.assertEquals(self.dex.price_of(contract='con_token1'), 0.1)
 
         self.dex.buy(contract='con_token1', currency_amount=10, signer='stu')
 
@@ -532,7 +541,7 @@ class MyTestCase(TestCase):
 
         actual_price = expected_price / (1 + (fee / amount))
 
-        self.assertAlmostEqual(self.dex.prices['con_token1'], actual_price)
+        self.assertAlmostEqual(self.dex.price_of(contract='con_token1'), actual_price)
 
     def test_buy_sell_updates_price_to_original(self):
         self.currency.transfer(amount=110, to='stu')
@@ -560,7 +569,7 @@ class MyTestCase(TestCase):
 
         price_impact = 0.3 / (100 * 10)
 
-        self.assertAlmostEqual(self.dex.prices['con_token1'], 0.1 * (1 + price_impact * 2))
+        self.assertAlmostEqual(self.dex.price_of(contract='con_token1'), 0.1 * (1 + price_impact * 2))
 
     def test_buy_updates_reserves(self):
         self.currency.transfer(amount=110, to='stu')
@@ -610,11 +619,11 @@ class MyTestCase(TestCase):
 
         self.dex.create_market(contract='con_token1', currency_amount=100, token_amount=1000, signer='stu')
 
-        self.assertEquals(self.dex.prices['con_token1'], 0.1)
+        self.assertEquals(self.dex.price_of(contract='con_token1'), 0.1)
 
         self.dex.sell(contract='con_token1', token_amount=10, signer='stu')
 
-        print(0.098029604940692 / self.dex.prices['con_token1'])
+        print(0.098029604940692 / self.dex.price_of(contract='con_token1'))
 
         # Because of fees, the amount left in the reserves differs
         expected_price = 0.098029604940692
@@ -623,7 +632,7 @@ class MyTestCase(TestCase):
 
         actual_price = expected_price / (1 - (fee / amount))
 
-        self.assertAlmostEqual(self.dex.prices['con_token1'], actual_price)
+        self.assertAlmostEqual(self.dex.price_of(contract='con_token1'), actual_price)
 
     def test_sell_updates_reserves(self):
         self.currency.transfer(amount=100, to='stu')
@@ -724,7 +733,42 @@ class MyTestCase(TestCase):
 
         self.dex.create_market(contract='con_token1', currency_amount=100, token_amount=1000)
 
-        self.assertEqual(self.dex.prices['con_token1'], 0.1)
+        self.assertEqual(self.dex.price_of(contract='con_token1'), 0.1)
+
+    def test_price_of_fails_if_no_market(self):
+        with self.assertRaises(AssertionError):
+            self.dex.price_of(contract='con_token1')
+
+    def test_buy_sell_do_not_store_price(self):
+        self.currency.approve(amount=1100, to='dex')
+        self.token1.approve(amount=1100, to='dex')
+
+        self.dex.create_market(contract='con_token1', currency_amount=100, token_amount=1000)
+        self.dex.buy(contract='con_token1', currency_amount=10)
+        self.dex.sell(contract='con_token1', token_amount=10)
+
+        self.assertEqual(self.client.raw_driver.get_var('dex', 'prices', ['con_token1']), None)
+
+    def test_add_liquidity_on_market_created_with_stored_price(self):
+        self.currency.approve(amount=1000, to='dex')
+        self.token1.approve(amount=1000, to='dex')
+
+        # Market state as left by a dex that still wrote prices[], with a stale price
+        self.client.raw_driver.set_var('dex', 'pairs', ['con_token1'], value=True)
+        self.client.raw_driver.set_var('dex', 'lp_points', ['con_token1'], value=100)
+        self.client.raw_driver.set_var('dex', 'lp_points', ['con_token1', 'sys'], value=100)
+        self.client.raw_driver.set_var('dex', 'reserves', ['con_token1'], value=[100, 1000])
+        self.client.raw_driver.set_var('dex', 'prices', ['con_token1'], value=0.5)
+
+        self.currency.transfer(amount=100, to='dex')
+        self.token1.transfer(amount=1000, to='dex')
+
+        self.assertEqual(self.dex.price_of(contract='con_token1'), 0.1)
+
+        self.dex.add_liquidity(contract='con_token1', currency_amount=50)
+
+        self.assertEqual(self.dex.reserves['con_token1'], [150, 1500])
+        self.assertEqual(self.dex.lp_points['con_token1'], 150)
 
     def test_create_market_sets_pair_to_true(self):
         self.currency.approve(amount=1000, to='dex')
@@ -821,7 +865,7 @@ class MyTestCase(TestCase):
 
         self.dex.create_market(contract='con_token1', currency_amount=100, token_amount=1000, signer='stu')
 
-        self.assertEquals(self.dex.prices['con_token1'], 0.1)
+        self.assertEquals(self.dex.price_of(contract='con_token1'), 0.1)
 
         self.dex.buy(contract='con_token1', currency_amount=10, signer='stu')
 
@@ -845,7 +889,7 @@ class MyTestCase(TestCase):
 
         self.dex.create_market(contract='con_token1', currency_amount=100, token_amount=1000, signer='stu')
 
-        self.assertEquals(self.dex.prices['con_token1'], 0.1)
+        self.assertEquals(self.dex.price_of(contract='con_token1'), 0.1)
 
         self.dex.sell(contract='con_token1', token_amount=100, signer='stu')
 
@@ -0,0 +1,195 @@
+# Contract benchmarks - dex_pairs.mint_liquidity / burn_liquidity / swap and dex.create_pair,
+# executed through ContractingClient's executor exactly like a node would (metered, committed per tx).
+#
+# Needs pytest-benchmark. Run from this directory:
+#   python -m pytest bench_dex_pairs.py --benchmark-json=results.json
+# and compare two result files with: pytest-benchmark compare old.json new.json
+#
+# State size is swept over existing pairs x LP holders of the benchmarked pair. Defaults keep a run short,
+# the full sweep is:
+#   BENCH_PAIRS=1,100,10000 BENCH_HOLDERS=1,1000,100000 python -m pytest bench_dex_pairs.py ...
+# Filler pairs and holders are written straight into the state store, with the same keys initialize()
+# (pairs, all_pairs, pair_index) and mint_lp_tokens() write, so only the operation under test goes through the executor.
+#
+# Next to pytest-benchmark's own stats (ops/sec, mean, ...) every result carries latency percentiles
+# in ms, stamps used per call and the state size in extra_info, all of which end up in the JSON.
+# BENCH_COUNTERS=1 adds per-call storage reads/writes/bytes and foreign calls (offchain/instrumentation.py),
+# at the cost of slower timings.
+import os
+
+import pytest
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.stdlib.bridge.time import Datetime
+
+from offchain.instrumentation import Instrumentation
+
+WALLET = 'wallet_address'
+STARTING_BALANCE = pow(10, 12)
+SEED_LIQUIDITY = pow(10, 6)
+NOW = Datetime(2030, 1, 1)
+ROUNDS = int(os.environ.get('BENCH_ROUNDS', 50))
+PERCENTILES = [50, 90, 99]
+COUNTERS = os.environ.get('BENCH_COUNTERS') == '1'
+
+
+def sweep(name, default):
+    return [int(n) for n in os.environ.get(name, default).split(',')]
+
+
+def submit(client, path, name, **constructor_args):
+    with open(path) as f:
+        client.submit(f.read(), name=name, constructor_args=constructor_args)
+
+
+def submit_token(client, name):
+    submit(client, '../basetoken.py', name, s_name=name, s_symbol=name.upper(), vk=WALLET, vk_amount=STARTING_BALANCE)
+
+
+# Single metered, committed transaction - returns the executor output (result, stamps_used, ...)
+def execute(client, contract, function, /, **kwargs):
+    output = client.executor.execute(
+        sender=WALLET,
+        contract_name=contract,
+        function_name=function,
+        kwargs=kwargs,
+        environment={'now': NOW},
+        auto_commit=True,
+        metering=True
+    )
+    assert output['status_code'] == 0, output['result']
+    return output
+
+
+def seed_pairs(client, count):
+    driver = client.raw_driver
+    for i in range(count):
+        token_contract = 'filler_{}'.format(i)
+        driver.set_var('dex_pairs', 'pairs', ['tau', token_contract], value=[100, 100, 100, 0, NOW, 0, 0], mark=False)
+        driver.set_var('dex_pairs', 'pairs', ['tau', token_contract, 'pair_address'], value=token_contract, mark=False)
+        driver.set_var('dex_pairs', 'all_pairs', [i + 1], value=['tau', token_contract], mark=False)
+        # pair_index is keyed by the two contracts in sorted order
+        driver.set_var('dex_pairs', 'pair_index', sorted(['tau', token_contract]), value=['tau', token_contract], mark=False)
+    driver.set_var('dex_pairs', 'pairs', ['count'], value=count + 1, mark=False)
+
+
+def seed_holders(client, count):
+    for i in range(count):
+        client.raw_driver.set_var('dex_pairs', 'pairs', ['tau', 'eth', 'lp_token_balance', 'holder_{}'.format(i)], value=1, mark=False)
+
+
+# Fresh deployment with one real tau/eth pair, plus filler pairs and LP holders
+@pytest.fixture(params=[(p, h) for p in sweep('BENCH_PAIRS', '1,100') for h in sweep('BENCH_HOLDERS', '1,1000')],
+                ids=lambda p: 'pairs={}-holders={}'.format(*p))
+def market(request):
+    pair_count, holder_count = request.param
+
+    client = ContractingClient(signer=WALLET)
+    client.flush()
+
+    submit(client, '../currency.py', 'tau', s_name='tau', s_symbol='TAU', vk=WALLET, vk_amount=STARTING_BALANCE)
+    submit_token(client, 'eth')
+    submit(client, '../dex.py', 'dex', fee_to_setter_address='fee_to_setter_address')
+    submit(client, '../dex_pairs.py', 'dex_pairs', owner_address='dex')
+
+    # Stamps are paid from the sender's balance in the 'currency' contract
+    client.raw_driver.set_var('currency', 'balances', [WALLET], value=STARTING_BALANCE, mark=False)
+
+    execute(client, 'dex', 'create_pair', dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth')
+    execute(client, 'tau', 'transfer', amount=SEED_LIQUIDITY, to='dex_pairs')
+    execute(client, 'eth', 'transfer', amount=SEED_LIQUIDITY, to='dex_pairs')
+    execute(client, 'dex_pairs', 'mint_liquidity', dex_contract='dex', tau_contract='tau', token_contract='eth', to_address=WALLET)
+
+    seed_pairs(client, pair_count - 1)
+    seed_holders(client, holder_count - 1)
+    client.raw_driver.commit()
+
+    counters = Instrumentation(client).install() if COUNTERS else None
+
+    yield client, pair_count, holder_count, counters
+
+    if counters is not None:
+        counters.uninstall()
+    client.flush()
+
+
+# Times `target` ROUNDS times, each after an untimed `setup`, and stores percentiles + stamps in extra_info
+# entry is the benchmarked `contract.function`, used to pick its storage counters
+def run(benchmark, market, entry, setup, target):
+    client, pair_count, holder_count, counters = market
+    stamps = []
+
+    def timed(*args):
+        stamps.append(target(client, *args)['stamps_used'])
+
+    def untimed():
+        return (setup(client),), {}
+
+    if counters is not None:
+        counters.reset()
+
+    benchmark.pedantic(timed, setup=untimed, rounds=ROUNDS, iterations=1)
+
+    data = sorted(benchmark.stats.stats.data)
+    for percentile in PERCENTILES:
+        index = min(len(data) - 1, (len(data) * percentile) // 100)
+        benchmark.extra_info['p{}_ms'.format(percentile)] = data[index] * 1000
+
+    benchmark.extra_info['stamps_mean'] = sum(stamps) / len(stamps)
+    benchmark.extra_info['stamps_max'] = max(stamps)
+    benchmark.extra_info['pairs'] = pair_count
+    benchmark.extra_info['holders'] = holder_count
+
+    if counters is not None:
+        benchmark.extra_info.update(counters.per_call(entry))
+
+
+def test_mint_liquidity(benchmark, market):
+    def deposit(client):
+        execute(client, 'tau', 'transfer', amount=10, to='dex_pairs')
+        execute(client, 'eth', 'transfer', amount=10, to='dex_pairs')
+
+    def mint(client, _):
+        return execute(client, 'dex_pairs', 'mint_liquidity', dex_contract='dex', tau_contract='tau', token_contract='eth', to_address=WALLET)
+
+    run(benchmark, market, 'dex_pairs.mint_liquidity', deposit, mint)
+
+
+def test_burn_liquidity(benchmark, market):
+    def return_lp_tokens(client):
+        execute(client, 'dex_pairs', 'transfer', tau_contract='tau', token_contract='eth', amount=10, to='dex_pairs')
+
+    def burn(client, _):
+        return execute(client, 'dex_pairs', 'burn_liquidity', dex_contract='dex', tau_contract='tau', token_contract='eth', to_address=WALLET)
+
+    run(benchmark, market, 'dex_pairs.burn_liquidity', return_lp_tokens, burn)
+
+
+def test_swap(benchmark, market):
+    amount_in = 10
+
+    # Deposit tau and quote the eth out with the 0.3% fee, slightly under so rounding never overdraws
+    def deposit(client):
+        tau_reserve, token_reserve = client.get_var('dex_pairs', 'pairs', ['tau', 'eth'])[:2]
+        execute(client, 'tau', 'transfer', amount=amount_in, to='dex_pairs')
+        amount_in_with_fee = ContractingDecimal(amount_in * 997)
+        return (amount_in_with_fee * token_reserve) / (tau_reserve * 1000 + amount_in_with_fee) * ContractingDecimal('0.999')
+
+    def swap(client, token_out):
+        return execute(client, 'dex_pairs', 'swap', tau_contract='tau', token_contract='eth', tau_out=0, token_out=token_out, to_address=WALLET)
+
+    run(benchmark, market, 'dex_pairs.swap', deposit, swap)
+
+
+def test_create_pair(benchmark, market):
+    tokens = iter(range(ROUNDS))
+
+    def deploy_token(client):
+        name = 'bench_token_{}'.format(next(tokens))
+        submit_token(client, name)
+        return name
+
+    def create_pair(client, token_contract):
+        return execute(client, 'dex', 'create_pair', dex_pairs='dex_pairs', tau_contract='tau', token_contract=token_contract)
+
+    run(benchmark, market, 'dex.create_pair', deploy_token, create_pair)
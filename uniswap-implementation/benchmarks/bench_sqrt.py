@@ -0,0 +1,100 @@
+# Micro-benchmark - dex_pairs.sqrt (integer newton) vs. the previous babylonian sqrt
+# Reports worst-case loop iterations and mean wall time per call for inputs 1e0 ... 1e36.
+# Inputs past 1e30 are clamped by ContractingDecimal, exactly as they are on-chain.
+# Run from this directory: python bench_sqrt.py [samples_per_magnitude]
+import ast
+import inspect
+import random
+import sys
+import textwrap
+import timeit
+
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+TOKEN_DECIMALS = 18
+MAGNITUDES = range(0, 37) # 1e0 ... 1e36
+
+
+# Previous dex_pairs.sqrt, kept here as the baseline
+def babylonian_sqrt(y) :
+    z = None
+    if (y > 3) :
+        z = y
+        x = y / 2 + 1
+        while (x < z):
+            z = x
+            x = (y / x + x) / 2
+    elif (y != 0) :
+        z = 1
+
+    return z * ContractingDecimal(1.0)
+
+
+# Pull the sqrt helpers straight out of the contract source, so the numbers are for the deployed code
+def load_contract_sqrt(path='../dex_pairs.py'):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    names = {'expand_to_sqrt_domain', 'isqrt', 'sqrt'}
+    module = ast.Module(body=[n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name in names], type_ignores=[])
+
+    scope = {'decimal': ContractingDecimal, 'TOKEN_DECIMALS': TOKEN_DECIMALS}
+    exec(compile(module, path, 'exec'), scope)
+
+    return scope
+
+
+# Counts how many times the test of a function's outermost loops runs, `while` or `for`
+def count_iterations(f, *args):
+    code = f.__code__
+    loops = [n for n in ast.walk(ast.parse(textwrap.dedent(inspect.getsource(f)))) if isinstance(n, (ast.While, ast.For))]
+    nested = {id(inner) for loop in loops for inner in ast.walk(loop) if inner is not loop}
+    loop_lines = {n.lineno for n in loops if id(n) not in nested}
+    loop_lines = {code.co_firstlineno + line - 1 for line in loop_lines}
+    count = 0
+
+    def tracer(frame, event, arg):
+        nonlocal count
+        if frame.f_code is not code:
+            return None
+        if event == 'line' and frame.f_lineno in loop_lines:
+            count += 1
+        return tracer
+
+    sys.settrace(tracer)
+    try:
+        f(*args)
+    finally:
+        sys.settrace(None)
+
+    return count
+
+
+def sample(magnitude, rng):
+    # Random mantissa with token decimals, e.g. 3.141592653589793238 * 10^magnitude
+    mantissa = ContractingDecimal(rng.randint(pow(10, TOKEN_DECIMALS), 10 * pow(10, TOKEN_DECIMALS) - 1)) / pow(10, TOKEN_DECIMALS)
+    return mantissa * pow(10, magnitude)
+
+
+def main(samples=20):
+    contract = load_contract_sqrt()
+    rng = random.Random(0)
+
+    print('{:>6} | {:>10} {:>12} | {:>10} {:>12} | {:>8}'.format(
+        'input', 'babylon it', 'babylon us', 'isqrt it', 'sqrt us', 'speedup'))
+
+    for magnitude in MAGNITUDES:
+        values = [sample(magnitude, rng) for _ in range(samples)]
+
+        old_iterations = max(count_iterations(babylonian_sqrt, v) for v in values)
+        new_iterations = max(count_iterations(contract['isqrt'], contract['expand_to_sqrt_domain'](v)) for v in values)
+
+        old_time = timeit.timeit(lambda: [babylonian_sqrt(v) for v in values], number=5) / (5 * samples)
+        new_time = timeit.timeit(lambda: [contract['sqrt'](v) for v in values], number=5) / (5 * samples)
+
+        print('{:>6} | {:>10} {:>12.2f} | {:>10} {:>12.2f} | {:>7.1f}x'.format(
+            '1e{}'.format(magnitude), old_iterations, old_time * 1e6, new_iterations, new_time * 1e6, old_time / new_time))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
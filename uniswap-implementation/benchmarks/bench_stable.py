@@ -0,0 +1,166 @@
+# Benchmark - dex_stable (StableSwap) against the constant product path of dex_pairs
+#
+# Solvers: Newton iterations of get_y and get_d per swap, from the warm starts the contract uses (the output
+# coin's balance for y, the cached D for D) and from Curve's cold starts (D for y, sum of balances for D).
+# Also the output of the same trade on both curves, per unit of input.
+#
+# Swaps: stamps per swap executed through ContractingClient's executor (metered, committed per tx), on pools with
+# the same balances. Every path pulls the input from the signer, approved up front:
+#   cp pair   - dex_pairs.deposit + dex_pairs.swap, the same entry shape as dex_stable.swap: the pair takes the
+#               input with transfer_from and pays out the quoted output. Two transactions, their stamps are summed
+#   cp router - router.swap_exact_in over the same pair, for the routing overhead (hop lookup, approve, deposit)
+#   ss        - dex_stable.swap, a single transaction
+# The quote for the cp pair path comes from router.get_amounts_out, outside of the stamps.
+# Last run, 20 swaps, every amplification and balance row alike: cp pair ~41 (about 7 for the deposit), cp router
+# ~79, ss ~17. So the router roughly doubles the cost of the constant product path, but dex_pairs.swap alone still
+# costs more than dex_stable.swap. It also keeps the price accumulators, the observation, the event log, two
+# balance reads and the K check.
+#
+# Run from this directory: python bench_stable.py [swaps]
+import ast
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from contracting.client import ContractingClient
+
+from bench_dex_pairs import WALLET, execute, submit
+from bench_sqrt import count_iterations
+
+AMPLIFICATIONS = [10, 100, 1000]
+# tau : token balances of the pool
+BALANCES = [[1000, 1000], [1000, 3000], [1000, 10000]]
+# trade size, fraction of the input coin's balance
+TRADES = [0.001, 0.01, 0.1]
+STARTING_BALANCE = pow(10, 9)
+UNIT = pow(10, 18)
+
+
+# Pull the solvers straight out of the contract source, so the numbers are for the deployed code
+def load_contract_solvers(path='../dex_stable.py'):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+
+    constants = {'N_COINS', 'MAX_ITERATIONS'}
+    body = [n for n in tree.body if isinstance(n, ast.Assign) and n.targets[0].id in constants]
+    body += [n for n in tree.body if isinstance(n, ast.FunctionDef) and n.name in {'get_d', 'get_y'}]
+
+    scope = {}
+    exec(compile(ast.Module(body=body, type_ignores=[]), path, 'exec'), scope)
+
+    return scope
+
+
+def solver_table():
+    contract = load_contract_solvers()
+    get_d, get_y = contract['get_d'], contract['get_y']
+
+    print('{:>5} {:>11} {:>6} | {:>6} {:>6} | {:>6} {:>6} | {:>9} {:>9}'.format(
+        'amp', 'balances', 'trade', 'y warm', 'y cold', 'D warm', 'D cold', 'out/in ss', 'out/in cp'))
+
+    for amp in AMPLIFICATIONS:
+        for tau_balance, token_balance in BALANCES:
+            balances = [tau_balance * UNIT, token_balance * UNIT]
+            d = get_d(balances, amp, 0)
+
+            for trade in TRADES:
+                amount_in = int(balances[0] * trade)
+                x = balances[0] + amount_in
+
+                y = get_y(x, d, amp, balances[1])
+                after = [x, y]
+
+                y_warm = count_iterations(get_y, x, d, amp, balances[1])
+                y_cold = count_iterations(get_y, x, d, amp, d)
+                d_warm = count_iterations(get_d, after, amp, d)
+                d_cold = count_iterations(get_d, after, amp, 0)
+
+                # before fees - 0.3% on dex_pairs, 0.04% on dex_stable
+                stable_out = (balances[1] - y) / amount_in
+                constant_product_out = (balances[1] - balances[0] * balances[1] // x) / amount_in
+
+                print('{:>5} {:>11} {:>6} | {:>6} {:>6} | {:>6} {:>6} | {:>9.4f} {:>9.4f}'.format(
+                    amp, '{}:{}'.format(tau_balance, token_balance), '{:.1%}'.format(trade),
+                    y_warm, y_cold, d_warm, d_cold, stable_out, constant_product_out))
+
+
+def deploy(amplification):
+    client = ContractingClient(signer=WALLET)
+    client.flush()
+
+    submit(client, '../currency.py', 'tau', s_name='tau', s_symbol='TAU', vk=WALLET, vk_amount=STARTING_BALANCE)
+    submit(client, '../basetoken.py', 'eth', s_name='eth', s_symbol='ETH', vk=WALLET, vk_amount=STARTING_BALANCE)
+    submit(client, '../dex.py', 'dex', fee_to_setter_address='fee_to_setter_address')
+    submit(client, '../dex_pairs.py', 'dex_pairs', owner_address='dex')
+    submit(client, '../dex_stable.py', 'dex_stable', owner_address='dex', amplification_coefficient=amplification)
+    submit(client, '../router.py', 'router')
+
+    # Stamps are paid from the sender's balance in the 'currency' contract
+    client.raw_driver.set_var('currency', 'balances', [WALLET], value=STARTING_BALANCE, mark=False)
+
+    for dex_pairs in ['dex_pairs', 'dex_stable']:
+        execute(client, 'dex', 'create_pair', dex_pairs=dex_pairs, tau_contract='tau', token_contract='eth')
+
+    # dex, router, dex_pairs and dex_stable pull payments with transfer_from
+    for token in ['tau', 'eth']:
+        for spender in ['dex', 'router', 'dex_pairs', 'dex_stable']:
+            execute(client, token, 'approve', amount=STARTING_BALANCE, to=spender)
+
+    return client
+
+
+def swap_stamps(amplification, tau_balance, token_balance, swaps, rng):
+    client = deploy(amplification)
+
+    execute(client, 'dex', 'add_liquidity', dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth',
+            tau_desired=tau_balance, token_desired=token_balance, tau_min=0, token_min=0, to_address=WALLET)
+    execute(client, 'dex_stable', 'add_liquidity', tau_contract='tau', token_contract='eth',
+            tau_amount=tau_balance, token_amount=token_balance, lp_token_min=0, to_address=WALLET)
+
+    stamps = {'pair': [], 'router': [], 'stable': []}
+    for i in range(swaps):
+        tau_in = i % 2 == 0
+        amount_in = round(rng.uniform(0.001, 0.01) * (tau_balance if tau_in else token_balance), 6)
+        path = ['tau', 'eth'] if tau_in else ['eth', 'tau']
+
+        amount_out = execute(client, 'router', 'get_amounts_out', dex_pairs='dex_pairs', amount_in=amount_in, path=path)['result'][-1]
+        deposit = execute(client, 'dex_pairs', 'deposit', tau_contract='tau', token_contract='eth', contract=path[0], amount=amount_in)
+        output = execute(client, 'dex_pairs', 'swap', tau_contract='tau', token_contract='eth',
+                         tau_out=0 if tau_in else amount_out, token_out=amount_out if tau_in else 0, to_address=WALLET)
+        stamps['pair'].append(deposit['stamps_used'] + output['stamps_used'])
+
+        output = execute(client, 'router', 'swap_exact_in', dex_pairs='dex_pairs', amount_in=amount_in, amount_out_min=0, path=path, to_address=WALLET)
+        stamps['router'].append(output['stamps_used'])
+
+        output = execute(client, 'dex_stable', 'swap', tau_contract='tau', token_contract='eth', tau_in=tau_in, amount_in=amount_in, amount_out_min=0, to_address=WALLET)
+        stamps['stable'].append(output['stamps_used'])
+
+    client.flush()
+    return stamps
+
+
+def stamps_table(swaps):
+    rng = random.Random(0)
+
+    columns = ['cp pair', 'cp router', 'ss']
+    print('{:>5} {:>11} | '.format('amp', 'balances') + ' | '.join('{:>14} {:>6}'.format(c + ' mean', 'max') for c in columns))
+
+    for amp in AMPLIFICATIONS:
+        for tau_balance, token_balance in BALANCES:
+            stamps = swap_stamps(amp, tau_balance, token_balance, swaps, rng)
+            rows = [stamps['pair'], stamps['router'], stamps['stable']]
+
+            print('{:>5} {:>11} | '.format(amp, '{}:{}'.format(tau_balance, token_balance)) +
+                  ' | '.join('{:>14.1f} {:>6}'.format(sum(row) / len(row), max(row)) for row in rows))
+
+
+def main(swaps=20):
+    solver_table()
+    print()
+    stamps_table(swaps)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
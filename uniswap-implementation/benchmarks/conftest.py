@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Off-chain modules live next to the contracts, in uniswap-implementation/offchain
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -0,0 +1,302 @@
+# Synthetic load generator - replays an N-pair, M-trader workload against dex / dex_pairs.
+#
+# Creates pairs with dex.create_pair, seeds each with mint_liquidity, then fires a mix of swaps, mints,
+# burns and LP transfers. Pairs and traders are drawn from Zipf distributions, so a few hot pairs and
+# heavy traders take most of the flow. Every transaction goes through the executor, metered and
+# committed one by one like a node would run them.
+#
+# Reports sustained throughput, latency percentiles + histograms per operation, and state growth
+# (keys and bytes written) over time. Run from this directory:
+#   python load_generator.py --pairs 1000 --traders 10000 --operations 50000 --json load.json
+#
+# Trader token balances are written straight into the state store the first time a trader needs them,
+# so funding doesn't show up as load.
+#
+# State lives in its own Mongo collection (lamden.load_generator by default, --collection), which setup and
+# exit flush - never the default lamden.state the tests and other clients share.
+import argparse
+import bisect
+import itertools
+import json
+import random
+import time
+from collections import defaultdict
+
+from contracting.client import ContractingClient
+from contracting.db.driver import ContractDriver, Driver
+from contracting.db.encoder import encode_kv
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.stdlib.bridge.time import Datetime
+
+WALLET = 'wallet_address'
+SUPPLY = pow(10, 15)
+SEED_LIQUIDITY = pow(10, 6)
+TRADER_FUNDS = pow(10, 6)
+NOW = Datetime(2030, 1, 1)
+COLLECTION = 'load_generator'
+
+# Latency histogram bucket upper bounds, in ms
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+PERCENTILES = [50, 90, 99]
+
+
+# Samples 0..n-1 with P(k) ~ 1 / (k + 1)^s
+class Zipf:
+    def __init__(self, n, s, rng):
+        self.rng = rng
+        self.cumulative = list(itertools.accumulate(1 / pow(k + 1, s) for k in range(n)))
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+class LoadGenerator:
+    def __init__(self, pairs, traders, zipf_pairs=1.1, zipf_traders=1.1, seed=0, client=None, collection=COLLECTION):
+        self.rng = random.Random(seed)
+        self.client = client or ContractingClient(signer=WALLET, driver=ContractDriver(driver=Driver(collection=collection)))
+        self.driver = self.client.raw_driver
+
+        self.tokens = ['token_{}'.format(i) for i in range(pairs)]
+        self.traders = ['trader_{}'.format(i) for i in range(traders)]
+        self.pair_sampler = Zipf(pairs, zipf_pairs, self.rng)
+        self.trader_sampler = Zipf(traders, zipf_traders, self.rng)
+
+        self.funded = set()
+        self.transactions = 0
+        self.failed = 0
+
+        # key => encoded size of the last value written, for state growth
+        self.state = {}
+
+    def submit(self, path, name, **constructor_args):
+        with open(path) as f:
+            self.client.submit(f.read(), name=name, constructor_args=constructor_args)
+
+    # One metered, committed transaction. Returns the executor output
+    def execute(self, sender, contract, function, **kwargs):
+        output = self.client.executor.execute(
+            sender=sender,
+            contract_name=contract,
+            function_name=function,
+            kwargs=kwargs,
+            environment={'now': NOW},
+            auto_commit=True,
+            metering=True
+        )
+        self.transactions += 1
+
+        if output['status_code'] == 0:
+            for key, value in output['writes'].items():
+                self.state[key] = sum(len(part) for part in encode_kv(key, value))
+        else:
+            self.failed += 1
+
+        # Committed writes are already in the store, only the cache is kept warm
+        self.driver.pending_writes.clear()
+        self.driver.reads.clear()
+
+        return output
+
+    def setup(self):
+        self.client.flush()
+
+        self.submit('../currency.py', 'tau', s_name='tau', s_symbol='TAU', vk=WALLET, vk_amount=SUPPLY)
+        self.submit('../dex.py', 'dex', fee_to_setter_address='fee_to_setter_address')
+        self.submit('../dex_pairs.py', 'dex_pairs', owner_address='dex')
+
+        # Stamps are paid from the sender's balance in the 'currency' contract
+        self.driver.set_var('currency', 'balances', [WALLET], value=SUPPLY, mark=False)
+        for token in self.tokens:
+            self.submit('../basetoken.py', token, s_name=token, s_symbol=token.upper(), vk=WALLET, vk_amount=SUPPLY)
+            self.execute(WALLET, 'dex', 'create_pair', dex_pairs='dex_pairs', tau_contract='tau', token_contract=token)
+            self.execute(WALLET, 'tau', 'transfer', amount=SEED_LIQUIDITY, to='dex_pairs')
+            self.execute(WALLET, token, 'transfer', amount=SEED_LIQUIDITY, to='dex_pairs')
+            self.execute(WALLET, 'dex_pairs', 'mint_liquidity', dex_contract='dex', tau_contract='tau', token_contract=token, to_address=WALLET)
+
+        self.driver.commit()
+
+    # Stamps for every trader, and tau + every token the first time the trader touches a pair
+    def fund(self, trader, token=None):
+        if trader not in self.funded:
+            self.driver.set_var('currency', 'balances', [trader], value=SUPPLY, mark=False)
+            self.driver.set_var('tau', 'balances', [trader], value=TRADER_FUNDS, mark=False)
+            self.funded.add(trader)
+        if token is not None and (trader, token) not in self.funded:
+            self.driver.set_var(token, 'balances', [trader], value=TRADER_FUNDS, mark=False)
+            self.funded.add((trader, token))
+
+    def reserves(self, token):
+        return self.driver.get_var('dex_pairs', 'pairs', ['tau', token])[:2]
+
+    def lp_balance(self, token, trader):
+        return self.driver.get_var('dex_pairs', 'pairs', ['tau', token, 'lp_token_balance', trader])
+
+    # Each operation returns True when all of its transactions went through, None when skipped
+    # (burning or transferring LP tokens the trader doesn't have)
+    def swap(self, token, trader):
+        tau_reserve, token_reserve = self.reserves(token)
+        tau_in = self.rng.random() < 0.5
+        reserve_in, reserve_out = (tau_reserve, token_reserve) if tau_in else (token_reserve, tau_reserve)
+
+        amount_in = ContractingDecimal(str(round(self.rng.uniform(0.0001, 0.01), 6))) * reserve_in
+        amount_in_with_fee = amount_in * 997
+        amount_out = (amount_in_with_fee * reserve_out) / (reserve_in * 1000 + amount_in_with_fee) * ContractingDecimal('0.999')
+
+        if self.execute(trader, 'tau' if tau_in else token, 'transfer', amount=amount_in, to='dex_pairs')['status_code'] != 0:
+            return False
+        return self.execute(trader, 'dex_pairs', 'swap', tau_contract='tau', token_contract=token,
+                            tau_out=0 if tau_in else amount_out, token_out=amount_out if tau_in else 0,
+                            to_address=trader)['status_code'] == 0
+
+    def mint(self, token, trader):
+        tau_reserve, token_reserve = self.reserves(token)
+        share = ContractingDecimal(str(round(self.rng.uniform(0.0001, 0.01), 6)))
+
+        for contract, amount in [('tau', tau_reserve * share), (token, token_reserve * share)]:
+            if self.execute(trader, contract, 'transfer', amount=amount, to='dex_pairs')['status_code'] != 0:
+                return False
+        return self.execute(trader, 'dex_pairs', 'mint_liquidity', dex_contract='dex', tau_contract='tau',
+                            token_contract=token, to_address=trader)['status_code'] == 0
+
+    def burn(self, token, trader):
+        balance = self.lp_balance(token, trader)
+        if not balance:
+            return None
+
+        amount = balance * ContractingDecimal(str(round(self.rng.uniform(0.1, 1.0), 4)))
+        if self.execute(trader, 'dex_pairs', 'transfer', tau_contract='tau', token_contract=token, amount=amount, to='dex_pairs')['status_code'] != 0:
+            return False
+        return self.execute(trader, 'dex_pairs', 'burn_liquidity', dex_contract='dex', tau_contract='tau',
+                            token_contract=token, to_address=trader)['status_code'] == 0
+
+    def transfer(self, token, trader):
+        balance = self.lp_balance(token, trader)
+        if not balance:
+            return None
+
+        to = self.traders[self.trader_sampler.sample()]
+        amount = balance * ContractingDecimal(str(round(self.rng.uniform(0.1, 1.0), 4)))
+        return self.execute(trader, 'dex_pairs', 'transfer', tau_contract='tau', token_contract=token,
+                            amount=amount, to=to)['status_code'] == 0
+
+    # mix is {operation: weight}, e.g. {'swap': 70, 'mint': 10, 'burn': 10, 'transfer': 10}
+    def run(self, operations, mix, report_every=1000, report=print):
+        kinds = list(mix)
+        weights = [mix[kind] for kind in kinds]
+
+        latencies = defaultdict(list)
+        outcomes = defaultdict(lambda: {'ok': 0, 'failed': 0, 'skipped': 0})
+        timeline = []
+
+        start = last = time.perf_counter()
+        last_transactions = self.transactions
+        for i, kind in enumerate(self.rng.choices(kinds, weights=weights, k=operations), 1):
+            token = self.tokens[self.pair_sampler.sample()]
+            trader = self.traders[self.trader_sampler.sample()]
+            self.fund(trader, token)
+
+            began = time.perf_counter()
+            ok = getattr(self, kind)(token, trader)
+            if ok is None:
+                outcomes[kind]['skipped'] += 1
+            else:
+                latencies[kind].append((time.perf_counter() - began) * 1000)
+                outcomes[kind]['ok' if ok else 'failed'] += 1
+
+            if i % report_every == 0 or i == operations:
+                now = time.perf_counter()
+                point = {
+                    'operations': i,
+                    'elapsed_s': now - start,
+                    'tx_per_s': (self.transactions - last_transactions) / (now - last),
+                    'state_keys': len(self.state),
+                    'state_bytes': sum(self.state.values())
+                }
+                timeline.append(point)
+                report('{operations:>9} ops {elapsed_s:>9.1f}s {tx_per_s:>9.1f} tx/s {state_keys:>9} keys {state_bytes:>12} bytes'.format(**point))
+                last, last_transactions = now, self.transactions
+
+        elapsed = time.perf_counter() - start
+        return {
+            'operations': operations,
+            'transactions': self.transactions,
+            'failed_transactions': self.failed,
+            'elapsed_s': elapsed,
+            'ops_per_s': operations / elapsed,
+            'outcomes': dict(outcomes),
+            'latency_ms': {kind: summarize(values) for kind, values in latencies.items()},
+            'timeline': timeline
+        }
+
+
+def summarize(values):
+    ordered = sorted(values)
+    summary = {'p{}'.format(p): ordered[min(len(ordered) - 1, len(ordered) * p // 100)] for p in PERCENTILES}
+    summary['max'] = ordered[-1]
+    summary['histogram'] = histogram(ordered)
+    return summary
+
+
+# {'<=1': n, '<=2': n, ..., '>1000': n}
+def histogram(values):
+    counts = {'<={}'.format(bound): 0 for bound in BUCKETS}
+    counts['>{}'.format(BUCKETS[-1])] = 0
+    for value in values:
+        index = bisect.bisect_left(BUCKETS, value)
+        counts['<={}'.format(BUCKETS[index]) if index < len(BUCKETS) else '>{}'.format(BUCKETS[-1])] += 1
+    return counts
+
+
+def print_latencies(result):
+    for kind, summary in result['latency_ms'].items():
+        outcome = result['outcomes'][kind]
+        print('\n{} - {} ok, {} failed, {} skipped - p50 {:.2f}ms p90 {:.2f}ms p99 {:.2f}ms max {:.2f}ms'.format(
+            kind, outcome['ok'], outcome['failed'], outcome['skipped'], summary['p50'], summary['p90'], summary['p99'], summary['max']))
+
+        total = sum(summary['histogram'].values())
+        for bucket, count in summary['histogram'].items():
+            print('  {:>7} ms | {:<50} {}'.format(bucket, '#' * round(50 * count / total), count))
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        kind, weight = part.split('=')
+        assert kind in ['swap', 'mint', 'burn', 'transfer'], 'Unknown operation {}'.format(kind)
+        mix[kind] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic load against dex / dex_pairs')
+    parser.add_argument('--pairs', type=int, default=10)
+    parser.add_argument('--traders', type=int, default=100)
+    parser.add_argument('--operations', type=int, default=1000)
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('swap=70,mint=10,burn=10,transfer=10'))
+    parser.add_argument('--zipf-pairs', type=float, default=1.1, help='pair skew, 0 = uniform')
+    parser.add_argument('--zipf-traders', type=float, default=1.1, help='trader skew, 0 = uniform')
+    parser.add_argument('--report-every', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--collection', default=COLLECTION, help='Mongo collection for the state, flushed at setup and exit')
+    parser.add_argument('--json', help='write the full result to this file')
+    args = parser.parse_args(argv)
+
+    generator = LoadGenerator(args.pairs, args.traders, args.zipf_pairs, args.zipf_traders, args.seed, collection=args.collection)
+
+    began = time.perf_counter()
+    generator.setup()
+    print('setup: {} pairs in {:.1f}s'.format(args.pairs, time.perf_counter() - began))
+
+    result = generator.run(args.operations, args.mix, args.report_every)
+    print('\n{operations} ops / {transactions} tx ({failed_transactions} failed) in {elapsed_s:.1f}s - {ops_per_s:.1f} ops/s'.format(**result))
+    print_latencies(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    generator.client.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -50,11 +50,17 @@ def approve(amount: float, to: str):
     return balances[sender, to]
 
 @export
-def transfer_from(amount: float, from_address: str, to_address: str):
+# Lamden standard - the caller spends what main_account approved it for
+def transfer_from(amount: float, to: str, main_account: str):
     assert amount > 0, 'Cannot send negative balances!'
-    assert balances[from_address] > amount, 'Cannot send amount greater than balance!'
 
-    # TODO - A1 - Trying to understand this currency.py vs. function in general...
-    balances[from_address] -= amount
-    balances[to_address] += amount
+    sender = ctx.caller
+
+    assert balances[main_account, sender] >= amount, 'Not enough coins approved to send! You have {} and are trying to spend {}'\
+        .format(balances[main_account, sender], amount)
+    assert balances[main_account] >= amount, 'Not enough coins to send!'
 
+    balances[main_account, sender] -= amount
+    balances[main_account] -= amount
+
+    balances[to] += amount
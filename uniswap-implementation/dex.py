@@ -6,12 +6,14 @@
 # Public interface
 # Illegal use of a builtin
 # import time
-# TODO - A4 - Price oracle
+# DONE - A4 - Price oracle - dex_pairs.consult
 I = importlib
 
 # Enforceable interface
 token_interface = [
     I.Func('transfer', args=('amount', 'to')),
+    I.Func('transfer_from', args=('amount', 'to', 'main_account')),
+    I.Func('approve', args=('amount', 'to')),
     I.Func('balance_of', args=('account',))
 ]
 
@@ -37,16 +39,14 @@ def get_dex_pairs_interface(dex_pairs_contract):
 
     return dex_pairs
 
-# Get token modules, validate & return
-def get_token_interface(tau_contract, token_contract):
-    # Make sure that what is imported is actually a valid token
-    tau = I.import_module(tau_contract)
-    assert I.enforce_interface(tau, token_interface), 'Tau contract does not meet the required interface'
-
-    token = I.import_module(token_contract)
-    assert I.enforce_interface(token, token_interface), 'Token contract does not meet the required interface'
+# Get a token module of a pair - dex_pairs validated it when the market was created, so the registry is trusted.
+# Tokens of pairs created before the registry are validated here until dex_pairs registers them on first use
+def get_pair_token(pairs, contract):
+    token = I.import_module(contract)
+    if not pairs.is_valid_token(contract) :
+        assert I.enforce_interface(token, token_interface), 'Token contract does not meet the required interface'
 
-    return tau, token
+    return token
 
 # UniswapV2Library.sol => quote
 # given some amount of an asset and pair reserves, returns an equivalent amount of the other asset
@@ -80,6 +80,18 @@ def set_fee_to(account:str):
 def fee_to_setter():
     return fee_to_setter.get()
 
+# dex_pairs only accepts migrate_pair from its owner (this contract), fee_to_setter is the admin that forwards it
+@export
+def migrate_pair(dex_pairs: str, tau_contract: str, token_contract: str):
+    assert ctx.caller == fee_to_setter.get(), 'LamDex: FORBIDDEN'
+    get_dex_pairs_interface(dex_pairs).migrate_pair(tau_contract, token_contract)
+
+# Indexes a pair created before all_pairs / pair_index, see dex_pairs.backfill_pair - forwarded like migrate_pair
+@export
+def backfill_pair(dex_pairs: str, index: int, tau_contract: str, token_contract: str):
+    assert ctx.caller == fee_to_setter.get(), 'LamDex: FORBIDDEN'
+    get_dex_pairs_interface(dex_pairs).backfill_pair(index, tau_contract, token_contract)
+
 # Create pair before doing anything else
 @export
 def create_pair(dex_pairs: str, tau_contract: str, token_contract: str):
@@ -90,7 +102,7 @@ def create_pair(dex_pairs: str, tau_contract: str, token_contract: str):
     assert pairs.pair(tau_contract, token_contract) is None, 'Market already exists!'
 
     # 1 - Create the pair
-    # TODO - A4 - Make pair lookup, work vice/versa
+    # DONE - A4 - Make pair lookup, work vice/versa - pairs.pair resolves either order
     pairs.initialize(tau_contract, token_contract)
 
     # TODO - B1 - Support new functionality
@@ -105,39 +117,52 @@ def create_pair(dex_pairs: str, tau_contract: str, token_contract: str):
 
 # DONE - A1 - Add liquidity needs to implement add_liquidity + mint_liquidity
 # DONE - A1 - Add liquidity needs to implement remove_liquidity + burn_liquidity
+# UniswapV2Router02.sol => _addLiquidity()
+# Picks the deposit that matches the current reserve ratio, within the desired and minimum amounts
+def calculate_liquidity_amounts(tau_reserve, token_reserve, tau_desired, token_desired, tau_min, token_min):
+    # First deposit sets the price
+    if tau_reserve == 0 and token_reserve == 0 :
+        return tau_desired, token_desired
+
+    token_optimal = quote(tau_desired, tau_reserve, token_reserve)
+    if token_optimal <= token_desired :
+        assert token_optimal >= token_min, 'Insufficient token amount'
+        return tau_desired, token_optimal
+
+    tau_optimal = quote(token_desired, token_reserve, tau_reserve)
+    assert tau_optimal <= tau_desired
+    assert tau_optimal >= tau_min, 'Insufficient tau amount'
+    return tau_optimal, token_desired
+
+# Pulls amount of token from the caller, then approves dex_pairs to take it into the pair's deposit ledger
+def deposit(dex_pairs, pairs, tau_contract, token_contract, contract, token, amount):
+    token.transfer_from(amount=amount, to=ctx.this, main_account=ctx.caller)
+    token.approve(amount=amount, to=dex_pairs)
+
+    pairs.deposit(tau_contract, token_contract, contract, amount)
+
 # Route01 Fn
-# Pair must exist before liquidity can be added
+# UniswapV2Router02.sol => addLiquidity()
+# Pair must exist before liquidity can be added. Pulls only the optimal amounts from the caller, who approved
+# dex for both tokens, deposits them into dex_pairs and mints the LP tokens to to_address, all in one transaction -
+# nothing needs to be refunded
 @export
-def add_liquidity(dex_pairs: str, tau_contract: str, token_contract: str, tau_in: int, token_in: int):
-    assert token_in > 0
-    assert tau_in > 0
-
-    # Make sure that what is imported is actually a valid token
-    tau, token = get_token_interface(tau_contract, token_contract)
+def add_liquidity(dex_pairs: str, tau_contract: str, token_contract: str, tau_desired: float, token_desired: float, tau_min: float, token_min: float, to_address: str):
+    assert tau_desired > 0 and token_desired > 0, 'Insufficient amount!'
     assert tau_contract != token_contract
 
+    # Asserts 'Invalid pair' when the market does not exist
+    # Reserves come back in the requested order, the pair itself might be stored the other way around
     pairs = get_dex_pairs_interface(dex_pairs)
-    assert not pairs.pair(tau_contract, token_contract) is None, 'Market does not exist!'
-
-    # 1 - This contract will own all amounts sent to it
-    tau.transfer(tau_in, ctx.this)
-    token.transfer(token_in, ctx.this)
-
-    # Track liquidity provided by signer
-    # TODO - If we care about "% pool" This needs to remain updated as market swings along X,Y
-    if pairs[tau_contract, token_contract, ctx.signer] is None :
-        pairs[tau_contract, token_contract, 'tau_liquidity', ctx.signer] = tau_in
-        pairs[tau_contract, token_contract, 'token_liquidity', ctx.signer] = token_in
-    else :
-        pairs[tau_contract, token_contract, 'tau_liquidity', ctx.signer] += tau_in
-        pairs[tau_contract, token_contract, 'token_liquidity', ctx.signer] += token_in
-
-    # I'm assuming registry of [ctx.this,ctx.investor,amount] is done via LP
-    update(
-        tau,
-        token,
-        tau.balance_of(ctx.this),
-        token.balance_of(ctx.this),
-        pairs[tau.token_name(), token.token_name(), 'tau_reserve'],
-        pairs[tau.token_name(), token.token_name(), 'token_reserve']
-    )
+    pair_tau_contract, pair_token_contract, tau_reserve, token_reserve = pairs.get_pair(tau_contract, token_contract)
+    tau_amount, token_amount = calculate_liquidity_amounts(tau_reserve, token_reserve, tau_desired, token_desired, tau_min, token_min)
+
+    # Paid into the pair's deposit ledger, so minting reads no token balances
+    tau = get_pair_token(pairs, tau_contract)
+    token = get_pair_token(pairs, token_contract)
+    deposit(dex_pairs, pairs, pair_tau_contract, pair_token_contract, tau_contract, tau, tau_amount)
+    deposit(dex_pairs, pairs, pair_tau_contract, pair_token_contract, token_contract, token, token_amount)
+
+    pairs.mint_liquidity(ctx.this, pair_tau_contract, pair_token_contract, to_address)
+
+    return tau_amount, token_amount
@@ -0,0 +1,729 @@
+# Concentrated liquidity pools - UniswapV3Pool.sol core, next to the constant product pairs in dex_pairs.py
+# Liquidity is provided over a tick range [tick_lower, tick_upper), price moves tick by tick and only the
+# positions in range are traded against. Created through the same factory: dex.create_pair(dex_pairs='dex_concentrated', ...)
+#
+# Differences with UniswapV3:
+# - payments are pulled from the caller with transfer_from instead of mint/swap callbacks, the caller approves
+#   this contract first - positions belong to the caller too, so contracts can hold and manage them
+# - exact input swaps only, single fee tier (FEE) and TICK_SPACING per deployment
+# - no protocol fee, no price oracle observations
+# - amounts are ContractingDecimal at the boundary, all pool math runs on ints scaled by 10^TOKEN_DECIMALS
+# Only the factory interface (pair, length_pairs, initialize) is shared with dex_pairs. The trading interface
+# the router uses (get_pair, get_pair_reserves, deposit, swap by output amounts) is out of scope here
+# Like dex_pairs, every call takes the two contracts in either order - amounts, prices and tau_in follow the
+# order of the call, positions are kept under the pool as stored
+I = importlib
+
+# Enforceable interface
+token_interface = [
+    I.Func('transfer', args=('amount', 'to')),
+    I.Func('transfer_from', args=('amount', 'to', 'main_account')),
+    I.Func('balance_of', args=('account',))
+]
+
+# POOL STATE - packed into a single record, one storage key per pool
+# pools[tau_contract: str, token_contract: str] = [sqrt_price_x96, tick, liquidity, fee_growth_tau_x128, fee_growth_token_x128]
+# sqrt_price_x96 is sqrt(token / tau) as a Q64.96, 0 until initialize_price
+owner = Variable()
+pools = Hash()
+
+# POOL INDEX - append-only, written once at pool creation
+# [tau_contract, token_contract] = all_pools[index: int]
+all_pools = Hash()
+
+# INITIALIZED TICKS - only ticks that some position uses as a bound
+# [liquidity_gross, liquidity_net, fee_growth_outside_tau_x128, fee_growth_outside_token_x128] = ticks[tau_contract, token_contract, tick: int]
+ticks = Hash()
+
+# TICK BITMAP - one bit per initialized tick / TICK_SPACING, 256 bits per word, so a swap finds the next
+# initialized tick with one read per word instead of one per tick
+# word = tick_bitmap[tau_contract, token_contract, word_position: int]
+tick_bitmap = Hash(default_value=0)
+
+# POSITIONS
+# [liquidity, fee_growth_inside_tau_last_x128, fee_growth_inside_token_last_x128, tokens_owed_tau, tokens_owed_token] = positions[tau_contract, token_contract, owner, tick_lower, tick_upper]
+positions = Hash()
+
+TOKEN_DECIMALS = 18
+
+# Pool record layout
+SQRT_PRICE_X96 = 0
+TICK = 1
+LIQUIDITY = 2
+FEE_GROWTH_TAU = 3
+FEE_GROWTH_TOKEN = 4
+
+# Position record layout
+POSITION_LIQUIDITY = 0
+FEE_INSIDE_TAU_LAST = 1
+FEE_INSIDE_TOKEN_LAST = 2
+OWED_TAU = 3
+OWED_TOKEN = 4
+
+# Fee in hundredths of a bip, 0.3%
+FEE = 3000
+FEE_DENOMINATOR = pow(10, 6)
+TICK_SPACING = 60
+
+Q96 = pow(2, 96)
+Q128 = pow(2, 128)
+# Fee growth accumulators wrap around like their uint256 counterparts, only differences are meaningful
+UINT256 = pow(2, 256)
+
+# TickMath.sol - ticks for prices between 2^-128 and 2^128
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+
+# sqrt(1.0001)^-(2^i) as Q128.128, for i = 1..19
+TICK_FACTORS = [
+    0xfff97272373d413259a46990580e213a,
+    0xfff2e50f5f656932ef12357cf3c7fdcc,
+    0xffe5caca7e10e4e61c3624eaa0941cd0,
+    0xffcb9843d60f6159c9db58835c926644,
+    0xff973b41fa98c081472e6896dfb254c0,
+    0xff2ea16466c96a3843ec78b326b52861,
+    0xfe5dee046a99a2a811c461f1969c3053,
+    0xfcbe86c7900a88aedcffc83b479aa3a4,
+    0xf987a7253ac413176f2b074cf7815e54,
+    0xf3392b0822b70005940c7a398e4b70f3,
+    0xe7159475a2c29b7443b29c7fa6e889d9,
+    0xd097f3bdfd2022b8845ad8f792aa5825,
+    0xa9f746462d870fdf8a65dc1f90e061e5,
+    0x70d869a156d2a1b890bb3df62baf32f7,
+    0x31be135f97d08fd981231505542fcfa6,
+    0x9aa508b5b7a84e1c677de54f3e99bc9,
+    0x5d6af8dedb81196699c329225ee604,
+    0x2216e584f5fa1ea926041bedfe98,
+    0x48a170391f7dc42444e8fa2
+]
+
+# TOKEN HELPERS - the same code in dex_concentrated.py and dex_stable.py. Contracts can't call each other's
+# private functions, and pull() has to run in the pool itself to spend what its caller approved, so each pool
+# keeps a copy - tests/test_dex_stable.py checks the copies match
+# returns int - amount * 10^TOKEN_DECIMALS, truncated past TOKEN_DECIMALS
+def to_raw(amount):
+    whole = int(amount)
+    return whole * pow(10, TOKEN_DECIMALS) + int((amount - whole) * pow(10, TOKEN_DECIMALS))
+
+# returns ContractingDecimal - exact, raw amounts carry TOKEN_DECIMALS digits
+def from_raw(raw):
+    return decimal(raw // pow(10, TOKEN_DECIMALS)) + decimal(raw % pow(10, TOKEN_DECIMALS)) / pow(10, TOKEN_DECIMALS)
+
+# Get a token module, validated against the interface
+def get_token(token_contract):
+    token = I.import_module(token_contract)
+    assert I.enforce_interface(token, token_interface), 'Token contract does not meet the required interface'
+
+    return token
+
+# Pays the pool from the caller, who approved it first - a raw amount rounded up by the pool math, so it is
+# exact in TOKEN_DECIMALS
+def pull(token_contract, raw_amount):
+    if raw_amount > 0 :
+        get_token(token_contract).transfer_from(amount=from_raw(raw_amount), to=ctx.this, main_account=ctx.caller)
+
+def pay(token_contract, raw_amount, to_address):
+    if raw_amount > 0 :
+        get_token(token_contract).transfer(from_raw(raw_amount), to_address)
+
+def ceil_div(numerator, denominator):
+    return -(-numerator // denominator)
+
+def most_significant_bit(x):
+    return x.bit_length() - 1
+
+def least_significant_bit(x):
+    return (x & -x).bit_length() - 1
+
+# TickMath.sol => getSqrtRatioAtTick
+# sqrt(1.0001^tick) * 2^96, multiplying in the factor of every set bit of |tick|
+def get_sqrt_ratio_at_tick(tick):
+    abs_tick = abs(tick)
+    assert abs_tick <= MAX_TICK, 'T'
+
+    ratio = 0xfffcb933bd6fad37aa2d162d1a594001 if abs_tick & 1 != 0 else Q128
+    for i in range(len(TICK_FACTORS)):
+        if abs_tick & (2 << i) != 0 :
+            ratio = (ratio * TICK_FACTORS[i]) >> 128
+
+    if tick > 0 :
+        ratio = (UINT256 - 1) // ratio
+
+    # Q128.128 to Q64.96, rounding up so get_tick_at_sqrt_ratio stays consistent
+    return ceil_div(ratio, pow(2, 32))
+
+# TickMath.sol => getTickAtSqrtRatio
+# Greatest tick whose ratio is <= sqrt_price_x96, from a 14 bit binary log, off by at most one tick
+def get_tick_at_sqrt_ratio(sqrt_price_x96):
+    assert sqrt_price_x96 >= MIN_SQRT_RATIO and sqrt_price_x96 < MAX_SQRT_RATIO, 'R'
+
+    ratio = sqrt_price_x96 << 32
+    msb = most_significant_bit(ratio)
+    if msb >= 128 :
+        r = ratio >> (msb - 127)
+    else :
+        r = ratio << (127 - msb)
+
+    log_2 = (msb - 128) << 64
+    for i in range(63, 49, -1):
+        r = (r * r) >> 127
+        f = r >> 128
+        log_2 = log_2 | (f << i)
+        r = r >> f
+
+    log_sqrt10001 = log_2 * 255738958999603826347141 # 128.128 number
+
+    tick_low = (log_sqrt10001 - 3402992956809132418596140100660247210) >> 128
+    tick_high = (log_sqrt10001 + 291339464771989622907027621153398088495) >> 128
+
+    if tick_low == tick_high or get_sqrt_ratio_at_tick(tick_high) > sqrt_price_x96 :
+        return tick_low
+
+    return tick_high
+
+# SqrtPriceMath.sol => getAmount0Delta, tau between two prices
+def get_amount_tau_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity, round_up):
+    if sqrt_ratio_a > sqrt_ratio_b :
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+
+    numerator = (liquidity << 96) * (sqrt_ratio_b - sqrt_ratio_a)
+    if round_up :
+        return ceil_div(ceil_div(numerator, sqrt_ratio_b), sqrt_ratio_a)
+
+    return numerator // sqrt_ratio_b // sqrt_ratio_a
+
+# SqrtPriceMath.sol => getAmount1Delta, token between two prices
+def get_amount_token_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity, round_up):
+    if sqrt_ratio_a > sqrt_ratio_b :
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+
+    if round_up :
+        return ceil_div(liquidity * (sqrt_ratio_b - sqrt_ratio_a), Q96)
+
+    return liquidity * (sqrt_ratio_b - sqrt_ratio_a) // Q96
+
+# Signed versions, for a liquidity change: owed to the pool when adding, owed to the owner when removing
+def get_amount_tau_delta_signed(sqrt_ratio_a, sqrt_ratio_b, liquidity_delta):
+    if liquidity_delta < 0 :
+        return -get_amount_tau_delta(sqrt_ratio_a, sqrt_ratio_b, -liquidity_delta, False)
+
+    return get_amount_tau_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity_delta, True)
+
+def get_amount_token_delta_signed(sqrt_ratio_a, sqrt_ratio_b, liquidity_delta):
+    if liquidity_delta < 0 :
+        return -get_amount_token_delta(sqrt_ratio_a, sqrt_ratio_b, -liquidity_delta, False)
+
+    return get_amount_token_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity_delta, True)
+
+# SqrtPriceMath.sol => getNextSqrtPriceFromInput
+# Price after adding amount_in, rounded so the pool never gives out more than it was paid for
+def get_next_sqrt_price_from_input(sqrt_price_x96, liquidity, amount_in, tau_in):
+    assert sqrt_price_x96 > 0 and liquidity > 0
+
+    if amount_in == 0 :
+        return sqrt_price_x96
+
+    if tau_in :
+        # getNextSqrtPriceFromAmount0RoundingUp - L * P / (L + amount * P)
+        numerator = liquidity << 96
+        return ceil_div(numerator * sqrt_price_x96, numerator + amount_in * sqrt_price_x96)
+
+    # getNextSqrtPriceFromAmount1RoundingDown - P + amount / L
+    return sqrt_price_x96 + (amount_in << 96) // liquidity
+
+# SwapMath.sol => computeSwapStep, exact input
+# Returns the price reached moving towards sqrt_target, the input used, the output and the fee taken
+def compute_swap_step(sqrt_current, sqrt_target, liquidity, amount_remaining):
+    tau_in = sqrt_current >= sqrt_target
+
+    amount_remaining_less_fee = amount_remaining * (FEE_DENOMINATOR - FEE) // FEE_DENOMINATOR
+    if tau_in :
+        amount_in = get_amount_tau_delta(sqrt_target, sqrt_current, liquidity, True)
+    else :
+        amount_in = get_amount_token_delta(sqrt_current, sqrt_target, liquidity, True)
+
+    if amount_remaining_less_fee >= amount_in :
+        sqrt_next = sqrt_target
+    else :
+        sqrt_next = get_next_sqrt_price_from_input(sqrt_current, liquidity, amount_remaining_less_fee, tau_in)
+
+    reached_target = sqrt_next == sqrt_target
+    if tau_in :
+        if not reached_target :
+            amount_in = get_amount_tau_delta(sqrt_next, sqrt_current, liquidity, True)
+        amount_out = get_amount_token_delta(sqrt_next, sqrt_current, liquidity, False)
+    else :
+        if not reached_target :
+            amount_in = get_amount_token_delta(sqrt_current, sqrt_next, liquidity, True)
+        amount_out = get_amount_tau_delta(sqrt_current, sqrt_next, liquidity, False)
+
+    # Whatever is left of the input when the target wasn't reached stays in the pool as fee
+    if not reached_target :
+        fee_amount = amount_remaining - amount_in
+    else :
+        fee_amount = ceil_div(amount_in * FEE, FEE_DENOMINATOR - FEE)
+
+    return sqrt_next, amount_in, amount_out, fee_amount
+
+# TickBitmap.sol => position - word and bit of a compressed tick (tick / TICK_SPACING)
+def bitmap_position(compressed):
+    return compressed >> 8, compressed % 256
+
+# TickBitmap.sol => flipTick
+def flip_tick(tau_contract, token_contract, tick):
+    assert tick % TICK_SPACING == 0
+    word_position, bit_position = bitmap_position(tick // TICK_SPACING)
+    tick_bitmap[tau_contract, token_contract, word_position] ^= 1 << bit_position
+
+# TickBitmap.sol => nextInitializedTickWithinOneWord
+# Next initialized tick at or left of tick (lte), or right of tick, looking at a single bitmap word.
+# Returns (tick, initialized) - when the word holds none, the word boundary comes back uninitialized,
+# so a swap takes one read per 256 * TICK_SPACING ticks crossed at most
+def next_initialized_tick_within_one_word(tau_contract, token_contract, tick, lte):
+    # Floor division already rounds negative ticks towards negative infinity
+    compressed = tick // TICK_SPACING
+
+    if lte :
+        word_position, bit_position = bitmap_position(compressed)
+        # all the bits at or to the right of the current bit
+        mask = (1 << bit_position) - 1 + (1 << bit_position)
+        masked = tick_bitmap[tau_contract, token_contract, word_position] & mask
+
+        if masked != 0 :
+            return (compressed - (bit_position - most_significant_bit(masked))) * TICK_SPACING, True
+
+        return (compressed - bit_position) * TICK_SPACING, False
+
+    # start from the word of the next tick, the current tick's state is already known
+    word_position, bit_position = bitmap_position(compressed + 1)
+    # all the bits at or to the left of the current bit
+    mask = (UINT256 - 1) ^ ((1 << bit_position) - 1)
+    masked = tick_bitmap[tau_contract, token_contract, word_position] & mask
+
+    if masked != 0 :
+        return (compressed + 1 + (least_significant_bit(masked) - bit_position)) * TICK_SPACING, True
+
+    return (compressed + 1 + (255 - bit_position)) * TICK_SPACING, False
+
+# Returns a copy of a tick record, so callers can modify it before writing it back
+def load_tick(tau_contract, token_contract, tick):
+    info = ticks[tau_contract, token_contract, tick]
+    if info is None :
+        return [0, 0, 0, 0]
+
+    return list(info)
+
+# Tick.sol => update
+# Returns True when the tick went from unused to used or back, and its bitmap bit needs flipping
+def update_tick(pool, tick, liquidity_delta, upper):
+    state = pool['state']
+    info = load_tick(pool['tau_contract'], pool['token_contract'], tick)
+
+    liquidity_gross_before = info[0]
+    liquidity_gross_after = liquidity_gross_before + liquidity_delta
+    assert liquidity_gross_after >= 0, 'LS'
+
+    if liquidity_gross_before == 0 :
+        # by convention, all fee growth so far happened below the tick
+        if tick <= state[TICK] :
+            info[2] = state[FEE_GROWTH_TAU]
+            info[3] = state[FEE_GROWTH_TOKEN]
+
+    info[0] = liquidity_gross_after
+    # crossing upwards adds liquidity_net, the upper tick of a range removes what the lower one added
+    if upper :
+        info[1] -= liquidity_delta
+    else :
+        info[1] += liquidity_delta
+
+    ticks[pool['tau_contract'], pool['token_contract'], tick] = info
+
+    return (liquidity_gross_after == 0) != (liquidity_gross_before == 0)
+
+# Tick.sol => cross
+# Flips the fee growth outside to the other side of the tick, returns the liquidity_net to apply
+def cross_tick(pool, tick, fee_growth_tau, fee_growth_token):
+    info = load_tick(pool['tau_contract'], pool['token_contract'], tick)
+    info[2] = (fee_growth_tau - info[2]) % UINT256
+    info[3] = (fee_growth_token - info[3]) % UINT256
+    ticks[pool['tau_contract'], pool['token_contract'], tick] = info
+
+    return info[1]
+
+# Tick.sol => getFeeGrowthInside
+def get_fee_growth_inside(pool, tick_lower, tick_upper):
+    state = pool['state']
+    lower = load_tick(pool['tau_contract'], pool['token_contract'], tick_lower)
+    upper = load_tick(pool['tau_contract'], pool['token_contract'], tick_upper)
+
+    fee_growth_inside = []
+    for global_index, outside_index in [[FEE_GROWTH_TAU, 2], [FEE_GROWTH_TOKEN, 3]]:
+        fee_growth_global = state[global_index]
+
+        if state[TICK] >= tick_lower :
+            below = lower[outside_index]
+        else :
+            below = fee_growth_global - lower[outside_index]
+
+        if state[TICK] < tick_upper :
+            above = upper[outside_index]
+        else :
+            above = fee_growth_global - upper[outside_index]
+
+        fee_growth_inside.append((fee_growth_global - below - above) % UINT256)
+
+    return fee_growth_inside
+
+# Position.sol => update
+# Credits the fees earned since the last update, then applies the liquidity change
+def update_position(pool, owner_address, tick_lower, tick_upper, liquidity_delta, fee_growth_inside):
+    key = [pool['tau_contract'], pool['token_contract'], owner_address, tick_lower, tick_upper]
+    position = positions[key[0], key[1], key[2], key[3], key[4]]
+    position = [0, 0, 0, 0, 0] if position is None else list(position)
+
+    if liquidity_delta == 0 :
+        assert position[POSITION_LIQUIDITY] > 0, 'NP' # disallow pokes for 0 liquidity positions
+
+    owed_tau = ((fee_growth_inside[0] - position[FEE_INSIDE_TAU_LAST]) % UINT256) * position[POSITION_LIQUIDITY] // Q128
+    owed_token = ((fee_growth_inside[1] - position[FEE_INSIDE_TOKEN_LAST]) % UINT256) * position[POSITION_LIQUIDITY] // Q128
+
+    position[POSITION_LIQUIDITY] += liquidity_delta
+    position[FEE_INSIDE_TAU_LAST] = fee_growth_inside[0]
+    position[FEE_INSIDE_TOKEN_LAST] = fee_growth_inside[1]
+    position[OWED_TAU] += owed_tau
+    position[OWED_TOKEN] += owed_token
+
+    positions[key[0], key[1], key[2], key[3], key[4]] = position
+
+    return position
+
+def check_ticks(tick_lower, tick_upper):
+    assert tick_lower < tick_upper, 'TLU'
+    assert tick_lower >= MIN_TICK, 'TLM'
+    assert tick_upper <= MAX_TICK, 'TUM'
+    assert tick_lower % TICK_SPACING == 0 and tick_upper % TICK_SPACING == 0, 'Ticks must be multiples of {}'.format(TICK_SPACING)
+
+# UniswapV3Pool.sol => _modifyPosition
+# Updates the position and its bounding ticks, returns the raw [tau, token] amounts owed to the pool (negative: owed to the owner)
+def modify_position(pool, owner_address, tick_lower, tick_upper, liquidity_delta):
+    check_ticks(tick_lower, tick_upper)
+    state = pool['state']
+
+    flipped_lower = False
+    flipped_upper = False
+    if liquidity_delta != 0 :
+        flipped_lower = update_tick(pool, tick_lower, liquidity_delta, False)
+        flipped_upper = update_tick(pool, tick_upper, liquidity_delta, True)
+
+        if flipped_lower :
+            flip_tick(pool['tau_contract'], pool['token_contract'], tick_lower)
+        if flipped_upper :
+            flip_tick(pool['tau_contract'], pool['token_contract'], tick_upper)
+
+    fee_growth_inside = get_fee_growth_inside(pool, tick_lower, tick_upper)
+    update_position(pool, owner_address, tick_lower, tick_upper, liquidity_delta, fee_growth_inside)
+
+    # ticks no longer used by any position are cleared, once the fee growth inside was read from them
+    if liquidity_delta < 0 :
+        if flipped_lower :
+            ticks[pool['tau_contract'], pool['token_contract'], tick_lower] = None
+        if flipped_upper :
+            ticks[pool['tau_contract'], pool['token_contract'], tick_upper] = None
+
+    amount_tau = 0
+    amount_token = 0
+    sqrt_lower = get_sqrt_ratio_at_tick(tick_lower)
+    sqrt_upper = get_sqrt_ratio_at_tick(tick_upper)
+
+    if state[TICK] < tick_lower :
+        # range above the price, only tau is needed to cross into it
+        amount_tau = get_amount_tau_delta_signed(sqrt_lower, sqrt_upper, liquidity_delta)
+    elif state[TICK] < tick_upper :
+        amount_tau = get_amount_tau_delta_signed(state[SQRT_PRICE_X96], sqrt_upper, liquidity_delta)
+        amount_token = get_amount_token_delta_signed(sqrt_lower, state[SQRT_PRICE_X96], liquidity_delta)
+        state[LIQUIDITY] += liquidity_delta
+    else :
+        # range below the price, only token
+        amount_token = get_amount_token_delta_signed(sqrt_lower, sqrt_upper, liquidity_delta)
+
+    return amount_tau, amount_token
+
+# LiquidityAmounts.sol => getLiquidityForAmount0 / getLiquidityForAmount1
+def get_liquidity_for_tau(sqrt_ratio_a, sqrt_ratio_b, amount_tau):
+    return amount_tau * (sqrt_ratio_a * sqrt_ratio_b // Q96) // (sqrt_ratio_b - sqrt_ratio_a)
+
+def get_liquidity_for_token(sqrt_ratio_a, sqrt_ratio_b, amount_token):
+    return amount_token * Q96 // (sqrt_ratio_b - sqrt_ratio_a)
+
+# LiquidityAmounts.sol => getLiquidityForAmounts
+# Most liquidity that the amounts can pay for over the range, at the current price
+def get_liquidity_for_amounts(sqrt_price_x96, sqrt_lower, sqrt_upper, amount_tau, amount_token):
+    if sqrt_price_x96 <= sqrt_lower :
+        return get_liquidity_for_tau(sqrt_lower, sqrt_upper, amount_tau)
+
+    if sqrt_price_x96 < sqrt_upper :
+        return min(
+            get_liquidity_for_tau(sqrt_price_x96, sqrt_upper, amount_tau),
+            get_liquidity_for_token(sqrt_lower, sqrt_price_x96, amount_token)
+        )
+
+    return get_liquidity_for_token(sqrt_lower, sqrt_upper, amount_token)
+
+# Resolves the pool between two contracts given in either order - returns [tau_contract, token_contract] as
+# stored, and its packed record. The stored order takes a single read
+def resolve_pool(contract_a, contract_b):
+    entry = [contract_a, contract_b]
+    state = pools[contract_a, contract_b]
+    if state is None :
+        entry = [contract_b, contract_a]
+        state = pools[contract_b, contract_a]
+
+    assert not state is None, 'Invalid pair'
+    return entry, state
+
+# Pool handle - the packed pool record is read once here, and written back once by store_pool_state()
+# The handle always holds the pool as stored - flipped tells whether the caller asked in (token, tau) order
+def get_pool_handle(tau_contract, token_contract, initialized=True):
+    entry, state = resolve_pool(tau_contract, token_contract)
+    if initialized :
+        assert state[SQRT_PRICE_X96] > 0, 'Price not initialized'
+
+    return {
+        'tau_contract': entry[0],
+        'token_contract': entry[1],
+        'flipped': entry[0] != tau_contract,
+        'state': list(state)
+    }
+
+# Puts a (tau, token) pair of amounts in the caller's order, or back in the stored order
+def orient(pool, tau_amount, token_amount):
+    if pool['flipped'] :
+        return token_amount, tau_amount
+
+    return tau_amount, token_amount
+
+def store_pool_state(pool):
+    pools[pool['tau_contract'], pool['token_contract']] = pool['state']
+
+@construct
+def seed(owner_address: str):
+    owner.set(owner_address)
+    pools['count'] = 0
+
+@export
+# Pool record, either order finds the pool. Factory interface, shared with dex_pairs
+def pair(tau_contract: str, token_contract: str):
+    state = pools[tau_contract, token_contract]
+    if state is None :
+        state = pools[token_contract, tau_contract]
+
+    return state
+
+@export
+# Number of pools created
+def length_pairs():
+    return pools['count']
+
+@export
+# Creates the pool, its price is set separately through initialize_price. Factory interface, shared with dex_pairs
+def initialize(tau_contract: str, token_contract: str):
+    assert tau_contract != token_contract
+    assert ctx.caller == owner.get(), 'LamDexConcentrated: FORBIDDEN'
+    assert pair(tau_contract, token_contract) is None, 'Market already exists!'
+
+    get_token(tau_contract)
+    get_token(token_contract)
+
+    pools[tau_contract, token_contract] = [0, 0, 0, 0, 0]
+    all_pools[pools['count']] = [tau_contract, token_contract]
+    pools['count'] += 1
+
+@export
+# UniswapV3Pool.sol => initialize - sets the starting price once, sqrt(token / tau) as a Q64.96
+# in the order of the call, stored as the inverse when the pool is stored the other way around
+def initialize_price(tau_contract: str, token_contract: str, sqrt_price_x96: int):
+    pool = get_pool_handle(tau_contract, token_contract, False)
+    assert pool['state'][SQRT_PRICE_X96] == 0, 'AI'
+    if pool['flipped'] :
+        sqrt_price_x96 = Q96 * Q96 // sqrt_price_x96
+
+    pool['state'][SQRT_PRICE_X96] = sqrt_price_x96
+    pool['state'][TICK] = get_tick_at_sqrt_ratio(sqrt_price_x96)
+    store_pool_state(pool)
+
+@export
+# UniswapV3Pool.sol => mint
+# Adds liquidity to the caller's position over [tick_lower, tick_upper), paid from the caller
+# Returns the [tau, token] amounts paid
+def mint(tau_contract: str, token_contract: str, tick_lower: int, tick_upper: int, liquidity: int):
+    assert liquidity > 0, 'Insufficient liquidity minted'
+    pool = get_pool_handle(tau_contract, token_contract)
+
+    amount_tau, amount_token = modify_position(pool, ctx.caller, tick_lower, tick_upper, liquidity)
+    store_pool_state(pool)
+
+    pull(pool['tau_contract'], amount_tau)
+    pull(pool['token_contract'], amount_token)
+
+    return orient(pool, from_raw(amount_tau), from_raw(amount_token))
+
+@export
+# UniswapV3Pool.sol => burn
+# Removes liquidity from the caller's position, the amounts are credited to the position for collect()
+# Returns the [tau, token] amounts credited
+def burn(tau_contract: str, token_contract: str, tick_lower: int, tick_upper: int, liquidity: int):
+    assert liquidity >= 0, 'Invalid liquidity'
+    pool = get_pool_handle(tau_contract, token_contract)
+    tau_contract = pool['tau_contract']
+    token_contract = pool['token_contract']
+    position = positions[tau_contract, token_contract, ctx.caller, tick_lower, tick_upper]
+    assert not position is None and position[POSITION_LIQUIDITY] >= liquidity, 'Insufficient liquidity'
+
+    amount_tau, amount_token = modify_position(pool, ctx.caller, tick_lower, tick_upper, -liquidity)
+    store_pool_state(pool)
+
+    if amount_tau < 0 or amount_token < 0 :
+        position = list(positions[tau_contract, token_contract, ctx.caller, tick_lower, tick_upper])
+        position[OWED_TAU] -= amount_tau
+        position[OWED_TOKEN] -= amount_token
+        positions[tau_contract, token_contract, ctx.caller, tick_lower, tick_upper] = position
+
+    return orient(pool, from_raw(-amount_tau), from_raw(-amount_token))
+
+@export
+# UniswapV3Pool.sol => collect
+# Sends everything owed to the caller's position - burnt liquidity and fees - to to_address
+# Returns the [tau, token] amounts sent
+def collect(tau_contract: str, token_contract: str, tick_lower: int, tick_upper: int, to_address: str):
+    entry, state = resolve_pool(tau_contract, token_contract)
+    flipped = entry[0] != tau_contract
+    tau_contract, token_contract = entry
+    position = positions[tau_contract, token_contract, ctx.caller, tick_lower, tick_upper]
+    assert not position is None, 'Invalid position'
+
+    position = list(position)
+    owed_tau = position[OWED_TAU]
+    owed_token = position[OWED_TOKEN]
+    position[OWED_TAU] = 0
+    position[OWED_TOKEN] = 0
+    positions[tau_contract, token_contract, ctx.caller, tick_lower, tick_upper] = position
+
+    pay(tau_contract, owed_tau, to_address)
+    pay(token_contract, owed_token, to_address)
+
+    if flipped :
+        return from_raw(owed_token), from_raw(owed_tau)
+
+    return from_raw(owed_tau), from_raw(owed_token)
+
+@export
+# UniswapV3Pool.sol => swap, exact input
+# Trades amount_in of tau (tau_in) or token for the other, paid from the caller, output sent to to_address.
+# tau_in and sqrt_price_limit_x96 follow the order of the call - tau_in means the first contract given is the input
+# Walks the price tick by tick until the input is spent or sqrt_price_limit_x96 is reached, in which case
+# only the input used is paid. Returns the [amount_in, amount_out] traded
+def swap(tau_contract: str, token_contract: str, tau_in: bool, amount_in: float, amount_out_min: float, to_address: str, sqrt_price_limit_x96: int=None):
+    assert amount_in > 0, 'AS'
+    pool = get_pool_handle(tau_contract, token_contract)
+    tau_contract = pool['tau_contract']
+    token_contract = pool['token_contract']
+    state = pool['state']
+
+    # prices given in the order of the call are inverted, like in initialize_price
+    if pool['flipped'] :
+        tau_in = not tau_in
+        if not sqrt_price_limit_x96 is None :
+            sqrt_price_limit_x96 = Q96 * Q96 // sqrt_price_limit_x96
+
+    if sqrt_price_limit_x96 is None :
+        sqrt_price_limit_x96 = MIN_SQRT_RATIO + 1 if tau_in else MAX_SQRT_RATIO - 1
+
+    if tau_in :
+        assert sqrt_price_limit_x96 < state[SQRT_PRICE_X96] and sqrt_price_limit_x96 > MIN_SQRT_RATIO, 'SPL'
+    else :
+        assert sqrt_price_limit_x96 > state[SQRT_PRICE_X96] and sqrt_price_limit_x96 < MAX_SQRT_RATIO, 'SPL'
+
+    fee_growth_index = FEE_GROWTH_TAU if tau_in else FEE_GROWTH_TOKEN
+    amount_specified = to_raw(amount_in)
+    amount_remaining = amount_specified
+    amount_out = 0
+
+    while amount_remaining != 0 and state[SQRT_PRICE_X96] != sqrt_price_limit_x96:
+        sqrt_start = state[SQRT_PRICE_X96]
+
+        tick_next, initialized = next_initialized_tick_within_one_word(tau_contract, token_contract, state[TICK], tau_in)
+        # the bitmap knows nothing of the tick bounds
+        tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+        sqrt_next = get_sqrt_ratio_at_tick(tick_next)
+
+        if (tau_in and sqrt_next < sqrt_price_limit_x96) or (not tau_in and sqrt_next > sqrt_price_limit_x96) :
+            sqrt_target = sqrt_price_limit_x96
+        else :
+            sqrt_target = sqrt_next
+
+        state[SQRT_PRICE_X96], step_in, step_out, fee_amount = compute_swap_step(sqrt_start, sqrt_target, state[LIQUIDITY], amount_remaining)
+        amount_remaining -= step_in + fee_amount
+        amount_out += step_out
+
+        if state[LIQUIDITY] > 0 :
+            state[fee_growth_index] = (state[fee_growth_index] + (fee_amount << 128) // state[LIQUIDITY]) % UINT256
+
+        if state[SQRT_PRICE_X96] == sqrt_next :
+            if initialized :
+                liquidity_net = cross_tick(pool, tick_next, state[FEE_GROWTH_TAU], state[FEE_GROWTH_TOKEN])
+                # moving left, liquidity_net applies in reverse
+                if tau_in :
+                    liquidity_net = -liquidity_net
+                state[LIQUIDITY] += liquidity_net
+
+            state[TICK] = tick_next - 1 if tau_in else tick_next
+        elif state[SQRT_PRICE_X96] != sqrt_start :
+            # still within the step's range, the tick follows the price
+            state[TICK] = get_tick_at_sqrt_ratio(state[SQRT_PRICE_X96])
+
+    amount_used = amount_specified - amount_remaining
+    assert amount_out > 0, 'Insufficient output amount'
+    assert from_raw(amount_out) >= amount_out_min, 'Insufficient output amount'
+
+    store_pool_state(pool)
+
+    pull(tau_contract if tau_in else token_contract, amount_used)
+    pay(token_contract if tau_in else tau_contract, amount_out, to_address)
+
+    return from_raw(amount_used), from_raw(amount_out)
+
+@export
+# Liquidity that amount_tau and amount_token pay for over [tick_lower, tick_upper) at the current price, for mint()
+def liquidity_for_amounts(tau_contract: str, token_contract: str, tick_lower: int, tick_upper: int, amount_tau: float, amount_token: float):
+    check_ticks(tick_lower, tick_upper)
+    pool = get_pool_handle(tau_contract, token_contract)
+    amount_tau, amount_token = orient(pool, amount_tau, amount_token)
+
+    return get_liquidity_for_amounts(
+        pool['state'][SQRT_PRICE_X96],
+        get_sqrt_ratio_at_tick(tick_lower),
+        get_sqrt_ratio_at_tick(tick_upper),
+        to_raw(amount_tau),
+        to_raw(amount_token)
+    )
+
+@export
+# [tick, initialized] of the next initialized tick within one bitmap word, at or left of tick when lte
+def next_initialized_tick(tau_contract: str, token_contract: str, tick: int, lte: bool):
+    tick_next, initialized = next_initialized_tick_within_one_word(tau_contract, token_contract, tick, lte)
+    return [tick_next, initialized]
+
+@export
+def sqrt_ratio_at_tick(tick: int):
+    return get_sqrt_ratio_at_tick(tick)
+
+@export
+def tick_at_sqrt_ratio(sqrt_price_x96: int):
+    return get_tick_at_sqrt_ratio(sqrt_price_x96)
+
+@export
+# Position record of the pool as stored
+def get_position(tau_contract: str, token_contract: str, owner_address: str, tick_lower: int, tick_upper: int):
+    return positions[tau_contract, token_contract, owner_address, tick_lower, tick_upper]
@@ -3,6 +3,8 @@ I = importlib
 # Enforceable interface
 token_interface = [
     I.Func('transfer', args=('amount', 'to')),
+    I.Func('transfer_from', args=('amount', 'to', 'main_account')),
+    I.Func('approve', args=('amount', 'to')),
     I.Func('balance_of', args=('account',))
 ]
 
@@ -10,44 +12,112 @@ dex_interface = [
     I.Func('fee_to', args=())
 ]
 
-# LP Balance
-# balance = balance(tau_contract: str, token_contract: str, address: str)
-# Pair - Rserves
-# tau_reserve = pairs[tau_contract: str, token-contract: str, 'tau_reserve']
-# token_reserve = pairs[tau_contract: str, token-contract: str, 'token_reserve']
-
-# LP TOKENS STATE
-# LP Token totalSupply
-# lp_token_supply = pairs[tau_contract: str, token_contract: str, 'lp_token_supply']
-# LP Token kLast
-# lp_token_klast = pairs[tau_contract: str, token_contract: str, 'klast']
+# Flash swap receiver, UniswapV2 IUniswapV2Callee => uniswapV2Call
+callee_interface = [
+    I.Func('dex_pairs_call', args=('sender', 'tau_contract', 'token_contract', 'tau_out', 'token_out'))
+]
+
+# PAIR STATE - packed into a single record, one storage key per pair
+# pairs[tau_contract: str, token_contract: str] = [tau_reserve, token_reserve, lp_token_supply, kLast, last_update, price_tau_cumulative, price_token_cumulative]
+# Pair address
+# pair_address = pairs[tau_contract: str, token_contract: str, 'pair_address']
 # LP Token balance
-# lp_token_balance = pairs[tau_contract: str, token_contract: str, 'lp_token_balance', address:str]_
+# lp_token_balance = pairs[tau_contract: str, token_contract: str, 'lp_token_balance', address:str]
+# Price observations - first cumulative prices seen in each OBSERVATION_PERIOD
+# [timestamp, price_tau_cumulative, price_token_cumulative] = pairs[tau_contract: str, token_contract: str, 'observation', period: int]
 owner = Variable()
 pairs = Hash()
 
+# PAIR INDEX - append-only, written once at pair creation, index runs from 0 to pairs['count'] - 1
+# [tau_contract, token_contract] = all_pairs[index: int]
+all_pairs = Hash()
+
+# CANONICAL PAIR LOOKUP - keyed by the two contracts in sorted order, so either order resolves
+# to the pair as stored in a single read. Written once at pair creation
+# [tau_contract, token_contract] = pair_index[lower_contract: str, higher_contract: str]
+pair_index = Hash()
+
+# DEPOSIT LEDGER - tokens paid into a pair through deposit(), taken as input by its next mint_liquidity or swap
+# amount = deposits[tau_contract: str, token_contract: str, contract: str]
+# Deposits are also counted in pairs[contract, 'balance'], which tracks the total dex_pairs balance of each token
+deposits = Hash(default_value=0)
+
+# VALIDATED TOKEN REGISTRY - written once at pair creation
+# is_valid = tokens[token_contract: str]
+tokens = Hash(default_value=False)
+
+# EVENT LOG - append-only, one log per pair, stands in for UniV2 events (Mint, Burn, Swap, Sync)
+# Keyed per pair, so trades on different pairs don't all rewrite one global counter
+# events[tau_contract: str, token_contract: str, 'count'] = number of events the pair emitted
+# [event, sender, data: dict, timestamp] = events[tau_contract: str, token_contract: str, index: int]
+events = Hash(default_value=0)
+
 # TODO - Verifiy minimum liquidity
 MINIMUM_LIQUIDITY = pow(10,3)
 TOKEN_DECIMALS = 18
+# Decimal places ContractingDecimal values keep once written to state
+STORED_DECIMALS = 30
+
+# Pair record layout
+TAU_RESERVE = 0
+TOKEN_RESERVE = 1
+LP_TOKEN_SUPPLY = 2
+K_LAST = 3
+LAST_UPDATE = 4
+PRICE_TAU_CUMULATIVE = 5
+PRICE_TOKEN_CUMULATIVE = 6
+
+# Price oracle granularity, in seconds
+OBSERVATION_PERIOD = 60 * 60
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Largest page returned by get_pairs / get_pair_states
+MAX_PAGE_SIZE = 100
 
 # returns ContractingDecimal
 def expand_to_token_decimals(amount):
     return (amount / pow(10,TOKEN_DECIMALS)) * 1.0 # turn it into contracting decimal
 
-# babylonian method(https://en.wikipedia.org/wiki/Methods_of_computing_square_roots)
+# returns int - amount * 10^(2 * TOKEN_DECIMALS), scaled in steps so no
+# intermediate ContractingDecimal goes past its upper bound
+def expand_to_sqrt_domain(amount):
+    whole = int(amount)
+    fraction = (amount - whole) * pow(10,TOKEN_DECIMALS)
+    high = int(fraction)
+    low = int((fraction - high) * pow(10,TOKEN_DECIMALS))
+
+    return (whole * pow(10,TOKEN_DECIMALS) + high) * pow(10,TOKEN_DECIMALS) + low
+
+# UniswapV2Pair.sol => swap() balance adjusted K, compared on ints of amount * 10^(2 * TOKEN_DECIMALS) so no
+# ContractingDecimal rounding or MAX_DECIMAL clamp can let an under-paid swap through
+# Stored amounts are truncated to STORED_DECIMALS places, so a quoted input can arrive short by up to one stored
+# unit - each balance gets that unit back, the smallest amount a token can move, like the wei of UniswapV2
+def assert_k(tau_balance, token_balance, tau_in, token_in, tau_reserve, token_reserve):
+    unit = pow(10, 2 * TOKEN_DECIMALS - STORED_DECIMALS)
+    tau_balance_adjusted = (expand_to_sqrt_domain(tau_balance) + unit) * 1000 - expand_to_sqrt_domain(tau_in) * 3
+    token_balance_adjusted = (expand_to_sqrt_domain(token_balance) + unit) * 1000 - expand_to_sqrt_domain(token_in) * 3
+    k = expand_to_sqrt_domain(tau_reserve) * expand_to_sqrt_domain(token_reserve)
+    assert tau_balance_adjusted * token_balance_adjusted >= k * pow(1000, 2), 'UniswapV2: K'
+
+# integer newton method(https://en.wikipedia.org/wiki/Integer_square_root)
+# Starts above the root from the bit length, so it only ever decreases and returns the exact floor root.
+# Bounded: ~log2(bit_length) steps, 9 for any product of two ContractingDecimal amounts
+def isqrt(n) :
+    if (n < 2) :
+        return n
+
+    x = pow(2, (n.bit_length() + 1) // 2)
+    y = (x + n // x) // 2
+    while (y < x):
+        x = y
+        y = (x + n // x) // 2
+
+    return x
+
+# returns ContractingDecimal - floor root at TOKEN_DECIMALS precision
 # Basic validation against sqrt of: 2,4,6,9
 def sqrt(y) :
-    z = None
-    if (y > 3) :
-        z = y
-        x = y / 2 + 1
-        while (x < z):
-            z = x
-            x = (y / x + x) / 2
-    elif (y != 0) :
-        z = 1
-
-    return z * 1.0 # turn it into contracting decimal
+    return decimal(isqrt(expand_to_sqrt_domain(y))) / pow(10,TOKEN_DECIMALS)
 
 def get_dex_interface(dex_contract):
     dex = I.import_module(dex_contract)
@@ -66,6 +136,159 @@ def get_token_interface(tau_contract, token_contract):
 
     return tau, token
 
+# Get a token module, trusting the registry instead of enforcing the interface on every call
+# Tokens of pairs created before the registry get validated + registered on first use
+def get_validated_token(token_contract):
+    token = I.import_module(token_contract)
+    if not tokens[token_contract] :
+        assert I.enforce_interface(token, token_interface), 'Token contract does not meet the required interface'
+        tokens[token_contract] = True
+
+    return token
+
+# Pair handle - resolves the token modules and the canonical pair key once per exported call.
+# Internal helpers receive the handle instead of calling token_name() on every storage access.
+# The packed pair record is read once here, and written back once by update()
+# Prices are accumulated here, over the reserves as they were before this call
+# Contracts can be given in either order, the handle always holds the pair as stored - flipped tells
+# whether the caller asked in (token, tau) order, see orient()
+def get_pair_handle(tau_contract, token_contract):
+    assert tau_contract != token_contract
+    entry, state = resolve_pair(tau_contract, token_contract)
+    state[PRICE_TAU_CUMULATIVE], state[PRICE_TOKEN_CUMULATIVE] = cumulative_prices(state)
+    state[LAST_UPDATE] = now
+    tau = get_validated_token(entry[0])
+    token = get_validated_token(entry[1])
+
+    return {
+        'tau_contract': entry[0],
+        'token_contract': entry[1],
+        'flipped': entry[0] != tau_contract,
+        'tau': tau,
+        'token': token,
+        'state': state
+    }
+
+# Puts a (tau, token) pair of amounts in the caller's order, or back in the stored order
+def orient(pair, tau_amount, token_amount):
+    if pair['flipped'] :
+        return token_amount, tau_amount
+
+    return tau_amount, token_amount
+
+# Returns [tau_contract, token_contract] of the pair between two contracts, in either order, or None
+def find_pair(contract_a, contract_b):
+    if contract_a < contract_b :
+        entry = pair_index[contract_a, contract_b]
+    else :
+        entry = pair_index[contract_b, contract_a]
+
+    if entry is None :
+        # Pairs created before the lookup was introduced are only found by probing both orders
+        if not pairs[contract_a, contract_b, 'pair_address'] is None :
+            entry = [contract_a, contract_b]
+        elif not pairs[contract_b, contract_a, 'pair_address'] is None :
+            entry = [contract_b, contract_a]
+
+    return entry
+
+# Swaps the tau and token fields of a pair record, for callers asking in (token, tau) order
+def flip_pair_state(state):
+    state = list(state)
+    state[TAU_RESERVE], state[TOKEN_RESERVE] = state[TOKEN_RESERVE], state[TAU_RESERVE]
+    state[PRICE_TAU_CUMULATIVE], state[PRICE_TOKEN_CUMULATIVE] = state[PRICE_TOKEN_CUMULATIVE], state[PRICE_TAU_CUMULATIVE]
+
+    return state
+
+# Returns a copy of the packed pair record, so callers can modify it before writing it back
+def load_pair_state(tau_contract, token_contract):
+    return copy_pair_state(pairs[tau_contract, token_contract])
+
+def copy_pair_state(state):
+    assert not state is None, 'Invalid pair'
+    # Pairs created before the packed layout still hold the list of field names
+    assert not isinstance(state[TAU_RESERVE], str), 'Pair needs to be migrated'
+
+    return list(state)
+
+# Resolves the pair between two contracts given in either order - returns [tau_contract, token_contract]
+# as stored, and a copy of its packed record. The stored order takes the same single read as load_pair_state,
+# the other order adds the pair_index lookup of find_pair
+def resolve_pair(contract_a, contract_b):
+    entry = [contract_a, contract_b]
+    state = pairs[contract_a, contract_b]
+    if state is None :
+        entry = find_pair(contract_a, contract_b)
+        assert not entry is None, 'Invalid pair'
+        state = pairs[entry[0], entry[1]]
+
+    return entry, copy_pair_state(state)
+
+# UniswapV2Pair.sol => _update() price accumulators
+# Returns the cumulative prices as of now: each price multiplied by the seconds it held, summed.
+# tau price is quoted in token, token price is quoted in tau
+def cumulative_prices(state):
+    price_tau_cumulative = state[PRICE_TAU_CUMULATIVE]
+    price_token_cumulative = state[PRICE_TOKEN_CUMULATIVE]
+
+    elapsed = (now - state[LAST_UPDATE]).seconds
+    if elapsed > 0 and state[TAU_RESERVE] > 0 and state[TOKEN_RESERVE] > 0 :
+        price_tau_cumulative += (state[TOKEN_RESERVE] * 1.0 / state[TAU_RESERVE]) * elapsed # turn it into contracting decimal
+        price_token_cumulative += (state[TAU_RESERVE] * 1.0 / state[TOKEN_RESERVE]) * elapsed
+
+    return price_tau_cumulative, price_token_cumulative
+
+def observation_period(timestamp_seconds):
+    return timestamp_seconds // OBSERVATION_PERIOD
+
+def seconds_since_epoch(timestamp):
+    return (timestamp - EPOCH).seconds
+
+# Keeps the first observation of each period, so consult() can find a window start with a single read
+def record_observation(tau_contract, token_contract, price_tau_cumulative, price_token_cumulative):
+    period = observation_period(seconds_since_epoch(now))
+    if pairs[tau_contract, token_contract, 'observation', period] is None :
+        pairs[tau_contract, token_contract, 'observation', period] = [now, price_tau_cumulative, price_token_cumulative]
+
+# [tau_contract, token_contract] of the pairs in creation order, from offset up to offset + limit
+# Pairs created before the index was introduced have no entry until backfill_pair, and are skipped
+def list_pairs(offset, limit):
+    assert offset >= 0, 'Invalid offset'
+    assert limit > 0 and limit <= MAX_PAGE_SIZE, 'Limit must be between 1 and {}'.format(MAX_PAGE_SIZE)
+
+    entries = []
+    for index in range(offset, min(offset + limit, pairs['count'])):
+        entry = all_pairs[index]
+        if not entry is None :
+            entries.append(entry)
+
+    return entries
+
+# Snapshot of a pair, as returned by get_pair_state/get_pair_states - in the requested order
+def describe_pair(tau_contract, token_contract, fee_on, account):
+    entry, state = resolve_pair(tau_contract, token_contract)
+    if entry[0] != tau_contract :
+        state = flip_pair_state(state)
+
+    return {
+        'tau_contract': tau_contract,
+        'token_contract': token_contract,
+        'pair_address': pairs[entry[0], entry[1], 'pair_address'],
+        'tau_reserve': state[TAU_RESERVE],
+        'token_reserve': state[TOKEN_RESERVE],
+        'lp_token_supply': state[LP_TOKEN_SUPPLY],
+        'kLast': state[K_LAST],
+        'last_update': state[LAST_UPDATE],
+        'price_tau_cumulative': state[PRICE_TAU_CUMULATIVE],
+        'price_token_cumulative': state[PRICE_TOKEN_CUMULATIVE],
+        'fee_on': fee_on,
+        'lp_token_balance': pairs[entry[0], entry[1], 'lp_token_balance', account]
+    }
+
+# Fees are on when the owning dex has a fee_to address set
+def is_fee_on():
+    return get_dex_interface(owner.get()).fee_to() != zero_address()
+
 # TODO - A2 - Implement Jeff's "Valid Hex Address"
 # Get zero address
 def zero_address():
@@ -96,26 +319,144 @@ def zero_address():
 #
 #     return tau_out, token_out, tau_slippage, token_slippage
 
-# From UniV2Pair.sol
-def update(tau, token, pair_tau_balance, pair_token_balance):
-    pairs[tau.token_name(), 'balance'] = tau.balance_of(ctx.this)
-    pairs[token.token_name(), 'balance'] = token.balance_of(ctx.this)
+# Input paid into the pair since the last update - its ledger deposits, plus tokens transferred straight to
+# dex_pairs, picked up with one balance_of read. Transfers are shared by every pair of the token, and go to
+# whichever pair reads them first. Deposits are already in the tracked balance, so they are never counted twice
+def collect_input(pair, contract, token):
+    deposited = deposits[pair['tau_contract'], pair['token_contract'], contract]
+    if deposited > 0 :
+        deposits[pair['tau_contract'], pair['token_contract'], contract] = 0
+
+    tracked = pairs[contract, 'balance']
+    balance = token.balance_of(ctx.this)
+    if balance != tracked :
+        pairs[contract, 'balance'] = balance
+
+    return deposited + balance - tracked
+
+# Transfers out of dex_pairs, keeping the tracked balance in step without reading it back
+def send(contract, token, amount, to_address):
+    token.transfer(amount, to_address)
+    pairs[contract, 'balance'] -= amount
+
+# Pays a swap output to to_address, or with to_pair credits it to that pair's deposit ledger - the tokens stay
+# in dex_pairs, so the next pair of a route takes them as input without a transfer out and back in
+def pay_out(contract, token, amount, to_address, to_pair):
+    if to_pair is None :
+        send(contract, token, amount, to_address)
+        return
+
+    entry = find_pair(to_pair[0], to_pair[1])
+    assert not entry is None, 'Invalid pair'
+    assert contract == entry[0] or contract == entry[1], 'Token is not part of the pair'
+    deposits[entry[0], entry[1], contract] += amount
+
+# Hands the optimistically sent outputs to the callee. The pair must not be touched while the callee runs,
+# swap() would overwrite whatever a nested mint/burn/swap of the same pair stored, so that fails the transaction
+def flash_swap_call(pair, callee_contract, tau_out, token_out):
+    callee = I.import_module(callee_contract)
+    assert I.enforce_interface(callee, callee_interface), 'Callee contract does not meet the required interface'
+
+    stored = pairs[pair['tau_contract'], pair['token_contract']]
+    callee.dex_pairs_call(ctx.caller, pair['tau_contract'], pair['token_contract'], tau_out, token_out)
+    assert pairs[pair['tau_contract'], pair['token_contract']] == stored, 'LamDexPairs: LOCKED'
 
-    pairs[tau.token_name(), token.token_name(), 'tau_reserve'] = pair_tau_balance
-    pairs[tau.token_name(), token.token_name(), 'token_reserve'] = pair_token_balance
+# From UniV2Pair.sol
+# Single write of the packed pair record, tracked token balances are kept by collect_input() and send()
+def update(pair, pair_tau_balance, pair_token_balance):
+    store_pair_state(pair, pair_tau_balance, pair_token_balance)
+
+# Events buffered by the caller are logged ahead of the Sync, with the same single count update
+def store_pair_state(pair, tau_reserve, token_reserve, pending=None):
+    state = pair['state']
+    state[TAU_RESERVE] = tau_reserve
+    state[TOKEN_RESERVE] = token_reserve
+    state[LAST_UPDATE] = now
+    pairs[pair['tau_contract'], pair['token_contract']] = state
+    record_observation(pair['tau_contract'], pair['token_contract'], state[PRICE_TAU_CUMULATIVE], state[PRICE_TOKEN_CUMULATIVE])
+
+    entries = pending if not pending is None else []
+    entries.append(event_entry('Sync', {
+        'tau_reserve': tau_reserve,
+        'token_reserve': token_reserve
+    }))
+    emit_all(pair, entries)
+
+# [event, sender, data: dict, timestamp], as stored in the event log
+def event_entry(event, data):
+    return [event, ctx.caller, data, now]
+
+# Appends to the pair's event log, read by offchain/indexer.py
+def emit(event, pair, data):
+    emit_all(pair, [event_entry(event, data)])
+
+# Appends entries in order with one read and one write of the pair's count
+def emit_all(pair, entries):
+    index = events[pair['tau_contract'], pair['token_contract'], 'count']
+    for entry in entries:
+        events[pair['tau_contract'], pair['token_contract'], index] = entry
+        index += 1
+
+    events[pair['tau_contract'], pair['token_contract'], 'count'] = index
+
+# UniswapV2Library.sol => getAmountIn
+# given an output amount of an asset and pair reserves, returns the required input amount of the other asset
+def get_amount_in(amount_out, reserve_in, reserve_out):
+    assert amount_out > 0, 'Insufficient output amount'
+    assert reserve_in > 0 and reserve_out > amount_out, 'Insufficient liquidity'
+
+    return (reserve_in * amount_out * 1000 * 1.0) / ((reserve_out - amount_out) * 997) # turn it into contracting decimal
+
+# Per-token bookkeeping for swap_batch - balances are read once per token, and written once at the end
+def get_batch_token(batch_tokens, token_contract, token):
+    entry = batch_tokens.get(token_contract)
+    if entry is None :
+        entry = {
+            'token': token,
+            'tracked': pairs[token_contract, 'balance'],
+            'deposited': None,
+            'spent': 0,
+            'sent': 0
+        }
+        batch_tokens[token_contract] = entry
+
+    return entry
+
+# Draw a leg's input from the pair's ledger deposit first, then from what was transferred to dex_pairs since the
+# last update. The ledger is read once per touched pair and token, the balance once per token
+def spend_batch_input(pair, contract, entry, amount):
+    ledger = pair['deposits']
+    if not contract in ledger :
+        ledger[contract] = deposits[pair['tau_contract'], pair['token_contract'], contract]
+        if ledger[contract] > 0 :
+            deposits[pair['tau_contract'], pair['token_contract'], contract] = 0
+
+    from_ledger = min(ledger[contract], amount)
+    ledger[contract] -= from_ledger
+    amount -= from_ledger
+    if amount <= 0 :
+        return
+
+    if entry['deposited'] is None :
+        # outputs already sent during this batch reduced the balance, add them back
+        entry['deposited'] = entry['token'].balance_of(ctx.this) + entry['sent'] - entry['tracked']
+
+    assert entry['deposited'] - entry['spent'] >= amount, 'UniswapV2: Insufficient Input Amount'
+    entry['spent'] += amount
 
 # TODO - A1 - VALIDATE IMPLEMENTATION
 # Currency/Pair Fn - Internal Interface
-def mint_lp_tokens(tau, token, to_address, amount) :
+# LP Token supply lives in the pair record, it gets stored by update()
+def mint_lp_tokens(pair, to_address, amount) :
     assert not to_address is None, 'Invalid Address {}'.format(to_address)
     assert isinstance(to_address, str), 'Invalid type {}'.format(to_address)
 
     # Increase LP Token supply
-    pairs[tau.token_name(), token.token_name(), 'lp_token_supply'] += amount
+    pair['state'][LP_TOKEN_SUPPLY] += amount
 
     # Increase Acct LP Token balance
-    lp_token_balance = pairs[tau.token_name(), token.token_name(), 'lp_token_balance', to_address]
-    pairs[tau.token_name(), token.token_name(), 'lp_token_balance', to_address] = lp_token_balance + amount if not lp_token_balance is None else amount
+    lp_token_balance = pairs[pair['tau_contract'], pair['token_contract'], 'lp_token_balance', to_address]
+    pairs[pair['tau_contract'], pair['token_contract'], 'lp_token_balance', to_address] = lp_token_balance + amount if not lp_token_balance is None else amount
 
     # return new supply, and balance
     #emit Transfer(address_zero(), to, amount)
@@ -123,27 +464,29 @@ def mint_lp_tokens(tau, token, to_address, amount) :
 
 # TODO - A1 - VALIDATE IMPLEMENTATION/SECURITY
 # Currency/Pair Fn - Internal Interface
-def burn_lp_tokens(tau, token, from_address, amount) :
+# LP Token supply lives in the pair record, it gets stored by update()
+def burn_lp_tokens(pair, from_address, amount) :
     # Decrease LP Token supply
-    pairs[tau.token_name(), token.token_name(), 'lp_token_supply'] -= amount
+    pair['state'][LP_TOKEN_SUPPLY] -= amount
 
     # Decrease Acct LP Token balance
-    lp_token_balance = pairs[tau.token_name(), token.token_name(), 'lp_token_balance', from_address]
-    pairs[tau.token_name(), token.token_name(), 'lp_token_balance', from_address] = lp_token_balance - amount
+    lp_token_balance = pairs[pair['tau_contract'], pair['token_contract'], 'lp_token_balance', from_address] - amount
+    pairs[pair['tau_contract'], pair['token_contract'], 'lp_token_balance', from_address] = lp_token_balance
 
     # return new supply, and balance
     # emit Transfer(address_zero(), to, amount)
-    return pairs[tau.token_name(), token.token_name(), 'lp_token_supply'], pairs[tau.token_name(), token.token_name(), 'lp_token_balance', from_address]
+    return pair['state'][LP_TOKEN_SUPPLY], lp_token_balance
 
 # TODO - A1 - VALIDATE IMPLEMENTATION/SECURITY
 # DONE - PORTED + REVIEWED
 # UniswapV2Pai.sol => _mintFee()
-def mint_fee(dex, tau, token, tau_reserve, token_reserve):
-    lp_token_supply = pairs[tau.token_name(), token.token_name(), 'lp_token_supply']
+def mint_fee(dex, pair, tau_reserve, token_reserve):
+    state = pair['state']
+    lp_token_supply = state[LP_TOKEN_SUPPLY]
 
     fee_to = dex.fee_to()
     fee_on = fee_to != zero_address() # make sure we're not burning the fee?
-    kLast = pairs[tau.token_name(), token.token_name(), 'kLast'] # "gas savings"
+    kLast = state[K_LAST] # "gas savings"
     if(fee_on) :
         if(kLast != 0) :
             rootK = sqrt(tau_reserve * token_reserve)
@@ -153,9 +496,9 @@ def mint_fee(dex, tau, token, tau_reserve, token_reserve):
                 denominator = (rootK * 5) + rootKLast
                 liquidity = numerator / denominator
                 if(liquidity > 0):
-                    mint_lp_tokens(tau, token, fee_to, liquidity)
+                    mint_lp_tokens(pair, fee_to, liquidity)
     elif(kLast != 0) :
-        pairs[tau.token_name(), token.token_name(), 'kLast'] = 0
+        state[K_LAST] = 0
 
     return fee_on, fee_to
 
@@ -165,43 +508,80 @@ def seed(owner_address: str):
     pairs['count'] = 0
 
 @export
+# Pair record in the requested order, either order finds the pair
 def pair(tau_contract: str, token_contract: str):
-    return pairs[tau_contract, token_contract]
+    entry = find_pair(tau_contract, token_contract)
+    if entry is None :
+        return None
+
+    state = pairs[entry[0], entry[1]]
+    return state if entry[0] == tau_contract else flip_pair_state(state)
+
+@export
+# Resolves the pair between two contracts in a single call, in either order
+# Returns [tau_contract, token_contract, reserve_a, reserve_b] - the pair as stored, reserves in the requested order
+def get_pair(contract_a: str, contract_b: str):
+    entry = find_pair(contract_a, contract_b)
+    assert not entry is None, 'Invalid pair'
+
+    state = load_pair_state(entry[0], entry[1])
+    if entry[0] == contract_a :
+        return [entry[0], entry[1], state[TAU_RESERVE], state[TOKEN_RESERVE]]
+
+    return [entry[0], entry[1], state[TOKEN_RESERVE], state[TAU_RESERVE]]
 
 @export
 # Number of pairs created
 def length_pairs():
     return pairs['count']
 
+@export
+# Number of all_pairs indexes, UniswapV2Factory.sol => allPairsLength()
+def all_pairs_length():
+    return pairs['count']
+
+@export
+# Pairs in creation order, at most MAX_PAGE_SIZE per call
+def get_pairs(offset:int, limit:int):
+    return list_pairs(offset, limit)
+
+@export
+def is_valid_token(token_contract: str):
+    return tokens[token_contract]
+
 @export
 def pair_address(tau_contract: str, token_contract: str):
-    assert not pairs[tau_contract, token_contract] is None, 'Invalid pair'
-    return pairs[tau_contract, token_contract, 'pair_address']
+    entry, state = resolve_pair(tau_contract, token_contract)
+    return pairs[entry[0], entry[1], 'pair_address']
 
 @export
 def total_supply(tau_contract:str, token_contract:str):
-    assert not pairs[tau_contract, token_contract] is None, 'Invalid pair'
-    return pairs[tau_contract, token_contract, 'lp_token_supply']
+    entry, state = resolve_pair(tau_contract, token_contract)
+    return state[LP_TOKEN_SUPPLY]
 
 @export
 def initialize(tau_contract:str, token_contract:str):
     assert tau_contract != token_contract
     assert ctx.caller == owner.get(), 'LamDexPairs: FORBIDDEN'
+    assert find_pair(tau_contract, token_contract) is None, 'Market already exists!'
 
-    # Pair Balances
-    pairs[tau_contract, token_contract] = ['pair_address', 'tau_reserve', 'token_reserve', 'lp_token_supply', 'kLast', 'lp_token_balance']
+    # Pair State
+    pairs[tau_contract, token_contract] = [0, 0, 0, 0, now, 0, 0]
+
+    if tau_contract < token_contract :
+        pair_index[tau_contract, token_contract] = [tau_contract, token_contract]
+    else :
+        pair_index[token_contract, tau_contract] = [tau_contract, token_contract]
 
     pair_address = hashlib.sha256(tau_contract + token_contract)
     pairs[tau_contract, token_contract, 'pair_address'] = pair_address
-    pairs[tau_contract, token_contract, 'tau_reserve'] = 0
-    pairs[tau_contract, token_contract, 'token_reserve'] = 0
-    pairs[tau_contract, token_contract, 'lp_token_supply'] = 0
-    pairs[tau_contract, token_contract, 'lp_token_balance'] = {}
-    pairs[tau_contract, token_contract, 'kLast'] = 0
+    all_pairs[pairs['count']] = [tau_contract, token_contract]
     pairs['count'] += 1
 
     # Token Balances
     tau, token = get_token_interface(tau_contract, token_contract)
+    tokens[tau_contract] = True
+    tokens[token_contract] = True
 
     if pairs[tau_contract, 'balance'] is None :
         pairs[tau_contract, 'balance'] = tau.balance_of(ctx.this)
@@ -209,25 +589,134 @@ def initialize(tau_contract:str, token_contract:str):
     if pairs[token_contract, 'balance'] is None :
         pairs[token_contract, 'balance'] = token.balance_of(ctx.this)
 
+# Moves a pair created with the per-field key layout into the packed pair record
+# LP Token balances keep their keys, the legacy per-field keys are cleared. Owner only, reached through dex.migrate_pair
+@export
+def migrate_pair(tau_contract:str, token_contract:str):
+    assert ctx.caller == owner.get(), 'LamDexPairs: FORBIDDEN'
+
+    state = pairs[tau_contract, token_contract]
+    assert not state is None, 'Invalid pair'
+    assert isinstance(state[TAU_RESERVE], str), 'Pair already migrated'
+
+    pairs[tau_contract, token_contract] = [
+        pairs[tau_contract, token_contract, 'tau_reserve'],
+        pairs[tau_contract, token_contract, 'token_reserve'],
+        pairs[tau_contract, token_contract, 'lp_token_supply'],
+        pairs[tau_contract, token_contract, 'kLast'],
+        now,
+        0,
+        0
+    ]
+
+    pairs[tau_contract, token_contract, 'tau_reserve'] = None
+    pairs[tau_contract, token_contract, 'token_reserve'] = None
+    pairs[tau_contract, token_contract, 'lp_token_supply'] = None
+    pairs[tau_contract, token_contract, 'lp_token_balance'] = None
+    pairs[tau_contract, token_contract, 'kLast'] = None
+
+# Indexes a pair created before all_pairs / pair_index were introduced, under the index it was created with
+# Can be repeated, pairs that are already indexed are left as they are. Owner only, reached through dex.backfill_pair
 @export
-def pair_address(tau_contract:str, token_contract:str):
-    assert not pairs[tau_contract, token_contract] is None, 'Invalid pair'
-    return pairs[tau_contract, token_contract, 'pair_address']
+def backfill_pair(index:int, tau_contract:str, token_contract:str):
+    assert ctx.caller == owner.get(), 'LamDexPairs: FORBIDDEN'
+    assert not pairs[tau_contract, token_contract, 'pair_address'] is None, 'Invalid pair'
+    assert index >= 0 and index < pairs['count'], 'Invalid index'
+
+    entry = all_pairs[index]
+    if entry is None :
+        all_pairs[index] = [tau_contract, token_contract]
+    else :
+        assert entry[0] == tau_contract and entry[1] == token_contract, 'Index already taken'
+
+    if tau_contract < token_contract :
+        if pair_index[tau_contract, token_contract] is None :
+            pair_index[tau_contract, token_contract] = [tau_contract, token_contract]
+    elif pair_index[token_contract, tau_contract] is None :
+        pair_index[token_contract, tau_contract] = [tau_contract, token_contract]
 
 @export
-# Returns the total reserves from each tau/token
+# Returns the total reserves from each tau/token, in the requested order
 def get_pair_reserves(tau_contract:str, token_contract:str):
-    return pairs[tau_contract, token_contract, 'tau_reserve'], \
-            pairs[tau_contract, token_contract, 'token_reserve']
+    pair = get_pair(tau_contract, token_contract)
+    return pair[2], pair[3]
+
+@export
+# Reserves, LP supply, kLast, fee flag and the caller's LP balance in a single read
+def get_pair_state(tau_contract:str, token_contract:str):
+    return describe_pair(tau_contract, token_contract, is_fee_on(), ctx.caller)
+
+@export
+# Pair snapshots in creation order, at most MAX_PAGE_SIZE per call
+def get_pair_states(offset:int, limit:int):
+    fee_on = is_fee_on()
+    states = []
+    for entry in list_pairs(offset, limit):
+        states.append(describe_pair(entry[0], entry[1], fee_on, ctx.caller))
+
+    return states
+
+# Keeper entry point - records an observation for the current period without trading,
+# so quiet pairs still have a window start for consult()
+@export
+def observe(tau_contract:str, token_contract:str):
+    entry, state = resolve_pair(tau_contract, token_contract)
+    price_tau_cumulative, price_token_cumulative = cumulative_prices(state)
+    record_observation(entry[0], entry[1], price_tau_cumulative, price_token_cumulative)
+
+# Time weighted average prices over about the last window_seconds - (tau price in token, token price in tau, seconds)
+# Reads the pair record and the observation of the period the window starts in: O(1) for any window.
+# The average runs from that observation to now. The observation can be taken anywhere in its period, so the
+# window actually averaged is up to OBSERVATION_PERIOD longer or shorter than requested - its length is returned
+# Prices come back in the requested order
+@export
+def consult(tau_contract:str, token_contract:str, window_seconds:int):
+    assert window_seconds > 0, 'Invalid window'
+    entry, state = resolve_pair(tau_contract, token_contract)
+
+    period = observation_period(seconds_since_epoch(now) - window_seconds)
+    observation = pairs[entry[0], entry[1], 'observation', period]
+    assert not observation is None, 'Missing historical observation'
+
+    elapsed = (now - observation[0]).seconds
+    assert elapsed > 0, 'Window too short'
+
+    price_tau_cumulative, price_token_cumulative = cumulative_prices(state)
+    tau_twap = (price_tau_cumulative - observation[1]) / elapsed
+    token_twap = (price_token_cumulative - observation[2]) / elapsed
+    if entry[0] != tau_contract :
+        return token_twap, tau_twap, elapsed
+
+    return tau_twap, token_twap, elapsed
+
+# Pays amount of contract from the caller into the pair's deposit ledger, so routers can fund a mint_liquidity
+# or swap within the same transaction without the pair reading token balances
+# The caller has to approve dex_pairs for amount first, contracts pull from their own caller and approve in turn
+@export
+def deposit(tau_contract:str, token_contract:str, contract:str, amount:float):
+    assert amount > 0, 'Cannot send negative balances!'
+    assert contract == tau_contract or contract == token_contract, 'Token is not part of the pair'
+    entry, state = resolve_pair(tau_contract, token_contract)
+
+    get_validated_token(contract).transfer_from(amount=amount, to=ctx.this, main_account=ctx.caller)
+    deposits[entry[0], entry[1], contract] += amount
+    pairs[contract, 'balance'] += amount
+
+@export
+# Ledger amount waiting to be taken by the pair's next mint_liquidity or swap
+def deposit_of(tau_contract:str, token_contract:str, contract:str):
+    entry, state = resolve_pair(tau_contract, token_contract)
+    return deposits[entry[0], entry[1], contract]
 
 @export
 def balance_of(tau_contract:str, token_contract:str, account:str):
-    assert not pairs[tau_contract, token_contract] is None, 'Invalid pair'
-    return pairs[tau_contract, token_contract, 'lp_token_balance', account]
+    entry, state = resolve_pair(tau_contract, token_contract)
+    return pairs[entry[0], entry[1], 'lp_token_balance', account]
 
 @export
 def transfer(tau_contract:str, token_contract:str, amount:int, to:str):
-    assert not pairs[tau_contract, token_contract] is None, 'Invalid pair'
+    entry, state = resolve_pair(tau_contract, token_contract)
+    tau_contract, token_contract = entry
     assert amount > 0, 'Cannot send negative balances!'
 
     sender = ctx.caller
@@ -250,39 +739,34 @@ def transfer(tau_contract:str, token_contract:str, amount:int, to:str):
 @export
 def mint_liquidity(dex_contract:str, tau_contract:str, token_contract: str, to_address: str):
     # Make sure that what is imported is actually a valid token
-    tau, token = get_token_interface(tau_contract, token_contract)
-    assert tau_contract != token_contract
+    pair = get_pair_handle(tau_contract, token_contract)
+    tau = pair['tau']
+    token = pair['token']
+    state = pair['state']
 
     dex = get_dex_interface(dex_contract)
     assert not dex is None, 'Dex needs to be valid'
 
     # 1 - Last pair reserves
-    tau_reserve, token_reserve = get_pair_reserves(tau_contract=tau_contract,token_contract=token_contract) # "gas savings"
-
-    # 2 - Last total balances
-    last_total_tau_balance = pairs[tau_contract, 'balance']
-    last_total_token_balance = pairs[token_contract, 'balance']
-
-    # New total balances - token.balance()
-    new_total_tau_balance = tau.balance_of(ctx.this)
-    new_total_token_balance = token.balance_of(ctx.this)
+    tau_reserve = state[TAU_RESERVE] # "gas savings"
+    token_reserve = state[TOKEN_RESERVE]
 
-    # Amount delta
-    tau_amount = new_total_tau_balance - last_total_tau_balance
-    token_amount = new_total_token_balance - last_total_token_balance
+    # 2 - Amounts paid in since the last update
+    tau_amount = collect_input(pair, pair['tau_contract'], tau)
+    token_amount = collect_input(pair, pair['token_contract'], token)
 
     assert tau_amount > 0 and token_amount > 0, 'Invalid token amount'
 
     # TODO - fee_on
     liquidity = None
-    fee_on = mint_fee(dex, tau, token, tau_reserve, token_reserve)
-    lp_token_supply = pairs[tau.token_name(), token.token_name(), 'lp_token_supply'] # "gas savings"
+    fee_on, fee_to = mint_fee(dex, pair, tau_reserve, token_reserve)
+    lp_token_supply = state[LP_TOKEN_SUPPLY] # "gas savings"
     if(lp_token_supply == 0 ) :
         # TODO - A4 - Migrator logic
         # Initial liquidity = SeedLiquidity - MinimumLiquidity
         liquidity = sqrt(tau_amount * token_amount) - expand_to_token_decimals(MINIMUM_LIQUIDITY)
         # permanently lock the first MINIMUM_LIQUIDITY tokens
-        mint_lp_tokens(tau, token, zero_address(), expand_to_token_decimals(MINIMUM_LIQUIDITY))
+        mint_lp_tokens(pair, zero_address(), expand_to_token_decimals(MINIMUM_LIQUIDITY))
     else :
         # Get new liquidity
         liquidity = min(
@@ -292,23 +776,28 @@ def mint_liquidity(dex_contract:str, tau_contract:str, token_contract: str, to_a
 
     # Assign LP Tokens to provider
     assert liquidity > 0, 'Insufficient liquidity minted'
-    mint_lp_tokens(tau, token, to_address, liquidity)
+    mint_lp_tokens(pair, to_address, liquidity)
 
     new_tau_reserve = tau_reserve + tau_amount
     new_token_reserve = token_reserve + token_amount
+
+    if(fee_on) :
+        # Update kLast to calculate fees
+        state[K_LAST] = new_tau_reserve * new_token_reserve
+
     # Update Pair internal state
     update(
-        tau,
-        token,
+        pair,
         new_tau_reserve,
         new_token_reserve
     )
 
-    if(fee_on) :
-        # Update kLast to calculate fees
-        pairs[tau_contract, token_contract, 'kLast'] = new_tau_reserve * new_token_reserve
-
-    #emit Mint(ctx.signer, tau_amount, token_amount)
+    emit('Mint', pair, {
+        'tau_amount': tau_amount,
+        'token_amount': token_amount,
+        'to_address': to_address
+    })
+    tau_amount, token_amount = orient(pair, tau_amount, token_amount)
     return to_address, tau_amount, token_amount
 
 
@@ -318,109 +807,196 @@ def mint_liquidity(dex_contract:str, tau_contract:str, token_contract: str, to_a
 @export
 def burn_liquidity(dex_contract: str, tau_contract: str, token_contract: str, to_address: str):
     # Make sure that what is imported is actually a valid token
-    tau, token = get_token_interface(tau_contract, token_contract)
-    assert tau_contract != token_contract
+    pair = get_pair_handle(tau_contract, token_contract)
+    tau = pair['tau']
+    token = pair['token']
+    state = pair['state']
 
     dex = get_dex_interface(dex_contract)
     assert not dex is None, 'Dex needs to be valid'
 
-    tau_reserve, token_reserve = get_pair_reserves(tau_contract=tau_contract,token_contract=token_contract) # "gas savings"
-
-    # 2 - Get Pair's balance
-    last_total_tau_balance = pairs[tau_contract, 'balance']
-    last_total_token_balance = pairs[token_contract, 'balance']
-
-    # new total balances (new)
-    current_total_tau_balance = tau.balance_of(ctx.this)
-    current_total_token_balance = token.balance_of(ctx.this)
+    # 2 - Pair's balance - pending deposits are left for the pair's next mint or swap
+    tau_reserve = state[TAU_RESERVE] # "gas savings"
+    token_reserve = state[TOKEN_RESERVE]
 
-    pair_tau_balance = tau_reserve + (current_total_tau_balance - last_total_tau_balance)
-    pair_token_balance = token_reserve + (current_total_token_balance - last_total_token_balance)
-
-    lp_token_liquidity = balance_of(tau.token_name(), token.token_name(), ctx.this)
+    lp_token_liquidity = pairs[pair['tau_contract'], pair['token_contract'], 'lp_token_balance', ctx.this]
 
     # We update how to handle fees, before updating liquidity
-    fee_on = mint_fee(dex, tau, token, tau_reserve, token_reserve)
-    lp_token_supply = pairs[tau.token_name(), token.token_name(), 'lp_token_supply']
+    fee_on, fee_to = mint_fee(dex, pair, tau_reserve, token_reserve)
+    lp_token_supply = state[LP_TOKEN_SUPPLY]
 
-    tau_amount = (lp_token_liquidity * pair_tau_balance) / lp_token_supply # using balances ensures pro-rata distribution
-    token_amount = (lp_token_liquidity * pair_token_balance) / lp_token_supply # using balances ensures pro-rata distribution
+    tau_amount = (lp_token_liquidity * tau_reserve) / lp_token_supply
+    token_amount = (lp_token_liquidity * token_reserve) / lp_token_supply
     assert tau_amount > 0 and token_amount > 0, 'Insufficient liquidity burned'
 
     # destroy lp tokens + return tokens
-    burn_lp_tokens(tau, token, ctx.this, lp_token_liquidity)
-    tau.transfer(tau_amount, to_address) # safe_transfer
-    token.transfer(token_amount, to_address) # safe_transfer
-
-    # Get new Dex balance
-    current_total_tau_balance = tau.balance_of(ctx.this)
-    current_total_token_balance = token.balance_of(ctx.this)
+    burn_lp_tokens(pair, ctx.this, lp_token_liquidity)
+    send(pair['tau_contract'], tau, tau_amount, to_address) # safe_transfer
+    send(pair['token_contract'], token, token_amount, to_address) # safe_transfer
 
-    pair_tau_balance = tau_reserve + (current_total_tau_balance - last_total_tau_balance)
-    pair_token_balance = token_reserve + (current_total_token_balance - last_total_token_balance)
+    pair_tau_balance = tau_reserve - tau_amount
+    pair_token_balance = token_reserve - token_amount
 
-    # Update Pair internal state
-    update(tau, token, pair_tau_balance, pair_token_balance)
     if(fee_on):
         # Update kLast to calculate fees
-        pairs[tau.token_name(), token.token_name(), 'kLast'] = pair_tau_balance * pair_token_balance
+        state[K_LAST] = pair_tau_balance * pair_token_balance
 
-    #emit Burn(ctx.signer, tau_amount, token_amount, to_address)
-    return tau_amount, token_amount
+    # Update Pair internal state
+    update(pair, pair_tau_balance, pair_token_balance)
+
+    emit('Burn', pair, {
+        'tau_amount': tau_amount,
+        'token_amount': token_amount,
+        'to_address': to_address
+    })
+    return orient(pair, tau_amount, token_amount)
 
-# TODO - B1/A5 - CallData / Emit Events
 # UniswapV2Pair.sol => swap()
 # This low-level function should be called from a contract which performs important safety checks
+# Flash swap - with a callee_contract, its dex_pairs_call() runs after the outputs were sent and before the input
+# is checked, so it can use them and pay back (transferred to dex_pairs or deposited) in the same transaction
+# With to_pair, given as [contract_a, contract_b] in either order, the output is credited to that pair's deposit
+# ledger instead of being sent, to_address is only recorded in the Swap event
 @export
-def swap(tau_contract:str,  token_contract:str, tau_out:float, token_out:float, to_address:str):
+def swap(tau_contract:str,  token_contract:str, tau_out:float, token_out:float, to_address:str, callee_contract:str=None, to_pair:list=None):
     assert not (tau_out > 0 and token_out > 0), 'Only one Coin Out allowed'
     assert tau_out > 0 or token_out > 0, 'Insufficient Ouput Amount'
 
     # Make sure that what is imported is actually a valid token
-    tau, token = get_token_interface(tau_contract, token_contract)
-    assert tau_contract != token_contract
-
-    tau_reserve, token_reserve = get_pair_reserves(
-        tau_contract=tau_contract,
-        token_contract=token_contract
-    )
+    # From here on contracts and amounts are in the stored order
+    pair = get_pair_handle(tau_contract, token_contract)
+    tau_contract = pair['tau_contract']
+    token_contract = pair['token_contract']
+    tau_out, token_out = orient(pair, tau_out, token_out)
+    tau = pair['tau']
+    token = pair['token']
+
+    tau_reserve = pair['state'][TAU_RESERVE]
+    token_reserve = pair['state'][TOKEN_RESERVE]
     assert tau_reserve > tau_out and token_reserve > token_out, 'UniswapV2: Insuficient Liquidity and Reserves'
 
     # optimistic transfer...
     if tau_out > 0 :
-        tau.transfer(tau_out, to_address)
+        pay_out(tau_contract, tau, tau_out, to_address, to_pair)
     if token_out > 0 :
-        token.transfer(token_out, to_address)
+        pay_out(token_contract, token, token_out, to_address, to_pair)
 
-    # Get new pair balances
-    last_total_tau_balance = pairs[tau_contract, 'balance']
-    last_total_token_balance = pairs[token_contract, 'balance']
-
-    current_total_tau_balance = tau.balance_of(ctx.this)
-    current_total_token_balance = token.balance_of(ctx.this)
+    # if (data.length > 0) IUniswapV2Callee(to).uniswapV2Call(msg.sender, amount0Out, amount1Out, data);
+    if not callee_contract is None :
+        flash_swap_call(pair, callee_contract, tau_out, token_out)
 
-    new_pair_tau_balance = tau_reserve + (current_total_tau_balance - last_total_tau_balance)
-    new_pair_token_balance = token_reserve + (current_total_token_balance - last_total_token_balance)
+    # Amounts paid in since the last update
+    tau_paid = collect_input(pair, tau_contract, tau)
+    token_paid = collect_input(pair, token_contract, token)
 
-    # TODO - B1 - Identify this call from UniV2
-    # if (data.length > 0) IUniswapV2Callee(to).uniswapV2Call(msg.sender, amount0Out, amount1Out, data);
+    # Get new pair balances
+    new_pair_tau_balance = tau_reserve + (tau_paid - tau_out)
+    new_pair_token_balance = token_reserve + (token_paid - token_out)
 
     # Calculate pair tau_in or token_in based on last/new balances
-    tau_in = new_pair_tau_balance - (tau_reserve - tau_out) if new_pair_tau_balance > tau_reserve else 0
-    token_in = new_pair_token_balance - (token_reserve - token_out) if new_pair_token_balance > token_reserve else 0
+    tau_in = new_pair_tau_balance - (tau_reserve - tau_out) if new_pair_tau_balance > tau_reserve - tau_out else 0
+    token_in = new_pair_token_balance - (token_reserve - token_out) if new_pair_token_balance > token_reserve - token_out else 0
     assert tau_in > 0 or token_in > 0, 'UniswapV2: Insufficient Input Amount tau_in: {} token_in: {}'.format(tau_in, token_in)
 
-    # # TODO - A1/A2 - Break down / understand Balance Adjusted K exception
-    # tau_balance_adjusted = (tau_balance*1000)-(tau_in*3)
-    # token_balance_adjusted = (token_balance*1000)-(token_in*3)
-    # assert tau_balance_adjusted * token_balance_adjusted >= (tau_reserve * token_reserve) * (1000^2), 'UniswapV2: Exception: K'
+    # The input has to cover the output plus the 0.3% fee
+    assert_k(new_pair_tau_balance, new_pair_token_balance, tau_in, token_in, tau_reserve, token_reserve)
 
     update(
-        tau,
-        token,
+        pair,
         new_pair_tau_balance,
         new_pair_token_balance
     )
 
-    # TODO - B2 - Event Emitters?
-    # emit Swap(msg.sender, amount0In, amount1In, amount0Out, amount1Out, to);
+    emit('Swap', pair, {
+        'tau_in': tau_in,
+        'token_in': token_in,
+        'tau_out': tau_out,
+        'token_out': token_out,
+        'to_address': to_address
+    })
+
+# Batched swap - legs are [tau_contract, token_contract, tau_out, token_out, to_address], applied in order.
+# Contracts can be given in either order, results are [tau_in, token_in, tau_out, token_out] in the leg's order.
+# Each leg takes exactly the input it needs (UniswapV2 getAmountIn, 0.3% fee) from its pair's ledger deposits, then
+# from the tokens transferred to dex_pairs before the call, and is held to the same balance adjusted K as swap().
+# As in swap(), a pair's ledger deposits are taken in full - what the legs don't spend is added to its reserves.
+# Pair state, ledger deposits and token balances are read once per touched pair/token, and written once at the end,
+# Swap events are logged with the pair's Sync in a single append. Any failing leg fails the whole batch
+@export
+def swap_batch(legs: list):
+    assert len(legs) > 0, 'No swaps provided'
+
+    batch_pairs = {}
+    batch_tokens = {}
+    results = []
+
+    for leg in legs:
+        tau_contract, token_contract, tau_out, token_out, to_address = leg
+        assert not (tau_out > 0 and token_out > 0), 'Only one Coin Out allowed'
+        assert tau_out > 0 or token_out > 0, 'Insufficient Ouput Amount'
+
+        pair_key = ':'.join(sorted([tau_contract, token_contract]))
+        pair = batch_pairs.get(pair_key)
+        if pair is None :
+            pair = get_pair_handle(tau_contract, token_contract)
+            pair['deposits'] = {}
+            pair['events'] = []
+            batch_pairs[pair_key] = pair
+
+        # Handles are shared by both orders, flipped is the order of this leg
+        pair['flipped'] = pair['tau_contract'] != tau_contract
+        tau_contract = pair['tau_contract']
+        token_contract = pair['token_contract']
+        tau_out, token_out = orient(pair, tau_out, token_out)
+
+        state = pair['state']
+        tau_reserve = state[TAU_RESERVE]
+        token_reserve = state[TOKEN_RESERVE]
+        assert tau_reserve > tau_out and token_reserve > token_out, 'UniswapV2: Insuficient Liquidity and Reserves'
+
+        tau_entry = get_batch_token(batch_tokens, tau_contract, pair['tau'])
+        token_entry = get_batch_token(batch_tokens, token_contract, pair['token'])
+
+        tau_in = 0
+        token_in = 0
+        if token_out > 0 :
+            tau_in = get_amount_in(token_out, tau_reserve, token_reserve)
+            spend_batch_input(pair, tau_contract, tau_entry, tau_in)
+            pair['token'].transfer(token_out, to_address)
+            token_entry['sent'] += token_out
+        else :
+            token_in = get_amount_in(tau_out, token_reserve, tau_reserve)
+            spend_batch_input(pair, token_contract, token_entry, token_in)
+            pair['tau'].transfer(tau_out, to_address)
+            tau_entry['sent'] += tau_out
+
+        state[TAU_RESERVE] = tau_reserve + tau_in - tau_out
+        state[TOKEN_RESERVE] = token_reserve + token_in - token_out
+        assert_k(state[TAU_RESERVE], state[TOKEN_RESERVE], tau_in, token_in, tau_reserve, token_reserve)
+
+        pair['events'].append(event_entry('Swap', {
+            'tau_in': tau_in,
+            'token_in': token_in,
+            'tau_out': tau_out,
+            'token_out': token_out,
+            'to_address': to_address
+        }))
+        tau_in, token_in = orient(pair, tau_in, token_in)
+        tau_out, token_out = orient(pair, tau_out, token_out)
+        results.append([tau_in, token_in, tau_out, token_out])
+
+    for pair in batch_pairs.values():
+        state = pair['state']
+        for contract, remaining in pair['deposits'].items():
+            if contract == pair['tau_contract'] :
+                state[TAU_RESERVE] += remaining
+            else :
+                state[TOKEN_RESERVE] += remaining
+
+        store_pair_state(pair, state[TAU_RESERVE], state[TOKEN_RESERVE], pair['events'])
+
+    # Unspent transfers stay unaccounted for, exactly like after a single swap
+    for token_contract, entry in batch_tokens.items():
+        pairs[token_contract, 'balance'] = entry['tracked'] + entry['spent'] - entry['sent']
+
+    return results
@@ -0,0 +1,346 @@
+# Stable swap pools - Curve StableSwap (2 coins), next to the constant product pairs in dex_pairs.py
+# For pegged pairs, e.g. a bridged token and its wrapped counterpart: the invariant is close to x + y = D around
+# the peg, so trades there see far less slippage than on x * y = k, and falls back to constant product away from it.
+# The amplification parameter sets how wide the flat part is. Created through the same factory:
+# dex.create_pair(dex_pairs='dex_stable', ...)
+#
+# D and y are solved with Newton iteration, capped at MAX_ITERATIONS. D of the stored balances is cached in the
+# pool record, so a swap solves y straight from it, and the next D starts from the cached one
+# (benchmarks/bench_stable.py compares iterations and stamps with dex_pairs.swap).
+#
+# Differences with Curve:
+# - payments are pulled from the caller with transfer_from, the caller approves this contract first
+# - no admin fee, amplification is fixed per pool (no ramping)
+# - amounts are ContractingDecimal at the boundary, all pool math runs on ints scaled by 10^TOKEN_DECIMALS
+# Like dex_pairs, every call takes the two contracts in either order - amounts and tau_in follow the order of
+# the call, LP token balances are kept under the pool as stored
+I = importlib
+
+# Enforceable interface
+token_interface = [
+    I.Func('transfer', args=('amount', 'to')),
+    I.Func('transfer_from', args=('amount', 'to', 'main_account')),
+    I.Func('balance_of', args=('account',))
+]
+
+# POOL STATE - packed into a single record, one storage key per pool
+# pools[tau_contract: str, token_contract: str] = [tau_balance, token_balance, lp_token_supply, D, amplification]
+# LP Token balance
+# lp_token_balance = pools[tau_contract: str, token_contract: str, 'lp_token_balance', address: str]
+owner = Variable()
+amplification = Variable()
+pools = Hash(default_value=0)
+
+# POOL INDEX - append-only, written once at pool creation
+# [tau_contract, token_contract] = all_pools[index: int]
+all_pools = Hash()
+
+TOKEN_DECIMALS = 18
+N_COINS = 2
+
+# Pool record layout
+TAU_BALANCE = 0
+TOKEN_BALANCE = 1
+LP_TOKEN_SUPPLY = 2
+D = 3
+AMPLIFICATION = 4
+
+# Swap fee 0.04%, in hundredths of a bip. Imbalanced deposits pay half of it on the imbalance
+FEE = 400
+FEE_DENOMINATOR = pow(10, 6)
+DEFAULT_AMPLIFICATION = 100
+MAX_AMPLIFICATION = pow(10, 6)
+
+# Newton iterations normally converge in under 10 steps, a warm start in 1 or 2
+MAX_ITERATIONS = 64
+
+# TOKEN HELPERS - the same code in dex_concentrated.py and dex_stable.py. Contracts can't call each other's
+# private functions, and pull() has to run in the pool itself to spend what its caller approved, so each pool
+# keeps a copy - tests/test_dex_stable.py checks the copies match
+# returns int - amount * 10^TOKEN_DECIMALS, truncated past TOKEN_DECIMALS
+def to_raw(amount):
+    whole = int(amount)
+    return whole * pow(10, TOKEN_DECIMALS) + int((amount - whole) * pow(10, TOKEN_DECIMALS))
+
+# returns ContractingDecimal - exact, raw amounts carry TOKEN_DECIMALS digits
+def from_raw(raw):
+    return decimal(raw // pow(10, TOKEN_DECIMALS)) + decimal(raw % pow(10, TOKEN_DECIMALS)) / pow(10, TOKEN_DECIMALS)
+
+# Get a token module, validated against the interface
+def get_token(token_contract):
+    token = I.import_module(token_contract)
+    assert I.enforce_interface(token, token_interface), 'Token contract does not meet the required interface'
+
+    return token
+
+# Pays the pool from the caller, who approved it first - a raw amount rounded up by the pool math, so it is
+# exact in TOKEN_DECIMALS
+def pull(token_contract, raw_amount):
+    if raw_amount > 0 :
+        get_token(token_contract).transfer_from(amount=from_raw(raw_amount), to=ctx.this, main_account=ctx.caller)
+
+def pay(token_contract, raw_amount, to_address):
+    if raw_amount > 0 :
+        get_token(token_contract).transfer(from_raw(raw_amount), to_address)
+
+# StableSwap.vy => get_D
+# Invariant of the balances: A * n^n * sum(x) + D = A * D * n^n + D^(n+1) / (n^n * prod(x))
+# d_guess is where Newton starts, the cached D of nearby balances takes 1 or 2 steps instead of starting from sum(x)
+def get_d(balances, amp, d_guess):
+    s = balances[0] + balances[1]
+    if s == 0 :
+        return 0
+
+    ann = amp * N_COINS
+    d = d_guess if d_guess > 0 else s
+    for i in range(MAX_ITERATIONS):
+        d_p = d
+        for x in balances:
+            d_p = d_p * d // (x * N_COINS)
+
+        d_prev = d
+        d = (ann * s + d_p * N_COINS) * d // ((ann - 1) * d + (N_COINS + 1) * d_p)
+
+        if abs(d - d_prev) <= 1 :
+            return d
+
+    assert False, 'D does not converge'
+
+# StableSwap.vy => get_y
+# Balance of the other coin that keeps the invariant at D, once one coin's balance is x
+# y_guess is where Newton starts - the other coin's current balance is above the solution when x grew,
+# so the iteration only moves down towards it
+def get_y(x, d, amp, y_guess):
+    ann = amp * N_COINS
+    c = d * d // (x * N_COINS)
+    c = c * d // (ann * N_COINS)
+    b = x + d // ann
+
+    y = y_guess
+    for i in range(MAX_ITERATIONS):
+        y_prev = y
+        y = (y * y + c) // (2 * y + b - d)
+
+        if abs(y - y_prev) <= 1 :
+            return y
+
+    assert False, 'y does not converge'
+
+# Output of a swap on the stored balances, after the fee
+# The pool keeps 1 raw unit on top of the solution, so rounding never goes against it
+def calculate_swap(state, tau_in, raw_amount_in):
+    i = TAU_BALANCE if tau_in else TOKEN_BALANCE
+    j = TOKEN_BALANCE if tau_in else TAU_BALANCE
+
+    y = get_y(state[i] + raw_amount_in, state[D], state[AMPLIFICATION], state[j])
+    amount_out = state[j] - y - 1
+    amount_out -= amount_out * FEE // FEE_DENOMINATOR
+
+    return amount_out
+
+# Pool handle - a copy of the packed pool record, so callers can modify it before writing it back
+# Contracts can be given in either order, the handle always holds the pool as stored - flipped tells
+# whether the caller asked in (token, tau) order, see orient()
+def get_pool_handle(tau_contract, token_contract):
+    entry = [tau_contract, token_contract]
+    state = pools[tau_contract, token_contract]
+    if state == 0 :
+        entry = [token_contract, tau_contract]
+        state = pools[token_contract, tau_contract]
+
+    assert state != 0, 'Invalid pair'
+
+    return {
+        'tau_contract': entry[0],
+        'token_contract': entry[1],
+        'flipped': entry[0] != tau_contract,
+        'state': list(state)
+    }
+
+# Puts a (tau, token) pair of amounts in the caller's order, or back in the stored order
+def orient(pool, tau_amount, token_amount):
+    if pool['flipped'] :
+        return token_amount, tau_amount
+
+    return tau_amount, token_amount
+
+@construct
+def seed(owner_address: str, amplification_coefficient: int=DEFAULT_AMPLIFICATION):
+    owner.set(owner_address)
+    amplification.set(amplification_coefficient)
+    pools['count'] = 0
+
+@export
+# Pool record, either order finds the pool. Factory interface, shared with dex_pairs
+def pair(tau_contract: str, token_contract: str):
+    state = pools[tau_contract, token_contract]
+    if state == 0 :
+        state = pools[token_contract, tau_contract]
+
+    return state if state != 0 else None
+
+@export
+# Number of pools created
+def length_pairs():
+    return pools['count']
+
+@export
+# Creates the pool with this deployment's amplification. Factory interface, shared with dex_pairs
+def initialize(tau_contract: str, token_contract: str):
+    assert tau_contract != token_contract
+    assert ctx.caller == owner.get(), 'LamDexStable: FORBIDDEN'
+    assert pair(tau_contract, token_contract) is None, 'Market already exists!'
+
+    get_token(tau_contract)
+    get_token(token_contract)
+
+    amp = amplification.get()
+    assert amp > 0 and amp <= MAX_AMPLIFICATION, 'Invalid amplification'
+
+    pools[tau_contract, token_contract] = [0, 0, 0, 0, amp]
+    all_pools[pools['count']] = [tau_contract, token_contract]
+    pools['count'] += 1
+
+@export
+# StableSwap.vy => add_liquidity
+# Deposits from the caller and mints LP tokens in proportion to the growth of D.
+# Deposits off the pool's balance ratio pay a fee on the imbalance, which stays with the existing LPs
+# Returns the LP tokens minted
+def add_liquidity(tau_contract: str, token_contract: str, tau_amount: float, token_amount: float, lp_token_min: float, to_address: str):
+    assert tau_amount >= 0 and token_amount >= 0, 'Cannot send negative balances!'
+    pool = get_pool_handle(tau_contract, token_contract)
+    tau_contract = pool['tau_contract']
+    token_contract = pool['token_contract']
+    tau_amount, token_amount = orient(pool, tau_amount, token_amount)
+    state = pool['state']
+
+    amounts = [to_raw(tau_amount), to_raw(token_amount)]
+    old_balances = [state[TAU_BALANCE], state[TOKEN_BALANCE]]
+    new_balances = [old_balances[0] + amounts[0], old_balances[1] + amounts[1]]
+
+    d0 = state[D]
+    supply = state[LP_TOKEN_SUPPLY]
+    if supply == 0 :
+        assert amounts[0] > 0 and amounts[1] > 0, 'Initial deposit requires both coins'
+
+    # scaled by the growth of the balances, the cached D is close to the new one
+    d_guess = d0 * (new_balances[0] + new_balances[1]) // (old_balances[0] + old_balances[1]) if d0 > 0 else 0
+    d1 = get_d(new_balances, state[AMPLIFICATION], d_guess)
+    assert d1 > d0, 'Insufficient liquidity minted'
+
+    if supply == 0 :
+        minted = d1
+    else :
+        fee = FEE * N_COINS // (4 * (N_COINS - 1))
+        balances_less_fees = []
+        for i in range(N_COINS):
+            ideal_balance = d1 * old_balances[i] // d0
+            difference = abs(ideal_balance - new_balances[i])
+            balances_less_fees.append(new_balances[i] - fee * difference // FEE_DENOMINATOR)
+
+        d2 = get_d(balances_less_fees, state[AMPLIFICATION], d1)
+        minted = supply * (d2 - d0) // d0
+
+    assert minted > 0 and from_raw(minted) >= lp_token_min, 'Insufficient liquidity minted'
+
+    state[TAU_BALANCE], state[TOKEN_BALANCE] = new_balances
+    state[LP_TOKEN_SUPPLY] = supply + minted
+    state[D] = d1
+    pools[tau_contract, token_contract] = state
+    pools[tau_contract, token_contract, 'lp_token_balance', to_address] += minted
+
+    pull(tau_contract, amounts[0])
+    pull(token_contract, amounts[1])
+
+    return from_raw(minted)
+
+@export
+# StableSwap.vy => remove_liquidity
+# Burns the caller's LP tokens for their share of both balances
+# Returns the [tau, token] amounts sent
+def remove_liquidity(tau_contract: str, token_contract: str, amount: float, tau_min: float, token_min: float, to_address: str):
+    assert amount > 0, 'Insufficient liquidity burned'
+    pool = get_pool_handle(tau_contract, token_contract)
+    tau_contract = pool['tau_contract']
+    token_contract = pool['token_contract']
+    tau_min, token_min = orient(pool, tau_min, token_min)
+    state = pool['state']
+
+    raw_amount = to_raw(amount)
+    lp_token_balance = pools[tau_contract, token_contract, 'lp_token_balance', ctx.caller]
+    assert lp_token_balance >= raw_amount, 'Insufficient LP token balance'
+
+    supply = state[LP_TOKEN_SUPPLY]
+    tau_out = state[TAU_BALANCE] * raw_amount // supply
+    token_out = state[TOKEN_BALANCE] * raw_amount // supply
+    assert from_raw(tau_out) >= tau_min and from_raw(token_out) >= token_min, 'Insufficient output amount'
+
+    state[TAU_BALANCE] -= tau_out
+    state[TOKEN_BALANCE] -= token_out
+    state[LP_TOKEN_SUPPLY] = supply - raw_amount
+    # D scales with the balances, the scaled cached D only needs rounding corrected
+    if state[LP_TOKEN_SUPPLY] == 0 :
+        state[D] = 0
+    else :
+        state[D] = get_d([state[TAU_BALANCE], state[TOKEN_BALANCE]], state[AMPLIFICATION], state[D] * state[LP_TOKEN_SUPPLY] // supply)
+
+    pools[tau_contract, token_contract] = state
+    pools[tau_contract, token_contract, 'lp_token_balance', ctx.caller] = lp_token_balance - raw_amount
+
+    pay(tau_contract, tau_out, to_address)
+    pay(token_contract, token_out, to_address)
+
+    return orient(pool, from_raw(tau_out), from_raw(token_out))
+
+@export
+# StableSwap.vy => exchange
+# Trades amount_in of tau (tau_in) or token for the other, paid from the caller, output sent to to_address
+# tau_in follows the order of the call - it means the first contract given is the input. Returns the amount sent
+def swap(tau_contract: str, token_contract: str, tau_in: bool, amount_in: float, amount_out_min: float, to_address: str):
+    assert amount_in > 0, 'Insufficient input amount'
+    pool = get_pool_handle(tau_contract, token_contract)
+    tau_contract = pool['tau_contract']
+    token_contract = pool['token_contract']
+    tau_in = tau_in != pool['flipped']
+    state = pool['state']
+    assert state[D] > 0, 'Insufficient liquidity'
+
+    raw_amount_in = to_raw(amount_in)
+    amount_out = calculate_swap(state, tau_in, raw_amount_in)
+    assert amount_out > 0 and from_raw(amount_out) >= amount_out_min, 'Insufficient output amount'
+
+    i = TAU_BALANCE if tau_in else TOKEN_BALANCE
+    j = TOKEN_BALANCE if tau_in else TAU_BALANCE
+    state[i] += raw_amount_in
+    state[j] -= amount_out
+    # the fee stays in the pool and grows D a little, the cached D is the starting point
+    state[D] = get_d([state[TAU_BALANCE], state[TOKEN_BALANCE]], state[AMPLIFICATION], state[D])
+    pools[tau_contract, token_contract] = state
+
+    pull(tau_contract if tau_in else token_contract, raw_amount_in)
+    pay(token_contract if tau_in else tau_contract, amount_out, to_address)
+
+    return from_raw(amount_out)
+
+@export
+# StableSwap.vy => get_dy - output of a swap at the current balances
+def get_amount_out(tau_contract: str, token_contract: str, tau_in: bool, amount_in: float):
+    assert amount_in > 0, 'Insufficient input amount'
+    pool = get_pool_handle(tau_contract, token_contract)
+    state = pool['state']
+    assert state[D] > 0, 'Insufficient liquidity'
+
+    return from_raw(calculate_swap(state, tau_in != pool['flipped'], to_raw(amount_in)))
+
+@export
+# StableSwap.vy => get_virtual_price - D per LP token, only goes up as fees accrue
+def get_virtual_price(tau_contract: str, token_contract: str):
+    state = get_pool_handle(tau_contract, token_contract)['state']
+    assert state[LP_TOKEN_SUPPLY] > 0, 'Insufficient liquidity'
+
+    return from_raw(state[D] * pow(10, TOKEN_DECIMALS) // state[LP_TOKEN_SUPPLY])
+
+@export
+def balance_of(tau_contract: str, token_contract: str, account: str):
+    pool = get_pool_handle(tau_contract, token_contract)
+    return from_raw(pools[pool['tau_contract'], pool['token_contract'], 'lp_token_balance', account])
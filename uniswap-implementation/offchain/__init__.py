@@ -0,0 +1,2 @@
+# Off-chain tooling for the Lamden AMM contracts.
+# Plain Python - these modules run next to the contracts (pricing, indexing, testing), never on-chain.
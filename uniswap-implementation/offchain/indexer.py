@@ -0,0 +1,123 @@
+# Streaming event indexer - copies the dex_pairs event logs into SQLite.
+#
+# dex_pairs appends every Mint, Burn, Swap and Sync to the log of its pair, in the `events` Hash:
+#   events[tau_contract, token_contract, 'count'] = number of events of the pair
+#   events[tau_contract, token_contract, index]   = [event, sender, data, timestamp]
+# The pairs come from the all_pairs index (pairs created before it need dex_pairs.backfill_pair first).
+# The indexer follows each log from its own cursor, so each sync only reads the events emitted since the
+# previous one - plus one count read per pair - and writes them with batched inserts. Rows are indexed by
+# pair and by block, so history queries are index lookups instead of re-polling get_pair_reserves.
+#
+# Events are in order within a pair. Across pairs, a sync adds them pair by pair, in creation order.
+#
+# The contracts can't see the block number, so sync() takes the block the caller has just processed
+# and stamps it on every event it picks up.
+import json
+import sqlite3
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    tau_contract TEXT NOT NULL,
+    token_contract TEXT NOT NULL,
+    log_index INTEGER NOT NULL,
+    block INTEGER,
+    timestamp TEXT,
+    event TEXT NOT NULL,
+    sender TEXT,
+    data TEXT NOT NULL,
+    UNIQUE (tau_contract, token_contract, log_index)
+);
+CREATE INDEX IF NOT EXISTS events_block ON events (block, id);
+'''
+
+COLUMNS = ['id', 'tau_contract', 'token_contract', 'log_index', 'block', 'timestamp', 'event', 'sender', 'data']
+
+
+# client is a ContractingClient, or anything with get_var(contract, variable, arguments)
+# [tau_contract, token_contract] of every pair in the all_pairs index
+def indexed_pairs(client, contract='dex_pairs'):
+    count = client.get_var(contract, 'pairs', ['count']) or 0
+    for index in range(count):
+        entry = client.get_var(contract, 'all_pairs', [index])
+        if entry is not None:
+            yield entry
+
+
+def stream_events(client, tau_contract, token_contract, contract='dex_pairs', start=0):
+    count = client.get_var(contract, 'events', [tau_contract, token_contract, 'count']) or 0
+    for index in range(start, count):
+        yield index, client.get_var(contract, 'events', [tau_contract, token_contract, index])
+
+
+# ContractingDecimal and Datetime values are stored as their string form, so no precision is lost
+def encode_data(data):
+    return json.dumps(data, default=str, sort_keys=True)
+
+
+def as_row(tau_contract, token_contract, index, entry, block_num):
+    event, sender, data, timestamp = entry
+    return tau_contract, token_contract, index, block_num, str(timestamp), event, sender, encode_data(data)
+
+
+def as_event(row):
+    event = dict(zip(COLUMNS, row))
+    event['data'] = json.loads(event['data'])
+    return event
+
+
+class EventIndexer:
+    def __init__(self, client, path=':memory:', contract='dex_pairs', batch_size=500):
+        self.client = client
+        self.contract = contract
+        self.batch_size = batch_size
+
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    # Next event index to read for every pair seen so far - resumes where the database left off
+    def cursors(self):
+        rows = self.db.execute('SELECT tau_contract, token_contract, MAX(log_index) FROM events GROUP BY tau_contract, token_contract')
+        return {(tau_contract, token_contract): last + 1 for tau_contract, token_contract, last in rows}
+
+    # Index every event emitted since the last sync, returns how many were added
+    def sync(self, block_num=None):
+        cursors = self.cursors()
+        batch = []
+        added = 0
+        for tau_contract, token_contract in indexed_pairs(self.client, self.contract):
+            start = cursors.get((tau_contract, token_contract), 0)
+            for index, entry in stream_events(self.client, tau_contract, token_contract, self.contract, start):
+                batch.append(as_row(tau_contract, token_contract, index, entry, block_num))
+                if len(batch) >= self.batch_size:
+                    added += self.insert(batch)
+                    batch = []
+
+        if batch:
+            added += self.insert(batch)
+
+        return added
+
+    def insert(self, rows):
+        with self.db:
+            self.db.executemany('INSERT INTO events VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def pair_events(self, tau_contract, token_contract, event=None, since_block=None):
+        query = 'SELECT * FROM events WHERE tau_contract = ? AND token_contract = ?'
+        params = [tau_contract, token_contract]
+        if event is not None:
+            query += ' AND event = ?'
+            params.append(event)
+        if since_block is not None:
+            query += ' AND block >= ?'
+            params.append(since_block)
+
+        return [as_event(row) for row in self.db.execute(query + ' ORDER BY log_index', params)]
+
+    def block_events(self, block_num):
+        rows = self.db.execute('SELECT * FROM events WHERE block = ? ORDER BY id', (block_num,))
+        return [as_event(row) for row in rows]
+
+    def close(self):
+        self.db.close()
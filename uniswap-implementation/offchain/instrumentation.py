@@ -0,0 +1,160 @@
+# Opt-in storage and call counters for contracts run through a ContractingClient.
+#
+# Wraps the client's driver and executor in place, and tallies per exported entry point
+# (`contract.function` of the transaction) and per key prefix:
+#   reads / writes         - driver.get / driver.set calls made while a transaction runs
+#   read_bytes / write_bytes - len(key) + len(encoded value), the same size the stamp meter charges
+#   imports                - importlib.import_module calls
+#   interface_checks       - importlib.enforce_interface calls
+#   foreign_calls          - calls into another contract's exported function
+#
+#   with Instrumentation(client) as counters:
+#       dex_pairs.swap(...)
+#   print(counters.summary())
+#
+# Reads and writes made outside of a transaction (client.get_var, set_var in a test) are not counted.
+from collections import Counter, defaultdict
+
+from contracting.db.encoder import encode_kv
+from contracting.execution.runtime import rt
+from contracting.stdlib.bridge.imports import imports_module
+
+ENTRY_COLUMNS = ['calls', 'reads', 'writes', 'read_bytes', 'write_bytes', 'imports', 'interface_checks', 'foreign_calls']
+PREFIX_COLUMNS = ['reads', 'writes', 'read_bytes', 'write_bytes']
+
+
+# dex_pairs.pairs:tau:eth:lp_token_balance:wallet => dex_pairs.pairs:tau:eth:lp_token_balance (depth=4)
+def key_prefix(key, depth=4):
+    return ':'.join(key.split(':')[:depth])
+
+
+def encoded_size(key, value):
+    k, v = encode_kv(key, value)
+    return len(k) + len(v)
+
+
+class Instrumentation:
+    def __init__(self, client, prefix_depth=4):
+        self.client = client
+        self.prefix_depth = prefix_depth
+        self.entry = None
+        self.import_module = None
+        self.enforce_interface = None
+        self.reset()
+
+    def reset(self):
+        self.entries = defaultdict(Counter)
+        self.prefixes = defaultdict(Counter)
+
+    def install(self):
+        assert self.import_module is None, 'Already installed'
+        driver = self.client.raw_driver
+        executor = self.client.executor
+        self.import_module = imports_module.import_module
+        self.enforce_interface = imports_module.enforce_interface
+
+        driver.get = self.wrap_get(driver.get)
+        driver.set = self.wrap_set(driver.set)
+        executor.execute = self.wrap_execute(executor.execute)
+        rt.context._add_state = self.wrap_add_state(rt.context._add_state)
+        imports_module.import_module = self.wrap_import_module(imports_module.import_module)
+        imports_module.enforce_interface = self.wrap_enforce_interface(imports_module.enforce_interface)
+
+        return self
+
+    def uninstall(self):
+        driver = self.client.raw_driver
+
+        # Instance attributes shadow the class methods, deleting them restores the originals
+        del driver.get
+        del driver.set
+        del self.client.executor.execute
+        del rt.context._add_state
+        imports_module.import_module = self.import_module
+        imports_module.enforce_interface = self.enforce_interface
+
+        self.import_module = None
+        self.enforce_interface = None
+
+    def __enter__(self):
+        return self.install()
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+    def count(self, key, field, amount=1):
+        self.entries[self.entry][field] += amount
+        if key is not None:
+            self.prefixes[key_prefix(key, self.prefix_depth)][field] += amount
+
+    def wrap_get(self, get):
+        def counted_get(key, *args, **kwargs):
+            value = get(key, *args, **kwargs)
+            if self.entry is not None:
+                self.count(key, 'reads')
+                self.count(key, 'read_bytes', encoded_size(key, value))
+            return value
+        return counted_get
+
+    def wrap_set(self, set):
+        def counted_set(key, value, *args, **kwargs):
+            if self.entry is not None:
+                self.count(key, 'writes')
+                self.count(key, 'write_bytes', encoded_size(key, value))
+            return set(key, value, *args, **kwargs)
+        return counted_set
+
+    def wrap_execute(self, execute):
+        def counted_execute(sender, contract_name, function_name, *args, **kwargs):
+            self.entry = '{}.{}'.format(contract_name, function_name)
+            self.count(None, 'calls')
+            try:
+                return execute(sender, contract_name, function_name, *args, **kwargs)
+            finally:
+                self.entry = None
+        return counted_execute
+
+    def wrap_add_state(self, add_state):
+        def counted_add_state(state):
+            if self.entry is not None:
+                self.count(None, 'foreign_calls')
+            return add_state(state)
+        return counted_add_state
+
+    def wrap_import_module(self, import_module):
+        def counted_import_module(name):
+            if self.entry is not None:
+                self.count(None, 'imports')
+            return import_module(name)
+        return counted_import_module
+
+    def wrap_enforce_interface(self, enforce_interface):
+        def counted_enforce_interface(m, interface):
+            if self.entry is not None:
+                self.count(None, 'interface_checks')
+            return enforce_interface(m, interface)
+        return counted_enforce_interface
+
+    # Per-call averages of one entry point, e.g. for a benchmark's extra_info
+    def per_call(self, entry):
+        counters = self.entries[entry]
+        calls = counters['calls'] or 1
+        return {field: counters[field] / calls for field in ENTRY_COLUMNS if field != 'calls'}
+
+    def summary(self):
+        return '\n\n'.join([
+            format_table('entry point', ENTRY_COLUMNS, self.entries),
+            format_table('key prefix', PREFIX_COLUMNS, self.prefixes)
+        ])
+
+
+def format_table(title, columns, rows):
+    names = sorted(rows, key=lambda name: -rows[name][columns[1]])
+    width = max([len(title)] + [len(name) for name in names])
+
+    lines = [' '.join([title.ljust(width)] + [column.rjust(13) for column in columns])]
+    lines.append('-' * len(lines[0]))
+    for name in names:
+        lines.append(' '.join([name.ljust(width)] + [str(rows[name][column]).rjust(13) for column in columns]))
+
+    return '\n'.join(lines)
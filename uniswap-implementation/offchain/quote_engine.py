@@ -0,0 +1,194 @@
+# Quote engine - constant-product quotes for grids of pairs x input sizes, with NumPy broadcasting.
+#
+# Every function mirrors a contract function operation by operation, on NumPy object arrays of
+# ContractingDecimal, so results match the contract bit-for-bit (same decimal context, same
+# 30 decimal place truncation, same int/float -> decimal conversions). Object arrays are not vectorized:
+# NumPy only does the looping, every element is still one ContractingDecimal operation in Python, so an
+# exact grid costs about as much as quoting each cell on its own:
+#   get_amounts_out    => router.get_amount_out
+#   get_amounts_in     => router.get_amount_in / dex_pairs.get_amount_in
+#   trade_details      => calculate_trade_details (proof of concept dex)
+#   trade_details_many => get_trade_details_many (proof of concept dex), through trade_details
+#
+# Pass exact=False to get the same math on float64 arrays instead - vectorized and much faster, but approximate.
+import numpy as np
+
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+# The contract compiler turns every float literal into decimal('...'), e.g. the `* 1.0` casts
+ONE = ContractingDecimal('1.0')
+
+
+# Contract kwargs go through the executor, which turns floats into ContractingDecimal
+def as_contract_value(value):
+    if isinstance(value, float):
+        return ContractingDecimal(str(value))
+    return value
+
+
+def as_array(values, exact=True):
+    if exact:
+        values = np.asarray(values, dtype=object)
+        return np.vectorize(as_contract_value, otypes=[object])(values) if values.size else values
+    return np.asarray([float(v) for v in np.ravel(values)], dtype=np.float64).reshape(np.shape(values))
+
+
+# Reserve snapshot of many pairs, read through dex_pairs.get_pair_reserves
+class ReserveSnapshot:
+    def __init__(self, pairs, tau_reserves, token_reserves):
+        self.pairs = list(pairs)
+        self.tau_reserves = tau_reserves
+        self.token_reserves = token_reserves
+
+    def __len__(self):
+        return len(self.pairs)
+
+    # Reserves oriented for a trade direction, as (reserve_in, reserve_out) column vectors
+    def oriented(self, tau_in=True):
+        if tau_in:
+            return self.tau_reserves[:, None], self.token_reserves[:, None]
+        return self.token_reserves[:, None], self.tau_reserves[:, None]
+
+    def as_float(self):
+        return ReserveSnapshot(self.pairs, as_array(self.tau_reserves, exact=False), as_array(self.token_reserves, exact=False))
+
+
+# Every indexed pair as (tau_contract, token_contract), paged through dex_pairs.get_pairs
+def list_pairs(dex_pairs, page_size=100):
+    pairs = []
+    for offset in range(0, dex_pairs.all_pairs_length(), page_size):
+        pairs.extend((tau_contract, token_contract) for tau_contract, token_contract in dex_pairs.get_pairs(offset=offset, limit=page_size))
+
+    return pairs
+
+
+# dex_pairs is a contract handle, i.e. ContractingClient().get_contract('dex_pairs')
+# pairs is a list of (tau_contract, token_contract), e.g. from list_pairs
+def load_snapshot(dex_pairs, pairs, exact=True):
+    tau_reserves = []
+    token_reserves = []
+    for tau_contract, token_contract in pairs:
+        tau_reserve, token_reserve = dex_pairs.get_pair_reserves(tau_contract=tau_contract, token_contract=token_contract)
+        tau_reserves.append(tau_reserve)
+        token_reserves.append(token_reserve)
+
+    return ReserveSnapshot(pairs, as_array(tau_reserves, exact), as_array(token_reserves, exact))
+
+
+def one(exact):
+    return ONE if exact else 1.0
+
+
+# Input sizes for a snapshot of `pairs` pairs: a scalar, (sizes,) or (pairs x sizes)
+def as_amounts(amounts, pairs, exact=True):
+    amounts = as_array(amounts, exact)
+    assert amounts.ndim < 2 or (amounts.ndim == 2 and amounts.shape[0] == pairs), \
+        'Amounts must be a scalar, (sizes,) or ({} pairs x sizes), got shape {}'.format(pairs, amounts.shape)
+    return amounts
+
+
+# UniswapV2Library.sol => getAmountOut (router.get_amount_out)
+# reserve_in/reserve_out are (pairs x 1), amounts_in is (sizes,) or (pairs x sizes)
+def get_amounts_out(reserve_in, reserve_out, amounts_in, exact=True):
+    amounts_in = as_array(amounts_in, exact)
+    assert np.all(amounts_in > 0), 'Insufficient input amount'
+    assert np.all(reserve_in > 0) and np.all(reserve_out > 0), 'Insufficient liquidity'
+
+    amount_in_with_fee = amounts_in * 997 * one(exact)
+    return (amount_in_with_fee * reserve_out) / ((reserve_in * 1000) + amount_in_with_fee)
+
+
+# UniswapV2Library.sol => getAmountIn (router.get_amount_in)
+def get_amounts_in(reserve_in, reserve_out, amounts_out, exact=True):
+    amounts_out = as_array(amounts_out, exact)
+    assert np.all(amounts_out > 0), 'Insufficient output amount'
+    assert np.all(reserve_in > 0) and np.all(reserve_out > amounts_out), 'Insufficient liquidity'
+
+    return (reserve_in * amounts_out * 1000 * one(exact)) / ((reserve_out - amounts_out) * 997)
+
+
+# Execution price vs. spot price: 1 - (amount_out / amount_in) / (reserve_out / reserve_in)
+def get_price_impact(reserve_in, reserve_out, amounts_in, amounts_out, exact=True):
+    amounts_in = as_array(amounts_in, exact)
+    return 1 - (amounts_out * reserve_in * one(exact)) / (amounts_in * reserve_out)
+
+
+# calculate_trade_details, without fees - one of tau_in/token_in is set, as in the contract
+# tau_in/token_in take the shapes of as_amounts. Returns tau_out, token_out, tau_slippage, token_slippage
+# grids of (pairs x sizes), (pairs x 1) for a scalar - the unused direction is all zeros
+def trade_details(snapshot, tau_in=None, token_in=None, exact=True):
+    assert (tau_in is None) != (token_in is None), 'Provide either tau_in or token_in'
+    if not exact:
+        snapshot = snapshot.as_float()
+
+    tau_reserve = snapshot.tau_reserves[:, None]
+    token_reserve = snapshot.token_reserves[:, None]
+
+    lp_total = tau_reserve * token_reserve
+
+    if tau_in is not None:
+        tau_in = as_amounts(tau_in, len(snapshot), exact)
+        assert np.all(tau_in > 0), 'Invalid amount!'
+
+        tau_reserve_new = tau_reserve + tau_in
+        token_reserve_new = lp_total / tau_reserve_new
+
+        token_out = token_reserve - token_reserve_new
+        token_slippage = (token_reserve / token_reserve_new) - 1
+        zero = np.zeros(token_out.shape, dtype=token_out.dtype)
+        return zero, token_out, zero, token_slippage
+
+    token_in = as_amounts(token_in, len(snapshot), exact)
+    assert np.all(token_in > 0), 'Invalid amount!'
+
+    token_reserve_new = token_reserve + token_in
+    tau_reserve_new = lp_total / token_reserve_new
+
+    tau_out = tau_reserve - tau_reserve_new
+    tau_slippage = (tau_reserve / tau_reserve_new) - 1
+    zero = np.zeros(tau_out.shape, dtype=tau_out.dtype)
+    return tau_out, zero, tau_slippage, zero
+
+
+# get_trade_details_many - amounts is a list of [tau_in, token_in], reserves as returned by the dex's get_reserves
+# Returns [tau_out, token_out, tau_slippage, token_slippage] for each, all zeros for [0, 0] like the contract.
+# Each direction is one trade_details call on a single pair snapshot
+def trade_details_many(tau_reserve, token_reserve, amounts):
+    snapshot = ReserveSnapshot([None], as_array([tau_reserve]), as_array([token_reserve]))
+    amounts = [[as_contract_value(tau_in), as_contract_value(token_in)] for tau_in, token_in in amounts]
+    assert not any(tau_in > 0 and token_in > 0 for tau_in, token_in in amounts), 'Provide either tau_in or token_in'
+
+    details = [[0, 0, 0, 0] for _ in amounts]
+    for side in [0, 1]:
+        indexes = [i for i, amount in enumerate(amounts) if amount[side] > 0]
+        if not indexes:
+            continue
+
+        sizes = [amounts[i][side] for i in indexes]
+        grids = trade_details(snapshot, tau_in=sizes) if side == 0 else trade_details(snapshot, token_in=sizes)
+        for column, i in enumerate(indexes):
+            details[i] = [grid[0, column] for grid in grids]
+
+    return details
+
+
+# Everything the pricing service needs for one direction, for every pair x size
+def quote_grid(snapshot, amounts_in, tau_in=True, exact=True):
+    if not exact:
+        snapshot = snapshot.as_float()
+
+    reserve_in, reserve_out = snapshot.oriented(tau_in)
+    amounts_in = as_array(amounts_in, exact)
+    amounts_out = get_amounts_out(reserve_in, reserve_out, amounts_in, exact)
+
+    if tau_in:
+        _, amounts_out_without_fee, _, slippage = trade_details(snapshot, tau_in=amounts_in, exact=exact)
+    else:
+        amounts_out_without_fee, _, slippage, _ = trade_details(snapshot, token_in=amounts_in, exact=exact)
+
+    return {
+        'amount_out': amounts_out,
+        'price_impact': get_price_impact(reserve_in, reserve_out, amounts_in, amounts_out, exact),
+        'slippage': slippage,
+        'amount_out_without_fee': amounts_out_without_fee
+    }
@@ -0,0 +1,465 @@
+# Reference AMM model - plain Python mirrors of the constant-product contracts, for fast simulation and
+# differential testing against the real contracts.
+#
+#   PairModel   => dex_pairs.py mint_liquidity, burn_liquidity, swap and mint_fee, for one pair
+#   MarketModel => lamden-version dex create_market, buy and sell, for one market
+#
+# The models run the same operations, in the same order, on ContractingDecimal, and convert values wherever
+# the contract's storage would (Hash writes of Decimal/float), so states match the contracts bit-for-bit.
+# There is no float mode: floats drift far enough from the contracts' 30 decimal place truncation to turn
+# valid trades into failed asserts (12% of a 100k operation random workload, against 0.03% on ContractingDecimal,
+# measured before the workload sized some swaps past the K check).
+#
+# Every operation is all-or-nothing like a transaction: a failing assert leaves the model untouched.
+#
+# Throughput (benchmarks/bench_reference_model.py, 100k operations, one core): ~1.15M operations per minute, up
+# from ~0.84M before the K check went integer-only. The rest is ContractingDecimal arithmetic - every operation
+# re-checks and truncates to 30 decimal places - which is what keeps the states bit-for-bit, so this mode does
+# not go much faster. Workloads needing several million a minute have to shard seeds over processes.
+import decimal
+import random
+
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+from offchain.quote_engine import as_contract_value
+
+MINIMUM_LIQUIDITY = pow(10, 3)
+TOKEN_DECIMALS = 18
+STORED_DECIMALS = 30
+ZERO_ADDRESS = '0'
+
+# The contract compiler turns every float literal into decimal('...')
+ONE = ContractingDecimal('1.0')
+
+
+# dex_pairs.expand_to_sqrt_domain / assert_k / isqrt / sqrt
+# The contract builds amount * 10^(2 * TOKEN_DECIMALS) from int() of the whole part and two 18 digit fraction
+# steps. Values reaching it carry at most STORED_DECIMALS decimal places - ContractingDecimal math quantizes
+# anything longer - so shifting the exact Decimal and truncating once gives the same int, without the three
+# ContractingDecimal operations. This and the integer K check are most of a swap's cost in the model
+SQRT_DOMAIN_EXPONENT = 2 * TOKEN_DECIMALS
+K_UNIT = pow(10, 2 * TOKEN_DECIMALS - STORED_DECIMALS)
+K_SCALE = pow(1000, 2)
+
+
+def expand_to_sqrt_domain(amount):
+    if type(amount) == int:
+        return amount * pow(10, SQRT_DOMAIN_EXPONENT)
+    if type(amount) == ContractingDecimal:
+        amount = amount._d
+
+    return int(decimal.Decimal(amount).scaleb(SQRT_DOMAIN_EXPONENT))
+
+
+def assert_k(tau_balance, token_balance, tau_in, token_in, tau_reserve, token_reserve):
+    tau_balance_adjusted = (expand_to_sqrt_domain(tau_balance) + K_UNIT) * 1000 - expand_to_sqrt_domain(tau_in) * 3
+    token_balance_adjusted = (expand_to_sqrt_domain(token_balance) + K_UNIT) * 1000 - expand_to_sqrt_domain(token_in) * 3
+    k = expand_to_sqrt_domain(tau_reserve) * expand_to_sqrt_domain(token_reserve)
+    assert tau_balance_adjusted * token_balance_adjusted >= k * K_SCALE, 'UniswapV2: K'
+
+
+def isqrt(n):
+    if n < 2:
+        return n
+
+    x = pow(2, (n.bit_length() + 1) // 2)
+    y = (x + n // x) // 2
+    while y < x:
+        x = y
+        y = (x + n // x) // 2
+
+    return x
+
+
+class ExactMath:
+    minimum_liquidity = (MINIMUM_LIQUIDITY / pow(10, TOKEN_DECIMALS)) * ONE # expand_to_token_decimals
+    fee_percentage = ContractingDecimal('0.3') / 100
+
+    # kwargs go through the executor, which turns floats into ContractingDecimal
+    @staticmethod
+    def value(amount):
+        return as_contract_value(amount)
+
+    # Hash writes turn Decimal/float into ContractingDecimal, values inside lists are stored as they are
+    @staticmethod
+    def store(value):
+        if type(value) == decimal.Decimal or type(value) == float:
+            return ContractingDecimal(str(value))
+        return value
+
+    @staticmethod
+    def sqrt(y):
+        return ContractingDecimal(isqrt(expand_to_sqrt_domain(y))) / pow(10, TOKEN_DECIMALS)
+
+
+# One dex_pairs pair, with the token balances of the dex_pairs contract it is read against.
+# address is the dex_pairs contract name: LP tokens sent there are what burn() burns.
+class PairModel:
+    def __init__(self, fee_to=ZERO_ADDRESS, address='dex_pairs'):
+        self.math = ExactMath
+        self.fee_to = fee_to
+        self.address = address
+
+        # pairs[tau, token] record
+        self.tau_reserve = 0
+        self.token_reserve = 0
+        self.lp_token_supply = 0
+        self.k_last = 0
+
+        # pairs[tau, token, 'lp_token_balance', account]
+        self.lp_token_balances = {}
+
+        # tau.balance_of(dex_pairs) / token.balance_of(dex_pairs) and pairs[token, 'balance']
+        # Only direct transfers are modelled, deposits always reach the pair through collect_input's balance_of read
+        self.tau_balance = 0
+        self.token_balance = 0
+        self.tau_tracked = 0
+        self.token_tracked = 0
+
+    def state(self):
+        return {
+            'tau_reserve': self.tau_reserve,
+            'token_reserve': self.token_reserve,
+            'lp_token_supply': self.lp_token_supply,
+            'kLast': self.k_last,
+            'lp_token_balances': dict(self.lp_token_balances)
+        }
+
+    def lp_token_balance(self, account):
+        return self.lp_token_balances.get(account)
+
+    # tau.transfer(amount, dex_pairs) / token.transfer(amount, dex_pairs)
+    def deposit(self, tau_amount=0, token_amount=0):
+        store = self.math.store
+        if tau_amount:
+            tau_amount = self.math.value(tau_amount)
+            assert tau_amount > 0, 'Cannot send negative balances!'
+            self.tau_balance = store(self.tau_balance + tau_amount)
+        if token_amount:
+            token_amount = self.math.value(token_amount)
+            assert token_amount > 0, 'Cannot send negative balances!'
+            self.token_balance = store(self.token_balance + token_amount)
+
+    # dex_pairs.transfer - LP tokens
+    def transfer(self, sender, to, amount):
+        amount = self.math.value(amount)
+        store = self.math.store
+        assert amount > 0, 'Cannot send negative balances!'
+
+        sender_balance = self.lp_token_balances.get(sender)
+        assert sender_balance is not None, 'Invalid sender'
+        assert sender_balance >= amount, 'Not enough coins to send!'
+
+        self.lp_token_balances[sender] = store(sender_balance - amount)
+        to_balance = self.lp_token_balances.get(to)
+        self.lp_token_balances[to] = store(amount + to_balance if to_balance is not None else amount)
+
+    # mint_fee - returns the fee liquidity to mint to fee_to, or None.
+    # Its kLast reset is left to the callers, see k_last_after
+    def mint_fee(self, tau_reserve, token_reserve):
+        sqrt = self.math.sqrt
+        if self.fee_to != ZERO_ADDRESS and self.k_last != 0:
+            root_k = sqrt(tau_reserve * token_reserve)
+            root_k_last = sqrt(self.k_last)
+            if root_k > root_k_last:
+                numerator = self.lp_token_supply * (root_k - root_k_last)
+                denominator = (root_k * 5) + root_k_last
+                liquidity = numerator / denominator
+                if liquidity > 0:
+                    return liquidity
+
+        return None
+
+    # kLast after a mint/burn: the new reserves' product while the fee is on, reset to 0 by mint_fee while it's off
+    def k_last_after(self, tau_reserve, token_reserve):
+        return tau_reserve * token_reserve if self.fee_to != ZERO_ADDRESS else 0
+
+    # mint_lp_tokens, applied to a dict of staged LP balances
+    def credit(self, balances, account, amount):
+        balance = balances.get(account, self.lp_token_balances.get(account))
+        balances[account] = self.math.store(balance + amount if balance is not None else amount)
+
+    def mint(self, to_address):
+        tau_reserve = self.tau_reserve
+        token_reserve = self.token_reserve
+
+        tau_amount = self.tau_balance - self.tau_tracked
+        token_amount = self.token_balance - self.token_tracked
+        assert tau_amount > 0 and token_amount > 0, 'Invalid token amount'
+        tau_tracked, token_tracked = self.tau_balance, self.token_balance
+
+        lp_token_supply = self.lp_token_supply
+        balances = {}
+
+        fee_liquidity = self.mint_fee(tau_reserve, token_reserve)
+        if fee_liquidity is not None:
+            lp_token_supply += fee_liquidity
+            self.credit(balances, self.fee_to, fee_liquidity)
+
+        if lp_token_supply == 0:
+            liquidity = self.math.sqrt(tau_amount * token_amount) - self.math.minimum_liquidity
+            lp_token_supply += self.math.minimum_liquidity
+            self.credit(balances, ZERO_ADDRESS, self.math.minimum_liquidity)
+        else:
+            liquidity = min(
+                (tau_amount * lp_token_supply) / tau_reserve,
+                (token_amount * lp_token_supply) / token_reserve
+            )
+
+        assert liquidity > 0, 'Insufficient liquidity minted'
+        lp_token_supply += liquidity
+        self.credit(balances, to_address, liquidity)
+
+        new_tau_reserve = tau_reserve + tau_amount
+        new_token_reserve = token_reserve + token_amount
+
+        self.lp_token_supply = lp_token_supply
+        self.lp_token_balances.update(balances)
+        self.k_last = self.k_last_after(new_tau_reserve, new_token_reserve)
+        self.tau_tracked, self.token_tracked = tau_tracked, token_tracked
+        self.sync(new_tau_reserve, new_token_reserve)
+
+        return to_address, tau_amount, token_amount
+
+    # Burns the LP tokens held by the pair contract, against the reserves
+    def burn(self, to_address):
+        tau_reserve = self.tau_reserve
+        token_reserve = self.token_reserve
+
+        lp_token_liquidity = self.lp_token_balances.get(self.address)
+        assert lp_token_liquidity is not None, 'No liquidity to burn'
+
+        lp_token_supply = self.lp_token_supply
+        balances = {}
+
+        fee_liquidity = self.mint_fee(tau_reserve, token_reserve)
+        if fee_liquidity is not None:
+            lp_token_supply += fee_liquidity
+            self.credit(balances, self.fee_to, fee_liquidity)
+
+        tau_amount = (lp_token_liquidity * tau_reserve) / lp_token_supply
+        token_amount = (lp_token_liquidity * token_reserve) / lp_token_supply
+        assert tau_amount > 0 and token_amount > 0, 'Insufficient liquidity burned'
+
+        # burn_lp_tokens + send() out
+        lp_token_supply -= lp_token_liquidity
+        balances[self.address] = self.math.store(balances.get(self.address, lp_token_liquidity) - lp_token_liquidity)
+        tau_balance = self.withdraw(self.tau_balance, tau_amount)
+        token_balance = self.withdraw(self.token_balance, token_amount)
+
+        pair_tau_balance = tau_reserve - tau_amount
+        pair_token_balance = token_reserve - token_amount
+
+        self.lp_token_supply = lp_token_supply
+        self.lp_token_balances.update(balances)
+        self.tau_balance = tau_balance
+        self.token_balance = token_balance
+        self.tau_tracked = self.math.store(self.tau_tracked - tau_amount)
+        self.token_tracked = self.math.store(self.token_tracked - token_amount)
+        self.k_last = self.k_last_after(pair_tau_balance, pair_token_balance)
+        self.sync(pair_tau_balance, pair_token_balance)
+
+        return tau_amount, token_amount
+
+    # Returns (tau_in, token_in)
+    def swap(self, tau_out, token_out):
+        tau_out = self.math.value(tau_out)
+        token_out = self.math.value(token_out)
+        assert not (tau_out > 0 and token_out > 0), 'Only one Coin Out allowed'
+        assert tau_out > 0 or token_out > 0, 'Insufficient Ouput Amount'
+
+        tau_reserve = self.tau_reserve
+        token_reserve = self.token_reserve
+        assert tau_reserve > tau_out and token_reserve > token_out, 'UniswapV2: Insuficient Liquidity and Reserves'
+
+        # send()
+        tau_balance, tau_tracked = self.tau_balance, self.tau_tracked
+        token_balance, token_tracked = self.token_balance, self.token_tracked
+        if tau_out > 0:
+            tau_balance = self.withdraw(tau_balance, tau_out)
+            tau_tracked = self.math.store(tau_tracked - tau_out)
+        if token_out > 0:
+            token_balance = self.withdraw(token_balance, token_out)
+            token_tracked = self.math.store(token_tracked - token_out)
+
+        # collect_input, after the flash swap callee would have run
+        tau_paid = tau_balance - tau_tracked
+        token_paid = token_balance - token_tracked
+        tau_tracked, token_tracked = tau_balance, token_balance
+
+        new_pair_tau_balance = tau_reserve + (tau_paid - tau_out)
+        new_pair_token_balance = token_reserve + (token_paid - token_out)
+
+        tau_in = new_pair_tau_balance - (tau_reserve - tau_out) if new_pair_tau_balance > tau_reserve - tau_out else 0
+        token_in = new_pair_token_balance - (token_reserve - token_out) if new_pair_token_balance > token_reserve - token_out else 0
+        assert tau_in > 0 or token_in > 0, 'UniswapV2: Insufficient Input Amount'
+        assert_k(new_pair_tau_balance, new_pair_token_balance, tau_in, token_in, tau_reserve, token_reserve)
+
+        self.tau_balance = tau_balance
+        self.token_balance = token_balance
+        self.tau_tracked, self.token_tracked = tau_tracked, token_tracked
+        self.sync(new_pair_tau_balance, new_pair_token_balance)
+
+        return tau_in, token_in
+
+    # token.transfer(amount, to) out of dex_pairs - returns the new dex_pairs balance
+    def withdraw(self, balance, amount):
+        assert amount > 0, 'Cannot send negative balances!'
+        assert balance >= amount, 'Not enough coins to send!'
+        return self.math.store(balance - amount)
+
+    # update()
+    def sync(self, tau_reserve, token_reserve):
+        self.tau_reserve = tau_reserve
+        self.token_reserve = token_reserve
+
+
+# One market of the lamden-version dex
+class MarketModel:
+    def __init__(self, currency_amount, token_amount):
+        self.math = ExactMath
+        currency_amount = self.math.value(currency_amount)
+        token_amount = self.math.value(token_amount)
+        assert currency_amount > 0 and token_amount > 0, 'Must provide currency amount and token amount!'
+
+        self.currency_reserve = currency_amount
+        self.token_reserve = token_amount
+
+    # Buy takes fee from the crypto being transferred in - returns tokens purchased
+    def buy(self, currency_amount):
+        currency_amount = self.math.value(currency_amount)
+        assert currency_amount > 0, 'Must provide currency amount!'
+
+        currency_reserve, token_reserve = self.currency_reserve, self.token_reserve
+        k = currency_reserve * token_reserve
+
+        new_currency_reserve = currency_reserve + currency_amount
+        new_token_reserve = k / new_currency_reserve
+
+        tokens_purchased = token_reserve - new_token_reserve
+
+        fee = tokens_purchased * self.math.fee_percentage
+
+        tokens_purchased -= fee
+        new_token_reserve += fee
+
+        assert tokens_purchased > 0, 'Token reserve error!'
+
+        self.currency_reserve, self.token_reserve = new_currency_reserve, new_token_reserve
+        return tokens_purchased
+
+    # Sell takes fee from crypto being transferred out - returns currency purchased
+    def sell(self, token_amount):
+        token_amount = self.math.value(token_amount)
+        assert token_amount > 0, 'Must provide currency amount and token amount!'
+
+        currency_reserve, token_reserve = self.currency_reserve, self.token_reserve
+        k = currency_reserve * token_reserve
+
+        new_token_reserve = token_reserve + token_amount
+
+        new_currency_reserve = k / new_token_reserve
+
+        currency_purchased = currency_reserve - new_currency_reserve
+
+        fee = currency_purchased * self.math.fee_percentage
+
+        currency_purchased -= fee
+        new_currency_reserve += fee
+
+        assert currency_purchased > 0, 'Token reserve error!'
+
+        self.currency_reserve, self.token_reserve = new_currency_reserve, new_token_reserve
+        return currency_purchased
+
+
+# Random dex_pairs workload. Amounts are floats, which the executor and the model both turn into
+# ContractingDecimal the same way. Each operation is one or more transactions:
+#   ['mint', tau_amount, token_amount, to]  - deposit both tokens, mint_liquidity
+#   ['swap', amount_in, tau_in, fraction]   - deposit amount_in, swap out fraction of the fee-adjusted quote,
+#                                             slightly above 1 now and then, which the K check rejects
+#   ['burn', account, share, to]            - send share of account's LP tokens to the pair, burn_liquidity
+def random_operations(rng, count, accounts=('alice', 'bob', 'carol'), weights=(1, 6, 1)):
+    kinds = rng.choices(['mint', 'swap', 'burn'], weights=weights, k=count)
+    for kind in kinds:
+        amount = round(rng.lognormvariate(0, 2), 6) + 0.000001
+        if kind == 'mint':
+            yield ['mint', amount, round(amount * rng.uniform(0.1, 10), 6) + 0.000001, rng.choice(accounts)]
+        elif kind == 'swap':
+            yield ['swap', amount, rng.random() < 0.5, round(rng.uniform(0.5, 1.01), 4)]
+        else:
+            yield ['burn', rng.choice(accounts), round(rng.uniform(0.01, 1.0), 4), rng.choice(accounts)]
+
+
+# UniswapV2Library.getAmountOut, used to size random swaps
+def amount_out(model, amount_in, tau_in):
+    reserve_in, reserve_out = (model.tau_reserve, model.token_reserve) if tau_in else (model.token_reserve, model.tau_reserve)
+    if reserve_in <= 0 or reserve_out <= 0:
+        return 0
+    amount_in_with_fee = amount_in * 997
+    return (amount_in_with_fee * reserve_out) / (reserve_in * 1000 + amount_in_with_fee)
+
+
+# The transactions of one operation, matching one contract call each:
+#   ['deposit', tau_amount, token_amount]   => tau.transfer / token.transfer to dex_pairs
+#   ['transfer', account, amount]          => dex_pairs.transfer of LP tokens to dex_pairs, signed by account
+#   ['mint', to] / ['burn', to]            => mint_liquidity / burn_liquidity
+#   ['swap', tau_out, token_out]           => swap
+# A generator, so each transaction is sized from the model state left by the previous one
+def transactions(model, operation):
+    kind = operation[0]
+    store = model.math.store
+
+    if kind == 'mint':
+        _, tau_amount, token_amount, to_address = operation
+        yield ['deposit', tau_amount, token_amount]
+        yield ['mint', to_address]
+
+    elif kind == 'swap':
+        _, amount_in, tau_in, fraction = operation
+        out = store(store(amount_out(model, model.math.value(amount_in), tau_in)) * model.math.value(fraction))
+        yield ['deposit', amount_in, 0] if tau_in else ['deposit', 0, amount_in]
+        yield ['swap', 0, out] if tau_in else ['swap', out, 0]
+
+    else:
+        _, account, share, to_address = operation
+        balance = model.lp_token_balance(account)
+        yield ['transfer', account, store((balance or 0) * model.math.value(share))]
+        yield ['burn', to_address]
+
+
+def execute(model, transaction):
+    kind = transaction[0]
+    if kind == 'deposit':
+        return model.deposit(transaction[1], transaction[2])
+    if kind == 'transfer':
+        return model.transfer(transaction[1], model.address, transaction[2])
+    if kind == 'mint':
+        return model.mint(transaction[1])
+    if kind == 'burn':
+        return model.burn(transaction[1])
+    return model.swap(transaction[1], transaction[2])
+
+
+# Applies one operation, returns its result - or the AssertionError of the transaction that failed
+def apply(model, operation):
+    result = None
+    for transaction in transactions(model, operation):
+        try:
+            result = execute(model, transaction)
+        except AssertionError as e:
+            return e
+
+    return result
+
+
+# Steps `count` random operations, returns (operations applied, failed)
+def simulate(count, seed=0, model=None):
+    model = model or PairModel()
+    rng = random.Random(seed)
+    failed = 0
+    for operation in random_operations(rng, count):
+        if isinstance(apply(model, operation), AssertionError):
+            failed += 1
+
+    return count, failed
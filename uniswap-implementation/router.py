@@ -0,0 +1,125 @@
+# UniswapV2Router02.sol - multi-hop routing over dex_pairs
+# A path is a list of token contracts, e.g. ['eth', 'tau', 'btc'] trades eth => tau => btc
+# Every hop must have a pair, in either (tau_contract, token_contract) order - dex_pairs.get_pair resolves both
+I = importlib
+
+def get_dex_pairs_interface(dex_pairs_contract):
+    dex_pairs = I.import_module(dex_pairs_contract)
+    # assert I.enforce_interface(dex_pairs, dex_pairs_interface), 'Dex pairs contract does not meet the required interface'
+
+    return dex_pairs
+
+# UniswapV2Library.sol => getAmountOut
+# given an input amount of an asset and pair reserves, returns the maximum output amount of the other asset
+def get_amount_out(amount_in, reserve_in, reserve_out):
+    assert amount_in > 0, 'Insufficient input amount'
+    assert reserve_in > 0 and reserve_out > 0, 'Insufficient liquidity'
+
+    amount_in_with_fee = amount_in * 997 * 1.0 # turn it into contracting decimal
+    return (amount_in_with_fee * reserve_out) / ((reserve_in * 1000) + amount_in_with_fee)
+
+# UniswapV2Library.sol => getAmountIn
+# given an output amount of an asset and pair reserves, returns the required input amount of the other asset
+def get_amount_in(amount_out, reserve_in, reserve_out):
+    assert amount_out > 0, 'Insufficient output amount'
+    assert reserve_in > 0 and reserve_out > amount_out, 'Insufficient liquidity'
+
+    return (reserve_in * amount_out * 1000 * 1.0) / ((reserve_out - amount_out) * 997) # turn it into contracting decimal
+
+# Resolve the pair for a hop, returns [tau_contract, token_contract, reserve_in, reserve_out]
+def get_hop(pairs, contract_in, contract_out):
+    assert contract_in != contract_out, 'Identical contracts in path'
+
+    # Asserts 'Invalid pair' when there's no market between the two contracts
+    return pairs.get_pair(contract_in, contract_out)
+
+def get_hops(pairs, path):
+    assert len(path) >= 2, 'Invalid path'
+
+    hops = []
+    for i in range(len(path) - 1):
+        hops.append(get_hop(pairs, path[i], path[i + 1]))
+
+    return hops
+
+# UniswapV2Library.sol => getAmountsOut
+def calculate_amounts_out(hops, amount_in):
+    amounts = [amount_in]
+    for hop in hops:
+        amounts.append(get_amount_out(amounts[-1], hop[2], hop[3]))
+
+    return amounts
+
+# UniswapV2Library.sol => getAmountsIn
+def calculate_amounts_in(hops, amount_out):
+    amounts = [amount_out]
+    for hop in reversed(hops):
+        amounts.insert(0, get_amount_in(amounts[0], hop[2], hop[3]))
+
+    return amounts
+
+# Pulls the input from the caller, who approved the router for it, and pays it into the first pair's
+# deposit ledger - dex_pairs takes it from the router, so the router approves it in turn
+def deposit_input(dex_pairs, pairs, hop, contract, amount):
+    token = I.import_module(contract)
+    token.transfer_from(amount=amount, to=ctx.this, main_account=ctx.caller)
+    token.approve(amount=amount, to=dex_pairs)
+
+    pairs.deposit(hop[0], hop[1], contract, amount)
+
+# UniswapV2Router02.sol => _swap()
+# Input has to be in the first pair's deposit ledger already. Each hop's output is credited by dex_pairs
+# straight to the next pair's deposit ledger, without leaving dex_pairs - the last hop pays out to to_address
+def swap_path(dex_pairs, pairs, hops, path, amounts, to_address):
+    for i in range(len(hops)):
+        tau_contract, token_contract, reserve_in, reserve_out = hops[i]
+        amount_out = amounts[i + 1]
+
+        to_pair = None
+        recipient = to_address
+        if i < len(hops) - 1 :
+            to_pair = [hops[i + 1][0], hops[i + 1][1]]
+            recipient = dex_pairs
+
+        if path[i + 1] == token_contract :
+            pairs.swap(tau_contract, token_contract, 0, amount_out, recipient, to_pair=to_pair)
+        else :
+            pairs.swap(tau_contract, token_contract, amount_out, 0, recipient, to_pair=to_pair)
+
+@export
+def get_amounts_out(dex_pairs: str, amount_in: float, path: list):
+    pairs = get_dex_pairs_interface(dex_pairs)
+    return calculate_amounts_out(get_hops(pairs, path), amount_in)
+
+@export
+def get_amounts_in(dex_pairs: str, amount_out: float, path: list):
+    pairs = get_dex_pairs_interface(dex_pairs)
+    return calculate_amounts_in(get_hops(pairs, path), amount_out)
+
+# UniswapV2Router02.sol => swapExactTokensForTokens()
+@export
+def swap_exact_in(dex_pairs: str, amount_in: float, amount_out_min: float, path: list, to_address: str):
+    pairs = get_dex_pairs_interface(dex_pairs)
+    hops = get_hops(pairs, path)
+
+    amounts = calculate_amounts_out(hops, amount_in)
+    assert amounts[-1] >= amount_out_min, 'Insufficient output amount'
+
+    deposit_input(dex_pairs, pairs, hops[0], path[0], amount_in)
+
+    swap_path(dex_pairs, pairs, hops, path, amounts, to_address)
+    return amounts
+
+# UniswapV2Router02.sol => swapTokensForExactTokens()
+@export
+def swap_exact_out(dex_pairs: str, amount_out: float, amount_in_max: float, path: list, to_address: str):
+    pairs = get_dex_pairs_interface(dex_pairs)
+    hops = get_hops(pairs, path)
+
+    amounts = calculate_amounts_in(hops, amount_out)
+    assert amounts[0] <= amount_in_max, 'Excessive input amount'
+
+    deposit_input(dex_pairs, pairs, hops[0], path[0], amounts[0])
+
+    swap_path(dex_pairs, pairs, hops, path, amounts, to_address)
+    return amounts
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Off-chain modules live next to the contracts, in uniswap-implementation/offchain
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# contracting_driver.py is shared with lamden-version, it lives in the repository root
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
@@ -0,0 +1,247 @@
+# Proof of concept contracts, submitted as closures - an ERC20 like token (eth) and the first single-token dex (dex)
+# Shared by test_proof_of_concept.py and test_quote_engine.py, which checks quote_engine against get_trade_details_many
+
+def eth() :
+    balances = Hash(default_value=0)
+
+    @construct
+    def seed():
+        balances[ctx.caller] = 288_090_567
+
+    @export
+    def transfer(amount: float, to: str):
+        assert amount > 0, 'Cannot send negative balances!'
+
+        sender = ctx.caller
+
+        assert balances[sender] >= amount, 'Not enough coins to send!'
+
+        balances[sender] -= amount
+        balances[to] += amount
+
+    @export
+    def balance_of(account: str):
+        return balances[account]
+
+    @export
+    def allowance(owner: str, spender: str):
+        return balances[owner, spender]
+
+    @export
+    def approve(amount: float, to: str):
+        assert amount > 0, 'Cannot send negative balances!'
+
+        sender = ctx.caller
+        balances[sender, to] += amount
+        return balances[sender, to]
+
+    @export
+    def transfer_from(amount: float, to: str, main_account: str):
+        assert amount > 0, 'Cannot send negative balances!'
+
+        sender = ctx.caller
+
+        assert balances[
+                   main_account, sender] >= amount, 'Not enough coins approved to send! You have {} and are trying to spend {}' \
+            .format(balances[main_account, sender], amount)
+        assert balances[main_account] >= amount, 'Not enough coins to send!'
+
+        balances[main_account, sender] -= amount
+        balances[main_account] -= amount
+
+        balances[to] += amount
+
+def dex():
+    # Illegal use of a builtin
+    # import time
+    import currency
+    I = importlib
+
+    # Enforceable interface
+    token_interface = [
+        I.Func('transfer', args=('amount', 'to')),
+        # I.Func('balance_of', args=('account')),
+        I.Func('allowance', args=('owner', 'spender')),
+        I.Func('approve', args=('amount', 'to')),
+        I.Func('transfer_from', args=('amount', 'to', 'main_account'))
+    ]
+
+    pairs = Hash()
+    prices = Hash()
+
+    # Largest list of amounts get_trade_details_many accepts
+    MAX_TRADE_DETAILS = 100
+
+    # Get token modules, validate & return
+    def get_interface(token_contract):
+        # Make sure that what is imported is actually a valid token
+        token = I.import_module(token_contract)
+        assert I.enforce_interface(token, token_interface), 'Token contract does not meet the required interface'
+
+        return token
+
+    # Amounts inside a list skip the executor's float -> decimal conversion of kwargs, convert them the same way
+    def as_amount(amount):
+        if isinstance(amount, int):
+            return amount
+        return decimal(str(amount))
+
+    def calculate_trade_details(token_contract, tau_in, token_in):
+        # First we need to get tau + token reserve
+        tau_reserve = pairs[token_contract, 'tau_reserve']
+        token_reserve = pairs[token_contract, 'token_reserve']
+
+        return calculate_trade_details_from_reserves(tau_reserve, token_reserve, tau_in, token_in)
+
+    def calculate_trade_details_from_reserves(tau_reserve, token_reserve, tau_in, token_in):
+        lp_total = tau_reserve * token_reserve
+
+        # Calculate new reserve based on what was passed in
+        tau_reserve_new = tau_reserve + tau_in if tau_in > 0 else 0
+        token_reserve_new = token_reserve + token_in if token_in > 0 else 0
+
+        # Calculate remaining reserve
+        tau_reserve_new = lp_total / token_reserve_new if token_in > 0 else tau_reserve_new
+        token_reserve_new = lp_total / tau_reserve_new if tau_in > 0 else token_reserve_new
+
+        # Calculate how much will be removed
+        tau_out = tau_reserve - tau_reserve_new if token_in > 0 else 0
+        token_out = token_reserve - token_reserve_new if tau_in > 0  else 0
+
+        # Finally, calculate the slippage incurred
+        tau_slippage = (tau_reserve / tau_reserve_new) -1 if token_in > 0 else 0
+        token_slippage = (token_reserve / token_reserve_new) -1 if tau_in > 0 else 0
+
+        return tau_out, token_out, tau_slippage, token_slippage
+
+    # From UniV2Pair.sol
+    def update(token, tau_balance, token_balance):
+        pairs[token.token_name(), 'tau_reserve'] = tau_balance
+        pairs[token.token_name(), 'token_reserve'] = token_balance
+
+    def swap(token, tau_out, token_out, to):
+        assert not (tau_out > 0 and token_out > 0), 'Only one Coin Out allowed'
+        assert tau_out > 0 or token_out > 0, 'Insufficient Ouput Amount'
+
+        tau_reserve = pairs[token.token_name(), 'tau_reserve']
+        token_reserve = pairs[token.token_name(), 'token_reserve']
+
+        assert tau_reserve > tau_out and token_reserve > token_out, 'UniswapV2: Inssuficient Liquidity'
+
+        if tau_out > 0 :
+            currency.transfer_from(tau_out, ctx.this, to)
+        if token_out > 0 :
+            token.transfer_from(token_out, ctx.this, to)
+
+        tau_balance = currency.balance_of(ctx.this)
+        token_balance = token.balance_of(ctx.this)
+
+        update(token, tau_balance, token_balance)
+
+    @construct
+    def seed():
+        pairs['count'] = 0
+
+    @export
+    # Number of pairs created
+    def get_length_pairs():
+        return pairs['count']
+
+    @export
+    # Returns the total reserves from each tau/token
+    def get_reserves(token_contract:str):
+        return pairs[token_contract, 'tau_reserve'], \
+                pairs[token_contract, 'token_reserve']
+
+    @export
+    # Pass contracts + tokens_in, get: tokens_out, slippage
+    def get_trade_details(token_contract: str, tau_in: int, token_in: int):
+        return calculate_trade_details(token_contract, tau_in, token_in)
+
+    @export
+    # Pass contracts + a list of [tau_in, token_in], get [tokens_out, slippage] for each - reserves are read once
+    # Mirrored off-chain by offchain/quote_engine.trade_details_many
+    def get_trade_details_many(token_contract: str, amounts: list):
+        assert len(amounts) <= MAX_TRADE_DETAILS, 'At most {} amounts'.format(MAX_TRADE_DETAILS)
+
+        tau_reserve = pairs[token_contract, 'tau_reserve']
+        token_reserve = pairs[token_contract, 'token_reserve']
+
+        details = []
+        for tau_in, token_in in amounts:
+            details.append(list(calculate_trade_details_from_reserves(tau_reserve, token_reserve, as_amount(tau_in), as_amount(token_in))))
+
+        return details
+
+    @export
+    # Swap tau or tokens
+    def token_swap(token_contract: str, tau_in: float, token_in: float, to: str):
+        assert tau_in > 0 or token_in > 0, 'Invalid amount!'
+        assert not (tau_in > 0 and token_in > 0), 'Swap only accepts one currecy!'
+
+        assert not pairs[token_contract] is None, 'Invalid token ID!'
+        assert pairs[token_contract, 'tau_reserve'] > 0
+        assert pairs[token_contract, 'token_reserve'] > 0
+
+        token = get_interface(token_contract)
+
+        # 1 - Calculate trade outcome
+        tau_out, token_out, tau_slippage, token_slippage = calculate_trade_details(
+            token_contract,
+            tau_in,
+            token_in
+        )
+
+        # 2 - Transfer in tokens
+        if tau_in > 0: currency.transfer(tau_in, ctx.this)
+        if token_in > 0: token.transfer(token_in, ctx.this)
+
+        # 3 - Swap/transfer out tokens + Update
+        swap(token, tau_out, token_out, to)
+
+    @export
+    # Pair must exist before liquidity can be added
+    def add_liquidity(contract: str, symbol: str, tau_in: int=0, token_in: int=0):
+        assert token_in > 0
+        assert tau_in > 0
+
+        # Make sure that what is imported is actually a valid token
+        token = get_interface(contract)
+
+        assert not pairs[symbol] is None, 'Market does not exist!'
+
+        # 1 - This contract will own all amounts sent to it
+        currency.transfer_from(tau_in, ctx.this, ctx.caller)
+        token.transfer_from(token_in, ctx.this, ctx.caller)
+
+        tau_liq, tok_liq = pairs[symbol, 'liquidity']
+        pairs[symbol, 'liquidity'] = [tau_liq + tau_in, tok_liq + token_in]
+
+        # Track liquidity provided by signer
+        # # TODO - If we care about "% pool" This needs to remain updated as market swings along X,Y
+        # if pairs[token_contract, ctx.signer] is None :
+        #     pairs[token_contract, 'tau_liquidity', ctx.signer] = tau_in
+        #     pairs[token_contract, 'token_liquidity', ctx.signer] = token_in
+        # else :
+        #     pairs[token_contract, 'tau_liquidity', ctx.signer] += tau_in
+        #     pairs[token_contract, 'token_liquidity', ctx.signer] += token_in
+
+
+    @export
+    # Create pair before doing anything else
+    def create_pair(contract: str, symbol: str, tau_in: int=0, token_in: int=0):
+        # Make sure that what is imported is actually a valid token
+        get_interface(contract)
+
+        symbol = symbol.upper()
+
+        assert pairs[symbol] is None, 'Market already exists!'
+
+        assert tau_in > 0, 'Provide tau liquidity!'
+        assert token_in > 0, 'Provide token liquidity!'
+
+        pairs[symbol] = contract
+
+        pairs['count'] += 1
+
+        add_liquidity(contract, symbol, tau_in, token_in)
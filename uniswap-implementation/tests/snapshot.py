@@ -0,0 +1,17 @@
+import copy
+
+# In-memory snapshot of a ContractingClient's driver state.
+# Deploy once, snapshot, and restore before each test instead of flushing and resubmitting every contract.
+#
+# Transactions run with the client's default auto_commit=False, so everything written after the snapshot
+# lives in the driver cache / pending writes. Restoring swaps those back, the backing store is never touched.
+class StateSnapshot:
+    def __init__(self, driver):
+        self.driver = driver
+        self.cache = copy.deepcopy(driver.cache)
+        self.pending_writes = copy.deepcopy(driver.pending_writes)
+
+    def restore(self):
+        self.driver.clear_pending_state()
+        self.driver.cache.update(copy.deepcopy(self.cache))
+        self.driver.pending_writes.update(copy.deepcopy(self.pending_writes))
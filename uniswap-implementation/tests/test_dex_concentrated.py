@@ -0,0 +1,348 @@
+import math
+import os
+from unittest import TestCase
+from contracting.client import ContractingClient
+
+from contracting_driver import worker_driver
+from snapshot import StateSnapshot
+
+Q96 = pow(2, 96)
+MIN_TICK = -887272
+MAX_TICK = 887272
+TICK_SPACING = 60
+STARTING_BALANCE = 10000
+
+# Widest range on the tick spacing, behaves like a constant product pair
+FULL_RANGE = [-887220, 887220]
+
+# Holds a position in its own name - approves dex_concentrated and mints, paid from its own balances
+def position_manager():
+    @export
+    def mint(tick_lower: int, tick_upper: int, liquidity: int):
+        for contract in ['tau', 'eth']:
+            importlib.import_module(contract).approve(amount=100, to='dex_concentrated')
+
+        return importlib.import_module('dex_concentrated').mint(
+            tau_contract='tau', token_contract='eth', tick_lower=tick_lower, tick_upper=tick_upper, liquidity=liquidity
+        )
+
+# Expected values follow UniswapV3's TickMath / SqrtPriceMath, checked against plain floats
+class DexConcentratedSpecs(TestCase):
+
+    # deploy once for the whole class, every test starts from this snapshot
+    @classmethod
+    def setUpClass(cls):
+        cls.client = ContractingClient(driver=worker_driver())
+        cls.client.flush()
+
+        cls.wallet_address = 'wallet_address'
+
+        with open('../currency.py') as f:
+            cls.client.submit(f.read(), 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': cls.wallet_address,
+                'vk_amount': STARTING_BALANCE
+            })
+
+        with open('../basetoken.py') as f:
+            cls.client.submit(f.read(), name='eth', constructor_args={
+                's_name': 'eth',
+                's_symbol': 'ETH',
+                'vk': cls.wallet_address,
+                'vk_amount': STARTING_BALANCE
+            })
+
+        with open('../dex.py') as f:
+            cls.client.submit(f.read(), 'dex', constructor_args={
+                'fee_to_setter_address': 'fee_to_setter_address'
+            })
+
+        # Initialize ownership to dex
+        with open('../dex_concentrated.py') as f:
+            cls.client.submit(f.read(), 'dex_concentrated', constructor_args={
+                'owner_address': 'dex'
+            })
+
+        # Created through the same factory as dex_pairs, starting at a price of 1
+        cls.client.signer = cls.wallet_address
+        cls.client.get_contract('dex').create_pair(
+            dex_pairs='dex_concentrated',
+            tau_contract='tau',
+            token_contract='eth'
+        )
+        cls.client.get_contract('dex_concentrated').initialize_price(
+            tau_contract='tau',
+            token_contract='eth',
+            sqrt_price_x96=Q96
+        )
+
+        # Payments are pulled with transfer_from
+        for token in ['tau', 'eth']:
+            cls.client.get_contract(token).approve(amount=STARTING_BALANCE, to='dex_concentrated')
+
+        cls.snapshot = StateSnapshot(cls.client.raw_driver)
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.snapshot.restore()
+        self.change_signer(self.wallet_address)
+
+    def change_signer(self, name):
+        self.client.signer = name
+
+        self.tau = self.client.get_contract('tau')
+        self.eth = self.client.get_contract('eth')
+        self.dex = self.client.get_contract('dex')
+        self.pools = self.client.get_contract('dex_concentrated')
+
+    def pool(self):
+        return self.pools.pair(tau_contract='tau', token_contract='eth')
+
+    def mint(self, tick_lower, tick_upper, liquidity):
+        return self.pools.mint(tau_contract='tau', token_contract='eth', tick_lower=tick_lower, tick_upper=tick_upper, liquidity=liquidity)
+
+    def mint_amounts(self, tick_lower, tick_upper, tau_amount, token_amount):
+        liquidity = self.pools.liquidity_for_amounts(
+            tau_contract='tau',
+            token_contract='eth',
+            tick_lower=tick_lower,
+            tick_upper=tick_upper,
+            amount_tau=tau_amount,
+            amount_token=token_amount
+        )
+        return liquidity, self.mint(tick_lower, tick_upper, liquidity)
+
+    def swap(self, tau_in, amount_in, **kwargs):
+        return self.pools.swap(
+            tau_contract='tau',
+            token_contract='eth',
+            tau_in=tau_in,
+            amount_in=amount_in,
+            amount_out_min=0,
+            to_address=self.wallet_address,
+            **kwargs
+        )
+
+    def test_1_tick_math(self):
+        self.assertEqual(self.pools.sqrt_ratio_at_tick(tick=0), Q96)
+        self.assertEqual(self.pools.sqrt_ratio_at_tick(tick=MIN_TICK), 4295128739)
+        self.assertEqual(self.pools.sqrt_ratio_at_tick(tick=MAX_TICK), 1461446703485210103287273052203988822378723970342)
+
+        for tick in [-500000, -100000, -887, -60, -1, 1, 60, 887, 100000, 500000]:
+            sqrt_price_x96 = self.pools.sqrt_ratio_at_tick(tick=tick)
+            self.assertAlmostEqual(sqrt_price_x96 / (math.sqrt(1.0001) ** tick * Q96), 1, places=9)
+
+            # greatest tick at or below the price
+            self.assertEqual(self.pools.tick_at_sqrt_ratio(sqrt_price_x96=sqrt_price_x96), tick)
+            self.assertEqual(self.pools.tick_at_sqrt_ratio(sqrt_price_x96=sqrt_price_x96 - 1), tick - 1)
+
+    def test_2_create_pool(self):
+        self.assertEqual(self.pools.length_pairs(), 1)
+        self.assertEqual(self.pool(), [Q96, 0, 0, 0, 0])
+        # either order finds the pool
+        self.assertEqual(self.pools.pair(tau_contract='eth', token_contract='tau'), self.pool())
+
+        with self.assertRaisesRegex(AssertionError, 'Market already exists!'):
+            self.dex.create_pair(dex_pairs='dex_concentrated', tau_contract='eth', token_contract='tau')
+
+        with self.assertRaisesRegex(AssertionError, 'AI'):
+            self.pools.initialize_price(tau_contract='tau', token_contract='eth', sqrt_price_x96=Q96 * 2)
+
+        with self.assertRaisesRegex(AssertionError, 'FORBIDDEN'):
+            self.pools.initialize(tau_contract='tau', token_contract='other')
+
+    def test_3_mint_in_range(self):
+        liquidity = pow(10, 18)
+        tau_amount, token_amount = self.mint(-60, 60, liquidity)
+
+        # L * (1 - 1 / sqrt(1.0001^60)) of each side at a price of 1, rounded up to TOKEN_DECIMALS
+        expected = 1 - 1 / math.sqrt(1.0001 ** 60)
+        self.assertAlmostEqual(float(tau_amount), expected, places=12)
+        self.assertAlmostEqual(float(token_amount), expected, places=12)
+
+        self.assertEqual(self.tau.balance_of(account=self.wallet_address), STARTING_BALANCE - tau_amount)
+        self.assertEqual(self.eth.balance_of(account=self.wallet_address), STARTING_BALANCE - token_amount)
+        self.assertEqual(self.tau.balance_of(account='dex_concentrated'), tau_amount)
+
+        self.assertEqual(self.pool()[2], liquidity)
+        self.assertEqual(self.pools.get_position(tau_contract='tau', token_contract='eth', owner_address=self.wallet_address, tick_lower=-60, tick_upper=60)[0], liquidity)
+
+        self.assertEqual(self.pools.next_initialized_tick(tau_contract='tau', token_contract='eth', tick=-1, lte=True), [-60, True])
+        self.assertEqual(self.pools.next_initialized_tick(tau_contract='tau', token_contract='eth', tick=0, lte=False), [60, True])
+
+    def test_4_mint_out_of_range(self):
+        # above the price only tau, below it only token
+        tau_amount, token_amount = self.mint(60, 120, pow(10, 18))
+        self.assertGreater(tau_amount, 0)
+        self.assertEqual(token_amount, 0)
+
+        tau_amount, token_amount = self.mint(-120, -60, pow(10, 18))
+        self.assertEqual(tau_amount, 0)
+        self.assertGreater(token_amount, 0)
+
+        # neither is active liquidity
+        self.assertEqual(self.pool()[2], 0)
+
+    def test_5_tick_bitmap(self):
+        for tick_lower, tick_upper in [[-15360, -60], [120, 300], [15360, 30720]]:
+            self.mint(tick_lower, tick_upper, pow(10, 15))
+
+        def next_tick(tick, lte):
+            return self.pools.next_initialized_tick(tau_contract='tau', token_contract='eth', tick=tick, lte=lte)
+
+        self.assertEqual(next_tick(0, False), [120, True])
+        self.assertEqual(next_tick(120, False), [300, True])
+        self.assertEqual(next_tick(299, False), [300, True])
+        self.assertEqual(next_tick(-1, True), [-60, True])
+        self.assertEqual(next_tick(-60, True), [-60, True])
+        # at or left of the tick, within its own word only - -60 sits in the word before tick 0
+        self.assertEqual(next_tick(0, True), [0, False])
+        self.assertEqual(next_tick(-61, True), [-15360, True])
+
+        # one word covers 256 spaced ticks, past it the word boundary comes back uninitialized
+        self.assertEqual(next_tick(300, False), [255 * TICK_SPACING, False])
+        self.assertEqual(next_tick(255 * TICK_SPACING, False), [15360, True])
+        self.assertEqual(next_tick(-15360 - 1, True), [-256 * TICK_SPACING - 256 * TICK_SPACING, False])
+
+        # unused bounds are cleared from the bitmap
+        self.pools.burn(tau_contract='tau', token_contract='eth', tick_lower=120, tick_upper=300, liquidity=pow(10, 15))
+        self.assertEqual(next_tick(0, False), [255 * TICK_SPACING, False])
+
+    def test_6_swap_full_range_matches_constant_product(self):
+        self.mint_amounts(FULL_RANGE[0], FULL_RANGE[1], 1000, 1000)
+
+        amount_in, amount_out = self.swap(True, 1)
+
+        # UniswapV2Library.sol => getAmountOut, with the same 0.3% fee
+        expected = (1 * 997 * 1000) / (1000 * 1000 + 1 * 997)
+        self.assertEqual(amount_in, 1)
+        self.assertAlmostEqual(float(amount_out), expected, places=9)
+
+        self.assertEqual(self.eth.balance_of(account=self.wallet_address), STARTING_BALANCE - 1000 + amount_out)
+        # price of tau went down
+        self.assertLess(self.pool()[1], 0)
+
+    def test_7_swap_crosses_ticks(self):
+        liquidity = pow(10, 21)
+        self.mint(-60, 60, liquidity)
+        self.mint(-180, -60, liquidity * 2)
+
+        # tau in moves the price down, out of the first range and into the second
+        amount_in, amount_out = self.swap(True, 5)
+
+        tick = self.pool()[1]
+        self.assertLess(tick, -60)
+        self.assertGreaterEqual(tick, -180)
+        self.assertEqual(self.pool()[2], liquidity * 2)
+        self.assertEqual(amount_in, 5)
+        self.assertLess(amount_out, 5)
+
+        # and back up, crossing -60 the other way - the fees keep it short of where it started
+        self.swap(False, amount_out)
+        self.assertGreaterEqual(self.pool()[1], -60)
+        self.assertEqual(self.pool()[2], liquidity)
+
+    def test_8_swap_price_limit(self):
+        self.mint(-60, 60, pow(10, 21))
+        limit = self.pools.sqrt_ratio_at_tick(tick=-30)
+
+        # far more than the range holds, only what gets the price to the limit is paid
+        amount_in, amount_out = self.swap(True, 100, sqrt_price_limit_x96=limit)
+
+        self.assertLess(amount_in, 100)
+        self.assertEqual(self.pool()[0], limit)
+        self.assertEqual(self.tau.balance_of(account=self.wallet_address), STARTING_BALANCE - self.tau.balance_of(account='dex_concentrated'))
+
+        with self.assertRaisesRegex(AssertionError, 'SPL'):
+            self.swap(True, 1, sqrt_price_limit_x96=limit)
+
+    def test_9_burn_and_collect_fees(self):
+        liquidity, amounts = self.mint_amounts(-600, 600, 100, 100)
+        tau_paid, token_paid = amounts
+
+        # a round trip leaves the price about where it was, and fees on both sides
+        self.swap(True, 10)
+        self.swap(False, 10)
+
+        tau_burnt, token_burnt = self.pools.burn(tau_contract='tau', token_contract='eth', tick_lower=-600, tick_upper=600, liquidity=liquidity)
+        self.assertEqual(self.pool()[2], 0)
+
+        tau_collected, token_collected = self.pools.collect(tau_contract='tau', token_contract='eth', tick_lower=-600, tick_upper=600, to_address='lp_address')
+        self.assertGreater(tau_collected, tau_burnt)
+        self.assertGreater(token_collected, token_burnt)
+        self.assertAlmostEqual(float(tau_collected - tau_burnt), 10 * 0.003, places=6)
+
+        self.assertEqual(self.tau.balance_of(account='lp_address'), tau_collected)
+        self.assertEqual(self.eth.balance_of(account='lp_address'), token_collected)
+
+        # rounding is always in the pool's favour
+        self.assertGreaterEqual(self.tau.balance_of(account='dex_concentrated'), 0)
+        self.assertGreaterEqual(self.eth.balance_of(account='dex_concentrated'), 0)
+        self.assertLess(tau_collected + token_collected, tau_paid + token_paid + 20)
+
+        # owed amounts are paid out once, the cleared ticks are gone from the bitmap
+        self.assertEqual(list(self.pools.collect(tau_contract='tau', token_contract='eth', tick_lower=-600, tick_upper=600, to_address='lp_address')), [0, 0])
+        self.assertEqual(self.pools.next_initialized_tick(tau_contract='tau', token_contract='eth', tick=0, lte=False), [255 * TICK_SPACING, False])
+
+    # Test = Positions and payments belong to the calling contract, not to the transaction signer
+    def test_10_contract_caller(self):
+        self.client.submit(position_manager, 'position_manager')
+        self.tau.transfer(amount=10, to='position_manager')
+        self.eth.transfer(amount=10, to='position_manager')
+
+        liquidity = pow(10, 18)
+        tau_amount, token_amount = self.client.get_contract('position_manager').mint(tick_lower=-60, tick_upper=60, liquidity=liquidity)
+
+        self.assertEqual(self.tau.balance_of(account='position_manager'), 10 - tau_amount)
+        self.assertEqual(self.eth.balance_of(account='position_manager'), 10 - token_amount)
+        self.assertEqual(self.tau.balance_of(account=self.wallet_address), STARTING_BALANCE - 10)
+
+        def position(owner_address):
+            return self.pools.get_position(tau_contract='tau', token_contract='eth', owner_address=owner_address, tick_lower=-60, tick_upper=60)
+
+        self.assertEqual(position('position_manager')[0], liquidity)
+        self.assertIsNone(position(self.wallet_address))
+
+        # The signer can't burn the contract's liquidity
+        with self.assertRaisesRegex(AssertionError, 'Insufficient liquidity'):
+            self.pools.burn(tau_contract='tau', token_contract='eth', tick_lower=-60, tick_upper=60, liquidity=liquidity)
+
+    # Test = The Lamden currency meets the token interface
+    def test_11_lamden_currency(self):
+        with open(os.path.join(os.path.dirname(__file__), '..', '..', 'lamden-version', 'currency.c.py')) as f:
+            self.client.submit(f.read(), 'currency', signer='sys')
+
+        self.dex.create_pair(dex_pairs='dex_concentrated', tau_contract='currency', token_contract='eth')
+        self.assertEqual(self.pools.length_pairs(), 2)
+
+    # Test = Every call takes the contracts in either order, amounts and tau_in follow the order of the call
+    def test_12_reversed_order_calls(self):
+        liquidity = pow(10, 21)
+
+        # A range above the price only takes tau, the second amount in (eth, tau) order
+        eth_paid, tau_paid = self.pools.mint(tau_contract='eth', token_contract='tau', tick_lower=0, tick_upper=600, liquidity=liquidity)
+        self.assertEqual(eth_paid, 0)
+        self.assertGreater(tau_paid, 0)
+        self.assertEqual(
+            self.pools.liquidity_for_amounts(tau_contract='eth', token_contract='tau', tick_lower=0, tick_upper=600, amount_tau=0, amount_token=tau_paid),
+            self.pools.liquidity_for_amounts(tau_contract='tau', token_contract='eth', tick_lower=0, tick_upper=600, amount_tau=tau_paid, amount_token=0)
+        )
+
+        # eth in, moving the price up into the range - the same trade in either order
+        before = StateSnapshot(self.client.raw_driver)
+        reversed_swap = self.pools.swap(tau_contract='eth', token_contract='tau', tau_in=True, amount_in=1, amount_out_min=0, to_address='trader')
+        pool = self.pool()
+        before.restore()
+        self.assertEqual(self.swap(False, 1), reversed_swap)
+        self.assertEqual(self.pool(), pool)
+        self.assertEqual(self.tau.balance_of(account='trader'), 0)
+
+        burned = self.pools.burn(tau_contract='eth', token_contract='tau', tick_lower=0, tick_upper=600, liquidity=liquidity)
+        collected = self.pools.collect(tau_contract='eth', token_contract='tau', tick_lower=0, tick_upper=600, to_address='lp_address')
+        # collect adds the fees of the eth in, so eth comes first in both
+        self.assertGreater(burned[0], 0)
+        self.assertGreater(collected[0], burned[0])
+        self.assertEqual(collected[1], burned[1])
+        self.assertEqual(self.eth.balance_of(account='lp_address'), collected[0])
+        self.assertEqual(self.tau.balance_of(account='lp_address'), collected[1])
@@ -1,74 +1,103 @@
 from unittest import TestCase
 from contracting.client import ContractingClient
 from contracting.stdlib.bridge.decimal import ContractingDecimal
+from contracting.stdlib.bridge.time import Datetime
+
+from contracting_driver import worker_driver
+from offchain.instrumentation import Instrumentation
+from snapshot import StateSnapshot
 
 MINIMUM_LIQUIDITY = pow(10,3)
 TOKEN_DECIMALS = 18
 STARTING_BALANCE = 10000
 
-# TODO - A2 - Complete UniswapV2: K exceptions
+# Flash swap receiver - pays back repay[contract] of each pair token, optionally trading the same pair again first
+def flash_borrower():
+    repay = Hash(default_value=0)
+    reenter = Variable()
+    received = Variable()
+
+    @export
+    def dex_pairs_call(sender: str, tau_contract: str, token_contract: str, tau_out: float, token_out: float):
+        received.set(importlib.import_module(token_contract).balance_of(ctx.this))
+
+        for contract in [tau_contract, token_contract]:
+            if repay[contract] > 0:
+                importlib.import_module(contract).transfer(repay[contract], 'dex_pairs')
+
+        if reenter.get():
+            importlib.import_module('dex_pairs').swap(tau_contract, token_contract, 0, token_out / 10, ctx.this)
+
 # TODO - A4 - Token Supply Validations.
 # All test values for tests, taken from UniswapV2Pair.specs.ts
 class DexPairsSpecs(TestCase):
 
-    # returns ContractingDecimal
+    # returns ContractingDecimal - divided as a decimal, a float would round the UniswapV2 amounts up past K
     def expand_to_token_decimals(self, amount):
-        return ContractingDecimal(amount / pow(10,TOKEN_DECIMALS))
+        return ContractingDecimal(amount) / pow(10,TOKEN_DECIMALS)
 
-    # before each test, setup the conditions
-    def setUp(self):
-        self.client = ContractingClient()
-        self.client.flush()
+    # deploy once for the whole class, every test starts from this snapshot
+    @classmethod
+    def setUpClass(cls):
+        cls.client = ContractingClient(driver=worker_driver())
+        cls.client.flush()
 
-        self.fee_to_address = 'fee_to_address'
-        self.fee_to_setter_address = 'fee_to_setter_address'
-        self.wallet_address = 'wallet_address'
+        cls.fee_to_address = 'fee_to_address'
+        cls.fee_to_setter_address = 'fee_to_setter_address'
+        cls.wallet_address = 'wallet_address'
 
         # token0
         with open('../currency.py') as f:
             code = f.read()
-            self.client.submit(code, 'tau', constructor_args={
+            cls.client.submit(code, 'tau', constructor_args={
                 's_name': 'tau',
                 's_symbol': 'TAU',
-                'vk': self.wallet_address,
+                'vk': cls.wallet_address,
                 'vk_amount': 10000
             })
 
         # token1
         with open('../basetoken.py') as f:
             code = f.read()
-            self.client.submit(code, name='eth', constructor_args={
+            cls.client.submit(code, name='eth', constructor_args={
                 's_name': 'eth',
                 's_symbol': 'ETH',
-                'vk': self.wallet_address,
+                'vk': cls.wallet_address,
                 'vk_amount': 10000
         })
 
         # Dex
         with open('../dex.py') as f:
             code = f.read()
-            self.client.submit(code, 'dex', constructor_args={
-                'fee_to_setter_address': self.fee_to_setter_address
+            cls.client.submit(code, 'dex', constructor_args={
+                'fee_to_setter_address': cls.fee_to_setter_address
             })
 
         # Dex Pairs
         # Initialize ownership to dex
         with open('../dex_pairs.py') as f:
             code = f.read()
-            self.client.submit(code, 'dex_pairs', constructor_args={
+            cls.client.submit(code, 'dex_pairs', constructor_args={
                 'owner_address': 'dex'
             })
 
-        # Change tx signer to actor1
-        self.change_signer(self.wallet_address)
-
         # Create pair on Dex
-        self.dex.create_pair(
+        cls.client.signer = cls.wallet_address
+        cls.client.get_contract('dex').create_pair(
             dex_pairs='dex_pairs',
             tau_contract='tau',
             token_contract='eth'
         )
 
+        cls.snapshot = StateSnapshot(cls.client.raw_driver)
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.snapshot.restore()
+
+        # Change tx signer to actor1
+        self.change_signer(self.wallet_address)
+
     def change_signer(self, name):
         self.client.signer = name
 
@@ -172,16 +201,20 @@ class DexPairsSpecs(TestCase):
             self.add_liquidity(tau_amount, token_amount)
             self.tau.transfer(amount=swap_amount, to=self.dex_pairs.name)
 
-            # TODO - A2 - Complete UniswapV2: K exceptions
-            # with self.assertRaises(Exception) as context:
-            # self.dex_pairs.swap(
-            #     tau_contract=self.tau.name,
-            #     token_contract=self.eth.name,
-            #     tau_out=0,
-            #     token_out=expected_output_amount + 1.0, # swap more
-            #     to_address=self.wallet_address
-            # )
-            # self.assertTrue('UniswapV2: K' in context.exception, 'UniswapV2 ')
+            # One wei more than getAmountOut
+            with self.assertRaisesRegex(AssertionError, 'UniswapV2: K'):
+                self.dex_pairs.swap(
+                    tau_contract=self.tau.name,
+                    token_contract=self.eth.name,
+                    tau_out=0,
+                    token_out=expected_output_amount + self.expand_to_token_decimals(1), # swap more
+                    to_address=self.wallet_address
+                )
+
+            # The client does not roll back failed transactions
+            self.setUp()
+            self.add_liquidity(tau_amount, token_amount)
+            self.tau.transfer(amount=swap_amount, to=self.dex_pairs.name)
 
             self.dex_pairs.swap(
                 tau_contract=self.tau.name,
@@ -494,3 +527,603 @@ class DexPairsSpecs(TestCase):
         token_balance = self.eth.balance_of(account=self.dex_pairs.name)
         expected_token_balance = self.expand_to_token_decimals(250000187312969 + MINIMUM_LIQUIDITY)
         self.assertAlmostEqual(token_balance, expected_token_balance, places=17)
+
+    # Test = Pair created with the per-field key layout is moved into the packed pair record
+    def test_6_migrate_pair(self):
+        legacy_fields = ['pair_address', 'tau_reserve', 'token_reserve', 'lp_token_supply', 'kLast', 'lp_token_balance']
+        self.client.set_var('dex_pairs', 'pairs', ['tau', 'eth'], value=legacy_fields)
+        self.client.set_var('dex_pairs', 'pairs', ['tau', 'eth', 'tau_reserve'], value=ContractingDecimal(5))
+        self.client.set_var('dex_pairs', 'pairs', ['tau', 'eth', 'token_reserve'], value=ContractingDecimal(10))
+        self.client.set_var('dex_pairs', 'pairs', ['tau', 'eth', 'lp_token_supply'], value=ContractingDecimal(7))
+        self.client.set_var('dex_pairs', 'pairs', ['tau', 'eth', 'kLast'], value=ContractingDecimal(50))
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name)
+
+        # Only the owner (dex) can migrate, dex forwards it for the fee_to_setter
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.migrate_pair(tau_contract=self.tau.name, token_contract=self.eth.name)
+        with self.assertRaises(AssertionError):
+            self.dex.migrate_pair(dex_pairs='dex_pairs', tau_contract=self.tau.name, token_contract=self.eth.name)
+
+        self.dex.migrate_pair(dex_pairs='dex_pairs', tau_contract=self.tau.name, token_contract=self.eth.name, signer=self.fee_to_setter_address)
+
+        tau_reserve, token_reserve = self.dex_pairs.get_pair_reserves(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name
+        )
+        self.assertEqual(tau_reserve, 5)
+        self.assertEqual(token_reserve, 10)
+        self.assertEqual(self.dex_pairs.total_supply(tau_contract=self.tau.name, token_contract=self.eth.name), 7)
+        self.assertIsNone(self.client.get_var('dex_pairs', 'pairs', ['tau', 'eth', 'tau_reserve']))
+
+        with self.assertRaises(AssertionError):
+            self.dex.migrate_pair(dex_pairs='dex_pairs', tau_contract=self.tau.name, token_contract=self.eth.name, signer=self.fee_to_setter_address)
+
+    # Test = Tokens are validated once, when their pair is created
+    def test_7_token_registry(self):
+        assert self.dex_pairs.is_valid_token(token_contract=self.tau.name)
+        assert self.dex_pairs.is_valid_token(token_contract=self.eth.name)
+        assert not self.dex_pairs.is_valid_token(token_contract='btc')
+
+        self.tau.approve(amount=5, to=self.dex.name)
+        self.eth.approve(amount=10, to=self.dex.name)
+        with Instrumentation(self.client) as counters:
+            self.dex.add_liquidity(
+                dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth',
+                tau_desired=5, token_desired=10, tau_min=0, token_min=0, to_address=self.wallet_address
+            )
+            self.tau.transfer(amount=1, to=self.dex_pairs.name)
+            self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=ContractingDecimal('0.1'), to_address='test_results_wallet')
+            self.dex_pairs.transfer(tau_contract='tau', token_contract='eth', amount=1, to=self.dex_pairs.name)
+            self.dex_pairs.burn_liquidity(dex_contract='dex', tau_contract='tau', token_contract='eth', to_address=self.wallet_address)
+
+        # Registered tokens are trusted, swap, mint and burn don't check the interface again
+        for entry in ['dex.add_liquidity', 'dex_pairs.swap', 'dex_pairs.burn_liquidity']:
+            self.assertEqual(counters.entries[entry]['calls'], 1)
+            self.assertEqual(counters.entries[entry]['interface_checks'], 0)
+
+        # A token of a pair created before the registry is validated on first use, then trusted
+        self.client.set_var('dex_pairs', 'tokens', ['eth'], value=False)
+        with Instrumentation(self.client) as counters:
+            self.tau.transfer(amount=1, to=self.dex_pairs.name)
+            self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=ContractingDecimal('0.1'), to_address='test_results_wallet')
+            self.assertEqual(counters.entries['dex_pairs.swap']['interface_checks'], 1)
+
+            self.tau.transfer(amount=1, to=self.dex_pairs.name)
+            self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=ContractingDecimal('0.1'), to_address='test_results_wallet')
+
+        self.assertEqual(counters.entries['dex_pairs.swap']['calls'], 2)
+        self.assertEqual(counters.entries['dex_pairs.swap']['interface_checks'], 1)
+        assert self.dex_pairs.is_valid_token(token_contract=self.eth.name)
+
+    # Test = Many swaps against the same pair in one call
+    def test_8_swap_batch(self):
+        tau_amount = 5
+        token_amount = 10
+        self.add_liquidity(tau_amount, token_amount)
+
+        # Deposit the input for both legs up front
+        self.tau.transfer(amount=2, to=self.dex_pairs.name)
+
+        first_output_amount = self.expand_to_token_decimals(1662497915624478906)
+        second_output_amount = ContractingDecimal('0.5')
+        results = self.dex_pairs.swap_batch(legs=[
+            [self.tau.name, self.eth.name, 0, first_output_amount, 'test_results_wallet'],
+            [self.tau.name, self.eth.name, 0, second_output_amount, 'test_results_wallet']
+        ])
+
+        first_tau_in, _, _, first_token_out = results[0]
+        second_tau_in, _, _, second_token_out = results[1]
+        self.assertAlmostEqual(first_tau_in, 1, places=15)
+        self.assertEqual(first_token_out, first_output_amount)
+        self.assertEqual(second_token_out, second_output_amount)
+
+        tau_reserve, token_reserve = self.dex_pairs.get_pair_reserves(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name
+        )
+        self.assertEqual(tau_reserve, tau_amount + first_tau_in + second_tau_in)
+        self.assertEqual(token_reserve, token_amount - first_output_amount - second_output_amount)
+
+        wallet_balance_token = self.eth.balance_of(account='test_results_wallet')
+        self.assertEqual(wallet_balance_token, first_output_amount + second_output_amount)
+
+        # Leftover deposit is picked up as input by the next swap
+        leftover = 2 - first_tau_in - second_tau_in
+        self.dex_pairs.swap(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            tau_out=0,
+            token_out=ContractingDecimal('0.1'),
+            to_address='test_results_wallet'
+        )
+        tau_reserve, _ = self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name)
+        self.assertEqual(tau_reserve, tau_amount + first_tau_in + second_tau_in + leftover)
+
+    # Test = A one leg batch prices and settles exactly like swap() paid with the same input
+    def test_8_swap_batch_matches_swap(self):
+        output_amount = self.expand_to_token_decimals(1662497915624478906)
+
+        self.add_liquidity(5, 10)
+        self.tau.transfer(amount=2, to=self.dex_pairs.name)
+        tau_in, _, _, token_out = self.dex_pairs.swap_batch(legs=[
+            [self.tau.name, self.eth.name, 0, output_amount, 'test_results_wallet']
+        ])[0]
+        batch_reserves = self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name)
+        batch_received = self.eth.balance_of(account='test_results_wallet')
+
+        self.snapshot.restore()
+        self.add_liquidity(5, 10)
+        self.tau.transfer(amount=tau_in, to=self.dex_pairs.name)
+        self.dex_pairs.swap(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            tau_out=0,
+            token_out=output_amount,
+            to_address='test_results_wallet'
+        )
+
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name), batch_reserves)
+        self.assertEqual(self.eth.balance_of(account='test_results_wallet'), batch_received)
+        self.assertEqual(token_out, output_amount)
+
+        swap = self.client.get_var('dex_pairs', 'events', ['tau', 'eth', 3])
+        self.assertEqual(swap[0], 'Swap')
+        self.assertEqual(swap[2]['tau_in'], tau_in)
+
+    # Test = Ledger deposits fund a batch, and each touched pair's events are appended with one count write
+    def test_8_swap_batch_ledger_input(self):
+        self.add_liquidity(5, 10)
+        self.tau.approve(amount=2, to=self.dex_pairs.name)
+        self.dex_pairs.deposit(tau_contract=self.tau.name, token_contract=self.eth.name, contract=self.tau.name, amount=2)
+
+        with Instrumentation(self.client) as counters:
+            results = self.dex_pairs.swap_batch(legs=[
+                [self.tau.name, self.eth.name, 0, self.expand_to_token_decimals(1662497915624478906), 'test_results_wallet'],
+                [self.tau.name, self.eth.name, 0, ContractingDecimal('0.5'), 'test_results_wallet']
+            ])
+
+        # The ledger is taken in full, like swap() - what the legs didn't spend stays with the pair
+        self.assertEqual(self.dex_pairs.deposit_of(tau_contract=self.tau.name, token_contract=self.eth.name, contract=self.tau.name), 0)
+        tau_reserve, _ = self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name)
+        self.assertEqual(tau_reserve, 5 + 2)
+        self.assertLess(results[0][0] + results[1][0], 2)
+
+        self.assertEqual(counters.prefixes['dex_pairs.events:tau:eth:count']['writes'], 1)
+        count = self.client.get_var('dex_pairs', 'events', ['tau', 'eth', 'count'])
+        names = [self.client.get_var('dex_pairs', 'events', ['tau', 'eth', i])[0] for i in range(count)]
+        self.assertEqual(names, ['Sync', 'Mint', 'Swap', 'Swap', 'Sync'])
+
+    def test_8_swap_batch_insufficient_input(self):
+        self.add_liquidity(5, 10)
+        # Enough for the first leg only
+        self.tau.transfer(amount=ContractingDecimal('1.2'), to=self.dex_pairs.name)
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.swap_batch(legs=[
+                [self.tau.name, self.eth.name, 0, self.expand_to_token_decimals(1662497915624478906), 'test_results_wallet'],
+                [self.tau.name, self.eth.name, 0, ContractingDecimal('0.5'), 'test_results_wallet']
+            ])
+
+    # Test = Full pair snapshot in one call
+    def test_9_0_get_pair_state(self):
+        tau_amount = 5
+        token_amount = 10
+        self.add_liquidity(tau_amount, token_amount)
+
+        state = self.dex_pairs.get_pair_state(tau_contract=self.tau.name, token_contract=self.eth.name)
+        self.assertEqual(state['tau_reserve'], tau_amount)
+        self.assertEqual(state['token_reserve'], token_amount)
+        self.assertEqual(state['lp_token_supply'], self.dex_pairs.total_supply(tau_contract=self.tau.name, token_contract=self.eth.name))
+        # kLast is only tracked while the fee is on
+        self.assertEqual(state['kLast'], 0)
+        self.assertFalse(state['fee_on'])
+        self.assertEqual(state['lp_token_balance'], self.dex_pairs.balance_of(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            account=self.wallet_address
+        ))
+        self.assertEqual(state['pair_address'], self.dex_pairs.pair_address(tau_contract=self.tau.name, token_contract=self.eth.name))
+
+        self.dex.set_fee_to(account=self.fee_to_address, signer=self.fee_to_setter_address)
+        self.assertTrue(self.dex_pairs.get_pair_state(tau_contract=self.tau.name, token_contract=self.eth.name)['fee_on'])
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.get_pair_state(tau_contract=self.tau.name, token_contract='btc')
+
+    # Test = Pair snapshots are paged in creation order
+    def test_9_1_get_pair_states(self):
+        with open('../basetoken.py') as f:
+            code = f.read()
+            self.client.submit(code, name='btc', constructor_args={
+                's_name': 'btc',
+                's_symbol': 'BTC',
+                'vk': self.wallet_address,
+                'vk_amount': 10000
+            })
+        self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract='btc')
+
+        first_page = self.dex_pairs.get_pair_states(offset=0, limit=1)
+        second_page = self.dex_pairs.get_pair_states(offset=1, limit=1)
+        self.assertEqual([(s['tau_contract'], s['token_contract']) for s in first_page], [('tau', 'eth')])
+        self.assertEqual([(s['tau_contract'], s['token_contract']) for s in second_page], [('tau', 'btc')])
+        self.assertEqual(len(self.dex_pairs.get_pair_states(offset=0, limit=10)), 2)
+        self.assertEqual(self.dex_pairs.get_pair_states(offset=2, limit=10), [])
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.get_pair_states(offset=0, limit=0)
+
+    # Test = Mint, Swap and Sync are appended to the event log
+    def test_10_events(self):
+        self.add_liquidity(5, 10)
+        self.tau.transfer(amount=1, to=self.dex_pairs.name)
+        swap_amount = self.expand_to_token_decimals(1662497915624478906)
+        self.dex_pairs.swap(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            tau_out=0,
+            token_out=swap_amount,
+            to_address='test_results_wallet'
+        )
+
+        count = self.client.get_var('dex_pairs', 'events', ['tau', 'eth', 'count'])
+        events = [self.client.get_var('dex_pairs', 'events', ['tau', 'eth', i]) for i in range(count)]
+        self.assertEqual([e[0] for e in events], ['Sync', 'Mint', 'Sync', 'Swap'])
+
+        name, sender, data, _ = events[1]
+        self.assertEqual(sender, self.wallet_address)
+        self.assertEqual(data, {'tau_amount': 5, 'token_amount': 10, 'to_address': self.wallet_address})
+
+        swap = events[3][2]
+        self.assertEqual(swap['tau_in'], 1)
+        self.assertEqual(swap['token_out'], swap_amount)
+        self.assertEqual(events[2][2]['token_reserve'], 10 - swap_amount)
+
+    # Test = TWAP from the cumulative prices and one stored observation
+    def test_11_price_oracle(self):
+        hour = 60 * 60
+        def at(hours):
+            return {'now': Datetime(2030, 1, 1, hour=hours)}
+
+        self.tau.transfer(amount=5, to=self.dex_pairs.name)
+        self.eth.transfer(amount=10, to=self.dex_pairs.name)
+        self.dex_pairs.mint_liquidity(
+            dex_contract=self.dex.name,
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            to_address=self.wallet_address,
+            environment=at(0)
+        )
+
+        # Price of tau moves from 2 to p after an hour
+        self.tau.transfer(amount=1, to=self.dex_pairs.name)
+        self.dex_pairs.swap(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            tau_out=0,
+            token_out=self.expand_to_token_decimals(1662497915624478906),
+            to_address='test_results_wallet',
+            environment=at(1)
+        )
+        tau_reserve, token_reserve = self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name)
+        price = float(token_reserve / tau_reserve)
+
+        state = self.dex_pairs.get_pair_state(tau_contract=self.tau.name, token_contract=self.eth.name)
+        self.assertEqual(state['price_tau_cumulative'], 2 * hour)
+        self.assertEqual(state['price_token_cumulative'], ContractingDecimal('0.5') * hour)
+
+        tau_twap, token_twap, elapsed = self.dex_pairs.consult(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            window_seconds=2 * hour,
+            environment=at(2)
+        )
+        self.assertEqual(elapsed, 2 * hour)
+        self.assertAlmostEqual(float(tau_twap), (2 + price) / 2, places=9)
+        self.assertAlmostEqual(float(token_twap), (0.5 + 1 / price) / 2, places=9)
+
+        # Nothing was observed 3 hours before
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.consult(tau_contract=self.tau.name, token_contract=self.eth.name, window_seconds=3 * hour, environment=at(2))
+
+        # A keeper observation makes a quiet period consultable
+        # Taken 20 minutes into its period, so the window averaged is 20 minutes shorter than requested
+        self.dex_pairs.observe(tau_contract=self.tau.name, token_contract=self.eth.name, environment={'now': Datetime(2030, 1, 1, hour=5, minute=20)})
+        tau_twap, _, elapsed = self.dex_pairs.consult(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            window_seconds=hour,
+            environment=at(6)
+        )
+        self.assertEqual(elapsed, 40 * 60)
+        self.assertAlmostEqual(float(tau_twap), price, places=9)
+
+        # Started 30 minutes into the window's period, from the same observation: 10 minutes longer
+        _, _, elapsed = self.dex_pairs.consult(
+            tau_contract=self.tau.name,
+            token_contract=self.eth.name,
+            window_seconds=hour,
+            environment={'now': Datetime(2030, 1, 1, hour=6, minute=30)}
+        )
+        self.assertEqual(elapsed, hour + 10 * 60)
+
+    # Test = Either contract order resolves to the same pair, reserves follow the requested order
+    def test_12_pair_lookup(self):
+        self.add_liquidity(5, 10)
+
+        self.assertEqual(self.dex_pairs.get_pair(contract_a=self.tau.name, contract_b=self.eth.name), ['tau', 'eth', 5, 10])
+        self.assertEqual(self.dex_pairs.get_pair(contract_a=self.eth.name, contract_b=self.tau.name), ['tau', 'eth', 10, 5])
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract=self.eth.name, token_contract=self.tau.name), (10, 5))
+
+        record = self.dex_pairs.pair(tau_contract=self.tau.name, token_contract=self.eth.name)
+        flipped = self.dex_pairs.pair(tau_contract=self.eth.name, token_contract=self.tau.name)
+        self.assertEqual(flipped[:4], [10, 5] + record[2:4])
+
+        # The reverse order is the same market
+        with self.assertRaises(AssertionError):
+            self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='eth', token_contract='tau')
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.get_pair(contract_a=self.eth.name, contract_b='btc')
+
+        # Pairs created before the lookup are still found, in both orders
+        self.client.set_var('dex_pairs', 'pair_index', ['eth', 'tau'], value=None)
+        self.assertEqual(self.dex_pairs.get_pair(contract_a=self.eth.name, contract_b=self.tau.name), ['tau', 'eth', 10, 5])
+
+    # Test = Every pair call takes the contracts in either order, amounts follow the requested order
+    def test_12_reversed_order_calls(self):
+        hour = 60 * 60
+        def at(hours):
+            return {'now': Datetime(2030, 1, 1, hour=hours)}
+
+        # Minted as (eth, tau), stored as (tau, eth)
+        self.tau.transfer(amount=5, to=self.dex_pairs.name)
+        self.eth.transfer(amount=10, to=self.dex_pairs.name)
+        _, eth_amount, tau_amount = self.dex_pairs.mint_liquidity(
+            dex_contract=self.dex.name,
+            tau_contract=self.eth.name,
+            token_contract=self.tau.name,
+            to_address=self.wallet_address,
+            environment=at(0)
+        )
+        self.assertEqual((eth_amount, tau_amount), (10, 5))
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name), (5, 10))
+
+        # The first out amount is eth, the first contract's
+        swap_amount = self.expand_to_token_decimals(1662497915624478906)
+        self.tau.transfer(amount=1, to=self.dex_pairs.name)
+        self.dex_pairs.swap(
+            tau_contract=self.eth.name,
+            token_contract=self.tau.name,
+            tau_out=swap_amount,
+            token_out=0,
+            to_address='test_results_wallet',
+            environment=at(1)
+        )
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name), (6, 10 - swap_amount))
+        self.assertEqual(self.eth.balance_of(account='test_results_wallet'), swap_amount)
+
+        self.tau.transfer(amount=1, to=self.dex_pairs.name)
+        results = self.dex_pairs.swap_batch(legs=[
+            [self.eth.name, self.tau.name, ContractingDecimal('0.1'), 0, 'test_results_wallet']
+        ], environment=at(1))
+        eth_in, tau_in, eth_out, tau_out = results[0]
+        self.assertEqual((eth_in, tau_out, eth_out), (0, 0, ContractingDecimal('0.1')))
+        self.assertTrue(0 < tau_in < 1)
+
+        # Stored order and reversed order read the same pair
+        for name in ['total_supply', 'pair_address']:
+            self.assertEqual(
+                getattr(self.dex_pairs, name)(tau_contract=self.eth.name, token_contract=self.tau.name),
+                getattr(self.dex_pairs, name)(tau_contract=self.tau.name, token_contract=self.eth.name)
+            )
+        self.assertEqual(
+            self.dex_pairs.balance_of(tau_contract=self.eth.name, token_contract=self.tau.name, account=self.wallet_address),
+            self.dex_pairs.balance_of(tau_contract=self.tau.name, token_contract=self.eth.name, account=self.wallet_address)
+        )
+
+        state = self.dex_pairs.get_pair_state(tau_contract=self.eth.name, token_contract=self.tau.name)
+        stored = self.dex_pairs.get_pair_state(tau_contract=self.tau.name, token_contract=self.eth.name)
+        self.assertEqual((state['tau_reserve'], state['token_reserve']), (stored['token_reserve'], stored['tau_reserve']))
+
+        self.dex_pairs.observe(tau_contract=self.eth.name, token_contract=self.tau.name, environment=at(2))
+        eth_twap, tau_twap, elapsed = self.dex_pairs.consult(tau_contract=self.eth.name, token_contract=self.tau.name, window_seconds=hour, environment=at(3))
+        self.assertEqual(
+            [tau_twap, eth_twap, elapsed],
+            list(self.dex_pairs.consult(tau_contract=self.tau.name, token_contract=self.eth.name, window_seconds=hour, environment=at(3)))
+        )
+
+        # LP tokens sent back and burned in the reversed order, amounts come back as (eth, tau)
+        tau_reserve, eth_reserve = self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name)
+        liquidity = self.dex_pairs.balance_of(tau_contract=self.tau.name, token_contract=self.eth.name, account=self.wallet_address)
+        self.dex_pairs.transfer(tau_contract=self.eth.name, token_contract=self.tau.name, amount=liquidity, to=self.dex_pairs.name)
+        eth_amount, tau_amount = self.dex_pairs.burn_liquidity(
+            dex_contract=self.dex.name,
+            tau_contract=self.eth.name,
+            token_contract=self.tau.name,
+            to_address=self.wallet_address
+        )
+        self.assertEqual(
+            self.dex_pairs.get_pair_reserves(tau_contract=self.tau.name, token_contract=self.eth.name),
+            (tau_reserve - tau_amount, eth_reserve - eth_amount)
+        )
+        self.assertTrue(eth_amount > tau_amount > 0)
+        self.assertEqual(self.dex_pairs.balance_of(tau_contract=self.tau.name, token_contract=self.eth.name, account=self.dex_pairs.name), 0)
+
+    # Test = Pairs are listed in creation order, pairs created before the index get backfilled
+    def test_13_pair_registry(self):
+        self.assertEqual(self.dex_pairs.all_pairs_length(), 1)
+        self.assertEqual(self.dex_pairs.get_pairs(offset=0, limit=10), [['tau', 'eth']])
+        self.assertEqual(self.dex_pairs.get_pairs(offset=1, limit=10), [])
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.get_pairs(offset=0, limit=101)
+
+        # Legacy pair - no index entries
+        self.client.set_var('dex_pairs', 'all_pairs', [0], value=None)
+        self.client.set_var('dex_pairs', 'pair_index', ['eth', 'tau'], value=None)
+        self.assertEqual(self.dex_pairs.get_pairs(offset=0, limit=10), [])
+
+        # Only the owner (dex) can backfill, dex only forwards for fee_to_setter, under an existing index
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.backfill_pair(index=0, tau_contract='tau', token_contract='eth')
+        with self.assertRaises(AssertionError):
+            self.dex.backfill_pair(dex_pairs='dex_pairs', index=0, tau_contract='tau', token_contract='eth')
+        with self.assertRaises(AssertionError):
+            self.dex.backfill_pair(dex_pairs='dex_pairs', index=1, tau_contract='tau', token_contract='eth', signer=self.fee_to_setter_address)
+        with self.assertRaises(AssertionError):
+            self.dex.backfill_pair(dex_pairs='dex_pairs', index=0, tau_contract='tau', token_contract='btc', signer=self.fee_to_setter_address)
+
+        self.dex.backfill_pair(dex_pairs='dex_pairs', index=0, tau_contract='tau', token_contract='eth', signer=self.fee_to_setter_address)
+        self.assertEqual(self.dex_pairs.get_pairs(offset=0, limit=10), [['tau', 'eth']])
+        self.assertEqual(self.client.get_var('dex_pairs', 'pair_index', ['eth', 'tau']), ['tau', 'eth'])
+
+        # Repeating is a no-op, another pair can't take the index
+        self.dex.backfill_pair(dex_pairs='dex_pairs', index=0, tau_contract='tau', token_contract='eth', signer=self.fee_to_setter_address)
+        self.client.set_var('dex_pairs', 'pairs', ['tau', 'btc', 'pair_address'], value='btc_address')
+        with self.assertRaises(AssertionError):
+            self.dex.backfill_pair(dex_pairs='dex_pairs', index=0, tau_contract='tau', token_contract='btc', signer=self.fee_to_setter_address)
+
+    # Test = Deposit at the current reserve ratio and mint, in a single dex call
+    def test_14_add_liquidity(self):
+        # dex pulls the amounts it needs, up to what it was approved for
+        self.tau.approve(amount=100, to='dex')
+        with self.assertRaisesRegex(AssertionError, 'approved'):
+            self.dex.add_liquidity(
+                dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth',
+                tau_desired=5, token_desired=10, tau_min=0, token_min=0, to_address=self.wallet_address
+            )
+        self.snapshot.restore()
+        self.tau.approve(amount=100, to='dex')
+        self.eth.approve(amount=100, to='dex')
+
+        # First deposit sets the price
+        tau_amount, token_amount = self.dex.add_liquidity(
+            dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth',
+            tau_desired=5, token_desired=10, tau_min=0, token_min=0, to_address=self.wallet_address
+        )
+        self.assertEqual((tau_amount, token_amount), (5, 10))
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='eth'), (5, 10))
+        lp_balance = self.dex_pairs.balance_of(tau_contract='tau', token_contract='eth', account=self.wallet_address)
+        self.assertEqual(lp_balance, self.dex_pairs.total_supply(tau_contract='tau', token_contract='eth') - self.expand_to_token_decimals(MINIMUM_LIQUIDITY))
+
+        # Only the eth matching 1 tau is taken, nothing is left behind in dex or dex_pairs
+        tau_amount, token_amount = self.dex.add_liquidity(
+            dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth',
+            tau_desired=1, token_desired=5, tau_min=1, token_min=1, to_address='lp_address'
+        )
+        self.assertEqual((tau_amount, token_amount), (1, 2))
+        self.assertEqual(self.eth.balance_of(account=self.wallet_address), 10000 - 12)
+        self.assertEqual(self.eth.balance_of(account='dex'), 0)
+        self.assertEqual(self.eth.allowance(owner='dex', spender='dex_pairs'), 0)
+        self.assertEqual(self.eth.allowance(owner=self.wallet_address, spender='dex'), 100 - 12)
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='eth'), (6, 12))
+        self.assertTrue(self.dex_pairs.balance_of(tau_contract='tau', token_contract='eth', account='lp_address') > 0)
+
+        # Either order, amounts follow the requested order
+        token_amount, tau_amount = self.dex.add_liquidity(
+            dex_pairs='dex_pairs', tau_contract='eth', token_contract='tau',
+            tau_desired=4, token_desired=4, tau_min=0, token_min=0, to_address='lp_address'
+        )
+        self.assertEqual((token_amount, tau_amount), (4, 2))
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='eth'), (8, 16))
+
+        # Below the minimum
+        with self.assertRaises(AssertionError):
+            self.dex.add_liquidity(
+                dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth',
+                tau_desired=1, token_desired=5, tau_min=0, token_min=3, to_address='lp_address'
+            )
+
+        with self.assertRaises(AssertionError):
+            self.dex.add_liquidity(
+                dex_pairs='dex_pairs', tau_contract='tau', token_contract='btc',
+                tau_desired=1, token_desired=1, tau_min=0, token_min=0, to_address='lp_address'
+            )
+
+    # Test = Deposits are credited to one pair, and taken by its next mint without reading balances
+    def test_15_deposit_ledger(self):
+        with open('../basetoken.py') as f:
+            self.client.submit(f.read(), name='btc', constructor_args={
+                's_name': 'btc',
+                's_symbol': 'BTC',
+                'vk': self.wallet_address,
+                'vk_amount': 10000
+            })
+        self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract='btc')
+
+        # Taken from the caller, only up to what dex_pairs was approved for
+        self.tau.approve(amount=5, to='dex_pairs')
+        self.eth.approve(amount=10, to='dex_pairs')
+        with self.assertRaisesRegex(AssertionError, 'approved'):
+            self.dex_pairs.deposit(tau_contract='tau', token_contract='eth', contract='tau', amount=6)
+
+        self.dex_pairs.deposit(tau_contract='tau', token_contract='eth', contract='tau', amount=5)
+        self.dex_pairs.deposit(tau_contract='tau', token_contract='eth', contract='eth', amount=10)
+        self.assertEqual(self.dex_pairs.deposit_of(tau_contract='tau', token_contract='eth', contract='tau'), 5)
+        self.assertEqual(self.tau.balance_of(account='dex_pairs'), 5)
+
+        # The tau deposited for tau/eth can't be minted into tau/btc
+        self.client.get_contract('btc').transfer(amount=10, to='dex_pairs')
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.mint_liquidity(dex_contract='dex', tau_contract='tau', token_contract='btc', to_address=self.wallet_address)
+
+        self.dex_pairs.mint_liquidity(dex_contract='dex', tau_contract='tau', token_contract='eth', to_address=self.wallet_address)
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='eth'), (5, 10))
+        self.assertEqual(self.dex_pairs.deposit_of(tau_contract='tau', token_contract='eth', contract='tau'), 0)
+        self.assertEqual(self.client.get_var('dex_pairs', 'pairs', ['tau', 'balance']), 5)
+
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.deposit(tau_contract='tau', token_contract='eth', contract='btc', amount=1)
+
+    # Test = Outputs are usable by the callee before the input is checked, all in one transaction
+    def test_16_flash_swap(self):
+        self.add_liquidity(5, 10)
+        self.client.submit(flash_borrower, 'flash_borrower')
+        self.tau.transfer(amount=2, to='flash_borrower')
+
+        output_amount = self.expand_to_token_decimals(1662497915624478906)
+        def flash_swap():
+            self.dex_pairs.swap(
+                tau_contract=self.tau.name,
+                token_contract=self.eth.name,
+                tau_out=0,
+                token_out=output_amount,
+                to_address='flash_borrower',
+                callee_contract='flash_borrower'
+            )
+
+        # 1 tau is the getAmountOut price of output_amount, 0.3% fee included
+        self.client.set_var('flash_borrower', 'repay', ['tau'], value=1)
+        flash_swap()
+
+        self.assertEqual(self.client.get_var('flash_borrower', 'received'), output_amount)
+        self.assertEqual(self.eth.balance_of(account='flash_borrower'), output_amount)
+        self.assertEqual(self.tau.balance_of(account='flash_borrower'), 1)
+        self.assertEqual(self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='eth'), (6, 10 - output_amount))
+
+        # Trading the borrowed pair from inside the callback
+        self.client.set_var('flash_borrower', 'reenter', value=True)
+        with self.assertRaisesRegex(AssertionError, 'LOCKED'):
+            flash_swap()
+
+        # Nothing paid back
+        self.snapshot.restore()
+        self.add_liquidity(5, 10)
+        self.client.submit(flash_borrower, 'flash_borrower')
+        with self.assertRaisesRegex(AssertionError, 'Insufficient Input Amount'):
+            flash_swap()
+
+        # Paid back, but short of the fee - the balance adjusted K rejects it
+        self.snapshot.restore()
+        self.add_liquidity(5, 10)
+        self.client.submit(flash_borrower, 'flash_borrower')
+        self.tau.transfer(amount=2, to='flash_borrower')
+        self.client.set_var('flash_borrower', 'repay', ['tau'], value=ContractingDecimal('0.9'))
+        with self.assertRaisesRegex(AssertionError, 'UniswapV2: K'):
+            flash_swap()
+
+        # Callees have to implement dex_pairs_call
+        with self.assertRaises(AssertionError):
+            self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=output_amount, to_address='flash_borrower', callee_contract='eth')
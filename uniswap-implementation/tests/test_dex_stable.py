@@ -0,0 +1,260 @@
+import ast
+import os
+from fractions import Fraction
+from unittest import TestCase
+from contracting.client import ContractingClient
+
+from contracting_driver import worker_driver
+from snapshot import StateSnapshot
+
+STARTING_BALANCE = 10000
+AMPLIFICATION = 100
+UNIT = pow(10, 18)
+
+# Kept as identical copies in dex_concentrated.py and dex_stable.py, with token_interface - see their TOKEN HELPERS
+TOKEN_HELPERS = ['to_raw', 'from_raw', 'get_token', 'pull', 'pay']
+
+# Trades and withdraws liquidity in its own name - approves dex_stable, paid from its own balances
+def stable_trader():
+    @export
+    def swap(amount_in: float):
+        importlib.import_module('tau').approve(amount=amount_in, to='dex_stable')
+        return importlib.import_module('dex_stable').swap(
+            tau_contract='tau', token_contract='eth', tau_in=True, amount_in=amount_in, amount_out_min=0, to_address=ctx.this
+        )
+
+    @export
+    def remove_liquidity(amount: float):
+        return importlib.import_module('dex_stable').remove_liquidity(
+            tau_contract='tau', token_contract='eth', amount=amount, tau_min=0, token_min=0, to_address=ctx.this
+        )
+
+# Expected values follow Curve's StableSwap, the invariant is checked exactly with fractions
+class DexStableSpecs(TestCase):
+
+    # deploy once for the whole class, every test starts from this snapshot
+    @classmethod
+    def setUpClass(cls):
+        cls.client = ContractingClient(driver=worker_driver())
+        cls.client.flush()
+
+        cls.wallet_address = 'wallet_address'
+
+        with open('../currency.py') as f:
+            cls.client.submit(f.read(), 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': cls.wallet_address,
+                'vk_amount': STARTING_BALANCE
+            })
+
+        with open('../basetoken.py') as f:
+            cls.client.submit(f.read(), name='eth', constructor_args={
+                's_name': 'eth',
+                's_symbol': 'ETH',
+                'vk': cls.wallet_address,
+                'vk_amount': STARTING_BALANCE
+            })
+
+        with open('../dex.py') as f:
+            cls.client.submit(f.read(), 'dex', constructor_args={
+                'fee_to_setter_address': 'fee_to_setter_address'
+            })
+
+        # Initialize ownership to dex
+        with open('../dex_stable.py') as f:
+            cls.client.submit(f.read(), 'dex_stable', constructor_args={
+                'owner_address': 'dex',
+                'amplification_coefficient': AMPLIFICATION
+            })
+
+        # Created through the same factory as dex_pairs
+        cls.client.signer = cls.wallet_address
+        cls.client.get_contract('dex').create_pair(
+            dex_pairs='dex_stable',
+            tau_contract='tau',
+            token_contract='eth'
+        )
+
+        # Payments are pulled with transfer_from
+        for token in ['tau', 'eth']:
+            cls.client.get_contract(token).approve(amount=STARTING_BALANCE, to='dex_stable')
+
+        cls.snapshot = StateSnapshot(cls.client.raw_driver)
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.snapshot.restore()
+        self.change_signer(self.wallet_address)
+
+    def change_signer(self, name):
+        self.client.signer = name
+
+        self.tau = self.client.get_contract('tau')
+        self.eth = self.client.get_contract('eth')
+        self.dex = self.client.get_contract('dex')
+        self.pools = self.client.get_contract('dex_stable')
+
+    def pool(self):
+        return self.pools.pair(tau_contract='tau', token_contract='eth')
+
+    def add_liquidity(self, tau_amount, token_amount, to_address=None):
+        return self.pools.add_liquidity(tau_contract='tau', token_contract='eth', tau_amount=tau_amount, token_amount=token_amount,
+                                        lp_token_min=0, to_address=to_address or self.wallet_address)
+
+    def swap(self, tau_in, amount_in, amount_out_min=0):
+        return self.pools.swap(tau_contract='tau', token_contract='eth', tau_in=tau_in, amount_in=amount_in,
+                               amount_out_min=amount_out_min, to_address=self.wallet_address)
+
+    # A * n^n * sum(x) + D - (A * D * n^n + D^(n+1) / (n^n * prod(x))), relative to D
+    def invariant_error(self, state):
+        tau_balance, token_balance, supply, d, amp = state
+        ann = amp * 2
+        error = ann * (tau_balance + token_balance) + d - ann * d - Fraction(d ** 3, 4 * tau_balance * token_balance)
+        return abs(float(error / d))
+
+    def test_1_create_pool(self):
+        self.assertEqual(self.pools.length_pairs(), 1)
+        self.assertEqual(self.pool(), [0, 0, 0, 0, AMPLIFICATION])
+        self.assertEqual(self.pools.pair(tau_contract='eth', token_contract='tau'), self.pool())
+
+        with self.assertRaisesRegex(AssertionError, 'Market already exists!'):
+            self.dex.create_pair(dex_pairs='dex_stable', tau_contract='eth', token_contract='tau')
+
+        with self.assertRaisesRegex(AssertionError, 'FORBIDDEN'):
+            self.pools.initialize(tau_contract='tau', token_contract='other')
+
+    def test_2_add_liquidity(self):
+        # balanced, D is the sum of the balances
+        minted = self.add_liquidity(1000, 1000)
+
+        self.assertEqual(minted, 2000)
+        self.assertEqual(self.pool(), [1000 * UNIT, 1000 * UNIT, 2000 * UNIT, 2000 * UNIT, AMPLIFICATION])
+        self.assertEqual(self.pools.balance_of(tau_contract='tau', token_contract='eth', account=self.wallet_address), 2000)
+        self.assertEqual(self.pools.get_virtual_price(tau_contract='tau', token_contract='eth'), 1)
+        self.assertEqual(self.tau.balance_of(account='dex_stable'), 1000)
+
+        # single sided, pays the fee on the imbalance, so less than the growth of D
+        minted = self.add_liquidity(100, 0, 'lp_address')
+        self.assertLess(minted, 100)
+        self.assertGreater(minted, 99.9)
+        self.assertLess(self.invariant_error(self.pool()), 1e-18)
+
+    def test_3_swap_near_peg(self):
+        self.add_liquidity(1000, 1000)
+
+        amount_out = self.swap(True, 100)
+
+        # x * y = k with a 0.3% fee would give 90.66
+        self.assertGreater(amount_out, 99.8)
+        self.assertLess(amount_out, 100 * (1 - 0.0004))
+        self.assertEqual(self.eth.balance_of(account=self.wallet_address), STARTING_BALANCE - 1000 + amount_out)
+
+        # cached D matches the new balances, and grew by the fee kept in the pool
+        state = self.pool()
+        self.assertEqual(state[:2], [1100 * UNIT, 1000 * UNIT - int(amount_out * UNIT)])
+        self.assertGreater(state[3], 2000 * UNIT)
+        self.assertLess(self.invariant_error(state), 1e-18)
+        self.assertGreater(self.pools.get_virtual_price(tau_contract='tau', token_contract='eth'), 1)
+
+    def test_4_swap_away_from_peg(self):
+        self.add_liquidity(1000, 1000)
+
+        # the curve falls back to constant product as the pool runs out of one side
+        self.assertLess(self.pools.get_amount_out(tau_contract='tau', token_contract='eth', tau_in=True, amount_in=5000), 1000)
+        self.assertLess(
+            self.pools.get_amount_out(tau_contract='tau', token_contract='eth', tau_in=True, amount_in=900) / 900,
+            self.pools.get_amount_out(tau_contract='tau', token_contract='eth', tau_in=True, amount_in=100) / 100
+        )
+
+    def test_5_get_amount_out(self):
+        self.add_liquidity(1000, 1000)
+
+        for tau_in, amount_in in [[True, 10], [False, 250], [True, 1]]:
+            expected = self.pools.get_amount_out(tau_contract='tau', token_contract='eth', tau_in=tau_in, amount_in=amount_in)
+            self.assertEqual(self.swap(tau_in, amount_in), expected)
+            self.assertLess(self.invariant_error(self.pool()), 1e-18)
+
+        expected = self.pools.get_amount_out(tau_contract='tau', token_contract='eth', tau_in=True, amount_in=10)
+        with self.assertRaisesRegex(AssertionError, 'Insufficient output amount'):
+            self.swap(True, 10, expected + 1)
+
+    def test_6_remove_liquidity(self):
+        self.add_liquidity(1000, 1000)
+        self.add_liquidity(500, 500, 'lp_address')
+
+        self.swap(True, 100)
+        self.swap(False, 100)
+
+        # the lp's share of both balances, fees included
+        self.change_signer('lp_address')
+        tau_out, token_out = self.pools.remove_liquidity(tau_contract='tau', token_contract='eth', amount=1000, tau_min=0, token_min=0, to_address='lp_address')
+        self.assertGreater(tau_out + token_out, 1000)
+        self.assertEqual(self.tau.balance_of(account='lp_address'), tau_out)
+        self.assertEqual(self.eth.balance_of(account='lp_address'), token_out)
+        self.assertEqual(self.pools.balance_of(tau_contract='tau', token_contract='eth', account='lp_address'), 0)
+        self.assertLess(self.invariant_error(self.pool()), 1e-18)
+
+        with self.assertRaisesRegex(AssertionError, 'Insufficient LP token balance'):
+            self.pools.remove_liquidity(tau_contract='tau', token_contract='eth', amount=1, tau_min=0, token_min=0, to_address='lp_address')
+
+        # the last lp takes everything left, D goes back to 0
+        self.change_signer(self.wallet_address)
+        self.pools.remove_liquidity(tau_contract='tau', token_contract='eth', amount=2000, tau_min=0, token_min=0, to_address=self.wallet_address)
+        self.assertEqual(self.pool(), [0, 0, 0, 0, AMPLIFICATION])
+        self.assertEqual(self.tau.balance_of(account='dex_stable'), 0)
+        self.assertEqual(self.eth.balance_of(account='dex_stable'), 0)
+
+    # Test = Payments and LP tokens belong to the calling contract, not to the transaction signer
+    def test_7_contract_caller(self):
+        self.add_liquidity(1000, 1000)
+        self.add_liquidity(100, 100, 'stable_trader')
+        self.client.submit(stable_trader, 'stable_trader')
+        self.tau.transfer(amount=10, to='stable_trader')
+        trader = self.client.get_contract('stable_trader')
+
+        amount_out = trader.swap(amount_in=10)
+        self.assertEqual(self.tau.balance_of(account='stable_trader'), 0)
+        self.assertEqual(self.eth.balance_of(account='stable_trader'), amount_out)
+        self.assertEqual(self.tau.balance_of(account=self.wallet_address), STARTING_BALANCE - 1100 - 10)
+
+        tau_out, token_out = trader.remove_liquidity(amount=200)
+        self.assertEqual(self.tau.balance_of(account='stable_trader'), tau_out)
+        self.assertEqual(self.pools.balance_of(tau_contract='tau', token_contract='eth', account='stable_trader'), 0)
+        self.assertEqual(self.pools.balance_of(tau_contract='tau', token_contract='eth', account=self.wallet_address), 2000)
+
+    # Test = The token helpers of both pool contracts are the same code
+    def test_8_shared_token_helpers(self):
+        def helpers(name):
+            with open(os.path.join(os.path.dirname(__file__), '..', name)) as f:
+                tree = ast.parse(f.read())
+            nodes = {node.name: ast.dump(node) for node in tree.body if isinstance(node, ast.FunctionDef) and node.name in TOKEN_HELPERS}
+            nodes.update({node.targets[0].id: ast.dump(node) for node in tree.body
+                          if isinstance(node, ast.Assign) and getattr(node.targets[0], 'id', None) == 'token_interface'})
+            return nodes
+
+        stable = helpers('dex_stable.py')
+        self.assertEqual(sorted(stable), sorted(TOKEN_HELPERS + ['token_interface']))
+        self.assertEqual(stable, helpers('dex_concentrated.py'))
+
+    # Test = Every call takes the contracts in either order, amounts and tau_in follow the order of the call
+    def test_9_reversed_order_calls(self):
+        self.add_liquidity(1000, 1000)
+        self.pools.add_liquidity(tau_contract='eth', token_contract='tau', tau_amount=200, token_amount=100, lp_token_min=0, to_address='lp_address')
+        self.assertEqual(self.pool()[:2], [1100 * UNIT, 1200 * UNIT])
+        self.assertEqual(
+            self.pools.balance_of(tau_contract='eth', token_contract='tau', account='lp_address'),
+            self.pools.balance_of(tau_contract='tau', token_contract='eth', account='lp_address')
+        )
+
+        # eth in, the first contract of the call
+        expected = self.pools.get_amount_out(tau_contract='tau', token_contract='eth', tau_in=False, amount_in=10)
+        self.assertEqual(self.pools.get_amount_out(tau_contract='eth', token_contract='tau', tau_in=True, amount_in=10), expected)
+        self.assertEqual(self.pools.swap(tau_contract='eth', token_contract='tau', tau_in=True, amount_in=10, amount_out_min=0, to_address='trader'), expected)
+        self.assertEqual(self.tau.balance_of(account='trader'), expected)
+
+        self.change_signer('lp_address')
+        eth_out, tau_out = self.pools.remove_liquidity(tau_contract='eth', token_contract='tau', amount=100, tau_min=0, token_min=0, to_address='lp_address')
+        self.assertEqual(self.eth.balance_of(account='lp_address'), eth_out)
+        self.assertEqual(self.tau.balance_of(account='lp_address'), tau_out)
+        self.assertGreater(eth_out, tau_out)
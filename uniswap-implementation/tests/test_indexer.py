@@ -0,0 +1,97 @@
+import os
+import tempfile
+from unittest import TestCase
+from contracting.client import ContractingClient
+
+from contracting_driver import worker_driver
+from offchain.indexer import EventIndexer
+
+class IndexerSpecs(TestCase):
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.client = ContractingClient(driver=worker_driver())
+        self.client.flush()
+
+        self.wallet_address = 'wallet_address'
+
+        with open('../currency.py') as f:
+            code = f.read()
+            self.client.submit(code, 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': self.wallet_address,
+                'vk_amount': 10000
+            })
+
+        with open('../basetoken.py') as f:
+            code = f.read()
+            for name in ['eth', 'btc']:
+                self.client.submit(code, name=name, constructor_args={
+                    's_name': name,
+                    's_symbol': name.upper(),
+                    'vk': self.wallet_address,
+                    'vk_amount': 10000
+                })
+
+        with open('../dex.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex', constructor_args={
+                'fee_to_setter_address': 'fee_to_setter_address'
+            })
+
+        with open('../dex_pairs.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex_pairs', constructor_args={
+                'owner_address': 'dex'
+            })
+
+        self.client.signer = self.wallet_address
+        self.tau = self.client.get_contract('tau')
+        self.dex = self.client.get_contract('dex')
+        self.dex_pairs = self.client.get_contract('dex_pairs')
+
+        for name in ['eth', 'btc']:
+            self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract=name)
+
+    def add_liquidity(self, token_contract, tau_amount, token_amount):
+        self.tau.transfer(amount=tau_amount, to='dex_pairs')
+        self.client.get_contract(token_contract).transfer(amount=token_amount, to='dex_pairs')
+        self.dex_pairs.mint_liquidity(dex_contract='dex', tau_contract='tau', token_contract=token_contract, to_address=self.wallet_address)
+
+    def test_1_sync_is_incremental(self):
+        indexer = EventIndexer(self.client, batch_size=1)
+
+        self.add_liquidity('eth', 5, 10)
+        self.assertEqual(indexer.sync(block_num=1), 2)
+        self.assertEqual(indexer.sync(block_num=2), 0)
+
+        self.add_liquidity('btc', 1, 1)
+        self.tau.transfer(amount=1, to='dex_pairs')
+        self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=1, to_address='trader')
+        self.assertEqual(indexer.sync(block_num=3), 4)
+
+        self.assertEqual([e['event'] for e in indexer.pair_events('tau', 'eth')], ['Sync', 'Mint', 'Sync', 'Swap'])
+        self.assertEqual([e['event'] for e in indexer.pair_events('tau', 'btc')], ['Sync', 'Mint'])
+        # Pair by pair, in creation order
+        self.assertEqual([(e['token_contract'], e['event']) for e in indexer.block_events(3)],
+                         [('eth', 'Sync'), ('eth', 'Swap'), ('btc', 'Sync'), ('btc', 'Mint')])
+
+        swaps = indexer.pair_events('tau', 'eth', event='Swap', since_block=3)
+        self.assertEqual(len(swaps), 1)
+        self.assertEqual(swaps[0]['data']['token_out'], 1)
+        self.assertEqual(swaps[0]['sender'], self.wallet_address)
+
+    def test_2_resumes_from_database(self):
+        path = os.path.join(tempfile.mkdtemp(), 'events.db')
+
+        self.add_liquidity('eth', 5, 10)
+        indexer = EventIndexer(self.client, path=path)
+        indexer.sync(block_num=1)
+        indexer.close()
+
+        self.add_liquidity('eth', 5, 10)
+        indexer = EventIndexer(self.client, path=path)
+        self.assertEqual(indexer.sync(block_num=2), 2)
+        self.assertEqual([e['log_index'] for e in indexer.pair_events('tau', 'eth')], [0, 1, 2, 3])
+        indexer.close()
@@ -0,0 +1,96 @@
+from unittest import TestCase
+from contracting.client import ContractingClient
+
+from contracting_driver import worker_driver
+from offchain.instrumentation import Instrumentation, key_prefix
+
+class InstrumentationSpecs(TestCase):
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.client = ContractingClient(driver=worker_driver())
+        self.client.flush()
+
+        self.wallet_address = 'wallet_address'
+
+        with open('../currency.py') as f:
+            code = f.read()
+            self.client.submit(code, 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': self.wallet_address,
+                'vk_amount': 10000
+            })
+
+        with open('../basetoken.py') as f:
+            code = f.read()
+            self.client.submit(code, name='eth', constructor_args={
+                's_name': 'eth',
+                's_symbol': 'ETH',
+                'vk': self.wallet_address,
+                'vk_amount': 10000
+            })
+
+        with open('../dex.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex', constructor_args={
+                'fee_to_setter_address': 'fee_to_setter_address'
+            })
+
+        with open('../dex_pairs.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex_pairs', constructor_args={
+                'owner_address': 'dex'
+            })
+
+        self.client.signer = self.wallet_address
+        self.tau = self.client.get_contract('tau')
+        self.eth = self.client.get_contract('eth')
+        self.dex = self.client.get_contract('dex')
+        self.dex_pairs = self.client.get_contract('dex_pairs')
+
+        self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth')
+        self.tau.transfer(amount=5, to='dex_pairs')
+        self.eth.transfer(amount=10, to='dex_pairs')
+        self.dex_pairs.mint_liquidity(dex_contract='dex', tau_contract='tau', token_contract='eth', to_address=self.wallet_address)
+
+    def test_1_key_prefix(self):
+        self.assertEqual(key_prefix('dex_pairs.pairs:tau:eth:lp_token_balance:wallet'), 'dex_pairs.pairs:tau:eth:lp_token_balance')
+        self.assertEqual(key_prefix('dex_pairs.pairs:tau:eth', depth=2), 'dex_pairs.pairs:tau')
+        self.assertEqual(key_prefix('dex.fee_to'), 'dex.fee_to')
+
+    def test_2_counts_per_entry_point(self):
+        with Instrumentation(self.client) as counters:
+            self.tau.transfer(amount=1, to='dex_pairs')
+            self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=1, to_address='trader')
+
+        swap = counters.entries['dex_pairs.swap']
+        self.assertEqual(swap['calls'], 1)
+        self.assertEqual(counters.entries['tau.transfer']['calls'], 1)
+        self.assertEqual(counters.entries['tau.transfer']['foreign_calls'], 0)
+
+        # token transfer + one balance_of per token
+        self.assertEqual(swap['foreign_calls'], 3)
+        self.assertEqual(swap['imports'], 2)
+        self.assertGreater(swap['reads'], 0)
+        self.assertGreater(swap['write_bytes'], swap['writes'])
+
+        self.assertEqual(counters.prefixes['dex_pairs.pairs:tau:eth']['writes'], 1)
+        self.assertIn('dex_pairs.swap', counters.summary())
+
+    def test_2_deposit_ledger_reads_each_balance_once(self):
+        self.tau.approve(amount=1, to='dex_pairs')
+        with Instrumentation(self.client) as counters:
+            self.dex_pairs.deposit(tau_contract='tau', token_contract='eth', contract='tau', amount=1)
+            self.dex_pairs.swap(tau_contract='tau', token_contract='eth', tau_out=0, token_out=1, to_address='trader')
+
+        # token transfer + one balance_of per token, the deposit itself is read from the ledger
+        self.assertEqual(counters.entries['dex_pairs.swap']['foreign_calls'], 3)
+
+    def test_3_uninstall(self):
+        counters = Instrumentation(self.client).install()
+        counters.uninstall()
+
+        self.tau.transfer(amount=1, to='dex_pairs')
+        self.assertEqual(len(counters.entries), 0)
+        self.assertNotIn('get', vars(self.client.raw_driver))
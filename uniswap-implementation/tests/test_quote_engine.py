@@ -0,0 +1,160 @@
+import os
+from unittest import TestCase
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+from contracting_driver import worker_driver
+from offchain import quote_engine
+from proof_of_concept import dex as proof_of_concept_dex
+
+STARTING_BALANCE = 100000
+
+# The off-chain quote engine has to match the contracts bit-for-bit
+class QuoteEngineSpecs(TestCase):
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.client = ContractingClient(driver=worker_driver())
+        self.client.flush()
+
+        self.wallet_address = 'wallet_address'
+        self.tokens = ['eth', 'btc', 'dai']
+
+        with open('../currency.py') as f:
+            code = f.read()
+            self.client.submit(code, 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': self.wallet_address,
+                'vk_amount': STARTING_BALANCE
+            })
+
+        with open('../basetoken.py') as f:
+            code = f.read()
+            for name in self.tokens:
+                self.client.submit(code, name=name, constructor_args={
+                    's_name': name,
+                    's_symbol': name.upper(),
+                    'vk': self.wallet_address,
+                    'vk_amount': STARTING_BALANCE
+                })
+
+        with open('../dex.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex', constructor_args={
+                'fee_to_setter_address': 'fee_to_setter_address'
+            })
+
+        with open('../dex_pairs.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex_pairs', constructor_args={
+                'owner_address': 'dex'
+            })
+
+        with open('../router.py') as f:
+            code = f.read()
+            self.client.submit(code, 'router')
+
+        self.client.signer = self.wallet_address
+        self.tau = self.client.get_contract('tau')
+        self.dex = self.client.get_contract('dex')
+        self.dex_pairs = self.client.get_contract('dex_pairs')
+        self.router = self.client.get_contract('router')
+
+        liquidity = [(100, 200), (ContractingDecimal('33.3'), 7), (5000, ContractingDecimal('0.123456789'))]
+        for name, (tau_amount, token_amount) in zip(self.tokens, liquidity):
+            self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract=name)
+
+            self.tau.transfer(amount=tau_amount, to='dex_pairs')
+            self.client.get_contract(name).transfer(amount=token_amount, to='dex_pairs')
+            self.dex_pairs.mint_liquidity(dex_contract='dex', tau_contract='tau', token_contract=name, to_address=self.wallet_address)
+
+        self.pairs = [('tau', name) for name in self.tokens]
+        self.amounts = [1, ContractingDecimal('0.5'), ContractingDecimal('0.000001'), 3.75]
+
+    def test_1_amounts_out_match_router(self):
+        snapshot = quote_engine.load_snapshot(self.dex_pairs, self.pairs)
+
+        for tau_in in [True, False]:
+            reserve_in, reserve_out = snapshot.oriented(tau_in)
+            grid = quote_engine.get_amounts_out(reserve_in, reserve_out, self.amounts)
+
+            for i, (tau_contract, token_contract) in enumerate(self.pairs):
+                path = [tau_contract, token_contract] if tau_in else [token_contract, tau_contract]
+                for j, amount in enumerate(self.amounts):
+                    expected = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=amount, path=path)[-1]
+                    self.assertEqual(str(grid[i, j]), str(expected))
+
+    def test_2_amounts_in_match_router(self):
+        snapshot = quote_engine.load_snapshot(self.dex_pairs, self.pairs)
+        reserve_in, reserve_out = snapshot.oriented(tau_in=True)
+        amounts_out = [ContractingDecimal('0.01'), ContractingDecimal('0.1')]
+
+        grid = quote_engine.get_amounts_in(reserve_in, reserve_out, amounts_out)
+
+        for i, (tau_contract, token_contract) in enumerate(self.pairs):
+            for j, amount in enumerate(amounts_out):
+                expected = self.router.get_amounts_in(dex_pairs='dex_pairs', amount_out=amount, path=[tau_contract, token_contract])[0]
+                self.assertEqual(str(grid[i, j]), str(expected))
+
+    def test_3_quote_grid(self):
+        snapshot = quote_engine.load_snapshot(self.dex_pairs, self.pairs)
+
+        exact = quote_engine.quote_grid(snapshot, self.amounts)
+        approximate = quote_engine.quote_grid(snapshot, self.amounts, exact=False)
+
+        for key in ['amount_out', 'price_impact', 'slippage', 'amount_out_without_fee']:
+            self.assertEqual(exact[key].shape, (len(self.pairs), len(self.amounts)))
+            for value, estimate in zip(exact[key].ravel(), approximate[key].ravel()):
+                self.assertAlmostEqual(float(value), estimate, places=9)
+
+        # Bigger trades always move the price more
+        impact = exact['price_impact']
+        self.assertTrue(all(impact[i, 0] > impact[i, 1] > impact[i, 2] > 0 for i in range(len(self.pairs))))
+
+    def test_4_list_pairs(self):
+        self.assertEqual(quote_engine.list_pairs(self.dex_pairs, page_size=2), self.pairs)
+
+    def test_5_trade_details_many_match_proof_of_concept(self):
+        # the proof of concept dex imports 'currency' - the lamden currency it was written against
+        with open(os.path.join(os.path.dirname(__file__), '..', '..', 'lamden-version', 'currency.c.py')) as f:
+            self.client.submit(f.read(), 'currency', signer='sys')
+        self.client.submit(proof_of_concept_dex, 'poc_dex')
+        poc_dex = self.client.get_contract('poc_dex')
+
+        # reserves as update() stores them, read back through get_reserves like a UI would
+        for reserves in [(10, 10), (ContractingDecimal('33.3'), 7), (5000, ContractingDecimal('0.123456789'))]:
+            for field, value in zip(['tau_reserve', 'token_reserve'], reserves):
+                self.client.raw_driver.set_var('poc_dex', 'pairs', ['eth', field], value=value)
+            tau_reserve, token_reserve = poc_dex.get_reserves(token_contract='eth')
+
+            amounts = [[amount, 0] for amount in self.amounts] + [[0, amount] for amount in self.amounts]
+            details = poc_dex.get_trade_details_many(token_contract='eth', amounts=amounts)
+            expected = quote_engine.trade_details_many(tau_reserve, token_reserve, amounts)
+
+            self.assertEqual(len(details), len(amounts))
+            for (tau_in, token_in), batched, offchain in zip(amounts, details, expected):
+                single = poc_dex.get_trade_details(token_contract='eth', tau_in=tau_in, token_in=token_in)
+                self.assertEqual([str(v) for v in batched], [str(v) for v in single])
+                self.assertEqual([str(v) for v in batched], [str(v) for v in offchain])
+
+        with self.assertRaisesRegex(AssertionError, 'At most 100 amounts'):
+            poc_dex.get_trade_details_many(token_contract='eth', amounts=[[1, 0]] * 101)
+
+    def test_6_trade_details_shapes(self):
+        snapshot = quote_engine.load_snapshot(self.dex_pairs, self.pairs)
+        _, sizes, _, _ = quote_engine.trade_details(snapshot, tau_in=self.amounts)
+
+        # A scalar is one size for every pair, a 2-D grid has one row of sizes per pair
+        tau_out, token_out, _, _ = quote_engine.trade_details(snapshot, tau_in=ContractingDecimal('0.5'))
+        self.assertEqual(token_out.shape, (len(self.pairs), 1))
+        self.assertEqual(tau_out.shape, (len(self.pairs), 1))
+        self.assertEqual(list(token_out[:, 0]), list(sizes[:, 1]))
+
+        _, grid, _, _ = quote_engine.trade_details(snapshot, tau_in=[self.amounts] * len(self.pairs))
+        self.assertEqual(grid.tolist(), sizes.tolist())
+
+        with self.assertRaisesRegex(AssertionError, 'Amounts must be'):
+            quote_engine.trade_details(snapshot, token_in=[self.amounts] * (len(self.pairs) + 1))
+        with self.assertRaisesRegex(AssertionError, 'Amounts must be'):
+            quote_engine.trade_details(snapshot, token_in=[[self.amounts]])
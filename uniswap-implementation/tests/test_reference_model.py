@@ -0,0 +1,175 @@
+import importlib.util
+import random
+from unittest import TestCase
+from contracting.client import ContractingClient
+
+from contracting_driver import worker_driver
+from offchain import reference_model
+from offchain.reference_model import PairModel, MarketModel
+from snapshot import StateSnapshot
+
+OPERATIONS = 60
+ACCOUNTS = ['alice', 'bob', 'carol']
+
+# Differential tests - random workloads run on the contracts and on the reference model must agree exactly
+class ReferenceModelSpecs(TestCase):
+
+    # deploy once for the whole class, every test starts from this snapshot
+    @classmethod
+    def setUpClass(cls):
+        cls.client = ContractingClient(driver=worker_driver())
+        cls.client.flush()
+
+        cls.wallet_address = 'wallet_address'
+
+        with open('../currency.py') as f:
+            code = f.read()
+            cls.client.submit(code, 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': cls.wallet_address,
+                'vk_amount': pow(10, 12)
+            })
+
+        with open('../basetoken.py') as f:
+            code = f.read()
+            cls.client.submit(code, name='eth', constructor_args={
+                's_name': 'eth',
+                's_symbol': 'ETH',
+                'vk': cls.wallet_address,
+                'vk_amount': pow(10, 12)
+            })
+
+        with open('../dex.py') as f:
+            code = f.read()
+            cls.client.submit(code, 'dex', constructor_args={
+                'fee_to_setter_address': 'fee_to_setter_address'
+            })
+
+        with open('../dex_pairs.py') as f:
+            code = f.read()
+            cls.client.submit(code, 'dex_pairs', constructor_args={
+                'owner_address': 'dex'
+            })
+
+        cls.client.signer = cls.wallet_address
+        cls.client.get_contract('dex').create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth')
+
+        cls.snapshot = StateSnapshot(cls.client.raw_driver)
+
+    def setUp(self):
+        self.snapshot.restore()
+        self.client.signer = self.wallet_address
+
+        self.tau = self.client.get_contract('tau')
+        self.eth = self.client.get_contract('eth')
+        self.dex = self.client.get_contract('dex')
+        self.dex_pairs = self.client.get_contract('dex_pairs')
+
+    def call(self, transaction):
+        kind = transaction[0]
+        pair = {'tau_contract': 'tau', 'token_contract': 'eth'}
+
+        if kind == 'deposit':
+            if transaction[1]:
+                self.tau.transfer(amount=transaction[1], to='dex_pairs')
+            if transaction[2]:
+                self.eth.transfer(amount=transaction[2], to='dex_pairs')
+        elif kind == 'transfer':
+            self.dex_pairs.transfer(amount=transaction[2], to='dex_pairs', signer=transaction[1], **pair)
+        elif kind == 'mint':
+            return self.dex_pairs.mint_liquidity(dex_contract='dex', to_address=transaction[1], **pair)
+        elif kind == 'burn':
+            return self.dex_pairs.burn_liquidity(dex_contract='dex', to_address=transaction[1], **pair)
+        else:
+            self.dex_pairs.swap(tau_out=transaction[1], token_out=transaction[2], to_address='trader', **pair)
+
+    # Failed transactions don't roll back in the test client, so each one runs against a snapshot
+    def call_or_revert(self, transaction):
+        before = StateSnapshot(self.client.raw_driver)
+        try:
+            return self.call(transaction)
+        except (AssertionError, TypeError) as e:
+            before.restore()
+            return e
+
+    def assert_same_state(self, model, accounts):
+        state = self.dex_pairs.get_pair_state(tau_contract='tau', token_contract='eth')
+        self.assertEqual(state['tau_reserve'], model.tau_reserve)
+        self.assertEqual(state['token_reserve'], model.token_reserve)
+        self.assertEqual(state['lp_token_supply'], model.lp_token_supply)
+        self.assertEqual(state['kLast'], model.k_last)
+
+        for account in accounts:
+            self.assertEqual(
+                self.dex_pairs.balance_of(tau_contract='tau', token_contract='eth', account=account),
+                model.lp_token_balance(account)
+            )
+
+        self.assertEqual(self.tau.balance_of(account='dex_pairs'), model.tau_balance)
+        self.assertEqual(self.eth.balance_of(account='dex_pairs'), model.token_balance)
+
+    def run_workload(self, model, seed):
+        accounts = ACCOUNTS + ['0', 'dex_pairs', model.fee_to]
+        failed = 0
+
+        for operation in reference_model.random_operations(random.Random(seed), OPERATIONS, accounts=ACCOUNTS):
+            for transaction in reference_model.transactions(model, operation):
+                try:
+                    expected = reference_model.execute(model, transaction)
+                except AssertionError as e:
+                    expected = e
+
+                actual = self.call_or_revert(transaction)
+
+                self.assertEqual(isinstance(expected, Exception), isinstance(actual, Exception), transaction)
+                if isinstance(expected, Exception):
+                    failed += 1
+                    break
+                if transaction[0] in ['mint', 'burn']:
+                    self.assertEqual(list(actual), list(expected))
+
+            self.assert_same_state(model, accounts)
+
+        # The workload has to reach every branch, including failures
+        self.assertGreater(model.lp_token_supply, 0)
+        self.assertGreater(failed, 0)
+
+    def test_1_dex_pairs(self):
+        self.run_workload(PairModel(), seed=1)
+
+    def test_2_dex_pairs_fee_on(self):
+        self.dex.set_fee_to(account='fee_to_address', signer='fee_to_setter_address')
+        model = PairModel(fee_to='fee_to_address')
+
+        self.run_workload(model, seed=2)
+        self.assertGreater(model.lp_token_balance('fee_to_address'), 0)
+
+    def test_3_lamden_dex_buy_sell(self):
+        spec = importlib.util.spec_from_file_location('lamden_dex', '../../lamden-version/test_refactor.py')
+        lamden_dex = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(lamden_dex)
+
+        with open('../../lamden-version/currency.c.py') as f:
+            contract = f.read()
+            self.client.submit(contract, 'currency', signer='sys')
+            self.client.submit(contract, 'con_token1', signer='sys')
+        self.client.submit(lamden_dex.dex, 'dex_lamden', signer='sys')
+
+        dex = self.client.get_contract('dex_lamden')
+        self.client.get_contract('currency').approve(amount=pow(10, 6), to='dex_lamden', signer='sys')
+        self.client.get_contract('con_token1').approve(amount=pow(10, 6), to='dex_lamden', signer='sys')
+        dex.create_market(contract='con_token1', currency_amount=1000, token_amount=500, signer='sys')
+
+        model = MarketModel(1000, 500)
+        rng = random.Random(3)
+        for _ in range(OPERATIONS):
+            amount = round(rng.lognormvariate(0, 2), 6) + 0.000001
+            if rng.random() < 0.5:
+                self.assertEqual(dex.buy(contract='con_token1', currency_amount=amount, signer='sys'), None)
+                model.buy(amount)
+            else:
+                dex.sell(contract='con_token1', token_amount=amount, signer='sys')
+                model.sell(amount)
+
+            self.assertEqual(dex.reserves['con_token1'], [model.currency_reserve, model.token_reserve])
@@ -0,0 +1,191 @@
+from unittest import TestCase
+from contracting.client import ContractingClient
+from contracting.stdlib.bridge.decimal import ContractingDecimal
+
+from contracting_driver import worker_driver
+from offchain.instrumentation import Instrumentation
+
+STARTING_BALANCE = 10000
+
+# Multi-hop routing: eth => tau => btc across two pairs in one transaction
+class RouterSpecs(TestCase):
+
+    def get_amount_out(self, amount_in, reserve_in, reserve_out):
+        amount_in_with_fee = ContractingDecimal(amount_in) * 997
+        return (amount_in_with_fee * reserve_out) / ((ContractingDecimal(reserve_in) * 1000) + amount_in_with_fee)
+
+    # before each test, setup the conditions
+    def setUp(self):
+        self.client = ContractingClient(driver=worker_driver())
+        self.client.flush()
+
+        self.fee_to_setter_address = 'fee_to_setter_address'
+        self.wallet_address = 'wallet_address'
+
+        with open('../currency.py') as f:
+            code = f.read()
+            self.client.submit(code, 'tau', constructor_args={
+                's_name': 'tau',
+                's_symbol': 'TAU',
+                'vk': self.wallet_address,
+                'vk_amount': STARTING_BALANCE
+            })
+
+        with open('../basetoken.py') as f:
+            code = f.read()
+            for name in ['eth', 'btc']:
+                self.client.submit(code, name=name, constructor_args={
+                    's_name': name,
+                    's_symbol': name.upper(),
+                    'vk': self.wallet_address,
+                    'vk_amount': STARTING_BALANCE
+                })
+
+        with open('../dex.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex', constructor_args={
+                'fee_to_setter_address': self.fee_to_setter_address
+            })
+
+        with open('../dex_pairs.py') as f:
+            code = f.read()
+            self.client.submit(code, 'dex_pairs', constructor_args={
+                'owner_address': 'dex'
+            })
+
+        with open('../router.py') as f:
+            code = f.read()
+            self.client.submit(code, 'router')
+
+        self.change_signer(self.wallet_address)
+
+        self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract='eth')
+        self.dex.create_pair(dex_pairs='dex_pairs', tau_contract='tau', token_contract='btc')
+
+        self.add_liquidity(self.eth, 100, 200)
+        self.add_liquidity(self.btc, 100, 50)
+
+        # The router pulls the input of the first hop from the caller
+        self.eth.approve(amount=1000, to='router')
+        self.btc.approve(amount=1000, to='router')
+
+    def change_signer(self, name):
+        self.client.signer = name
+
+        self.tau = self.client.get_contract('tau')
+        self.eth = self.client.get_contract('eth')
+        self.btc = self.client.get_contract('btc')
+        self.dex = self.client.get_contract('dex')
+        self.dex_pairs = self.client.get_contract('dex_pairs')
+        self.router = self.client.get_contract('router')
+
+    def add_liquidity(self, token, tau_amount, token_amount):
+        self.tau.transfer(amount=tau_amount, to=self.dex_pairs.name)
+        token.transfer(amount=token_amount, to=self.dex_pairs.name)
+
+        self.dex_pairs.mint_liquidity(
+            dex_contract=self.dex.name,
+            tau_contract=self.tau.name,
+            token_contract=token.name,
+            to_address=self.wallet_address
+        )
+
+    def test_1_get_amounts_out(self):
+        amounts = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=10, path=['eth', 'tau', 'btc'])
+
+        tau_out = self.get_amount_out(10, 200, 100)
+        btc_out = self.get_amount_out(tau_out, 100, 50)
+        self.assertEqual(amounts, [10, tau_out, btc_out])
+
+    def test_2_get_amounts_in(self):
+        amounts_out = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=10, path=['eth', 'tau', 'btc'])
+        amounts_in = self.router.get_amounts_in(dex_pairs='dex_pairs', amount_out=amounts_out[-1], path=['eth', 'tau', 'btc'])
+
+        self.assertEqual(len(amounts_in), 3)
+        self.assertAlmostEqual(amounts_in[0], 10, places=20)
+
+    def test_3_swap_exact_in(self):
+        amounts = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=10, path=['eth', 'tau', 'btc'])
+
+        self.router.swap_exact_in(
+            dex_pairs='dex_pairs',
+            amount_in=10,
+            amount_out_min=amounts[-1],
+            path=['eth', 'tau', 'btc'],
+            to_address='test_results_wallet'
+        )
+
+        self.assertEqual(self.btc.balance_of(account='test_results_wallet'), amounts[-1])
+        self.assertEqual(self.eth.balance_of(account=self.wallet_address), STARTING_BALANCE - 200 - 10)
+        # Nothing is left behind on the router
+        self.assertEqual(self.tau.balance_of(account='router'), 0)
+
+        tau_reserve, eth_reserve = self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='eth')
+        self.assertEqual(tau_reserve, 100 - amounts[1])
+        self.assertEqual(eth_reserve, 200 + 10)
+
+        tau_reserve, btc_reserve = self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='btc')
+        self.assertEqual(tau_reserve, 100 + amounts[1])
+        # Stored values are truncated to 30 decimal places
+        self.assertAlmostEqual(btc_reserve, 50 - amounts[2], places=29)
+
+    def test_4_swap_exact_in_min_output(self):
+        amounts = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=10, path=['eth', 'tau', 'btc'])
+
+        with self.assertRaises(AssertionError):
+            self.router.swap_exact_in(
+                dex_pairs='dex_pairs',
+                amount_in=10,
+                amount_out_min=amounts[-1] + 1,
+                path=['eth', 'tau', 'btc'],
+                to_address='test_results_wallet'
+            )
+
+    def test_5_swap_exact_out(self):
+        self.router.swap_exact_out(
+            dex_pairs='dex_pairs',
+            amount_out=5,
+            amount_in_max=100,
+            path=['btc', 'tau', 'eth'],
+            to_address='test_results_wallet'
+        )
+
+        self.assertEqual(self.eth.balance_of(account='test_results_wallet'), 5)
+
+    def test_6_intermediate_output_stays_in_dex_pairs(self):
+        amounts = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=10, path=['eth', 'tau', 'btc'])
+
+        with Instrumentation(self.client) as counters:
+            self.router.swap_exact_in(
+                dex_pairs='dex_pairs',
+                amount_in=10,
+                amount_out_min=amounts[-1],
+                path=['eth', 'tau', 'btc'],
+                to_address='test_results_wallet'
+            )
+
+        # The tau out of eth/tau is credited to tau/btc's ledger, no tau balance moves at all
+        self.assertEqual(counters.prefixes['tau.balances:dex_pairs']['writes'], 0)
+        self.assertEqual(counters.prefixes['tau.balances:router']['writes'], 0)
+        self.assertEqual(self.tau.balance_of(account='dex_pairs'), 200)
+        self.assertEqual(self.btc.balance_of(account='test_results_wallet'), amounts[-1])
+
+    def test_7_swap_with_pending_deposit(self):
+        # A deposit waiting on the second pair is taken as extra input, it can't block the route
+        self.tau.approve(amount=1, to='dex_pairs')
+        self.dex_pairs.deposit(tau_contract='tau', token_contract='btc', contract='tau', amount=ContractingDecimal('0.000001'))
+
+        amounts = self.router.get_amounts_out(dex_pairs='dex_pairs', amount_in=10, path=['eth', 'tau', 'btc'])
+        self.router.swap_exact_in(
+            dex_pairs='dex_pairs',
+            amount_in=10,
+            amount_out_min=amounts[-1],
+            path=['eth', 'tau', 'btc'],
+            to_address='test_results_wallet'
+        )
+
+        self.assertEqual(self.btc.balance_of(account='test_results_wallet'), amounts[-1])
+        self.assertEqual(self.dex_pairs.deposit_of(tau_contract='tau', token_contract='btc', contract='tau'), 0)
+
+        tau_reserve, _ = self.dex_pairs.get_pair_reserves(tau_contract='tau', token_contract='btc')
+        self.assertEqual(tau_reserve, 100 + amounts[1] + ContractingDecimal('0.000001'))